@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+
+'''
+    Reports how many rows per second DB_Calls.add_top_deals writes when
+    filling an empty list and when refreshing a full one, where a tenth of
+    the games have dropped off the list, a tenth are new and a fifth have a
+    new price.
+
+    Run it from the root of the repository:
+        python benchmarks/db_write.py [--sizes 100 10000 100000]
+'''
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from src.platforms.shared import create_game_dictionary  # noqa
+from src.utils.db_calls import DB_Calls  # noqa
+from src.utils.db_enums import DB_Tables  # noqa
+from src.utils.db_migrations import DB_Migrations  # noqa
+
+
+def make_games(first_gid, count, price_offset=0.0):
+    """Make game dictionaries like the ones the platforms parse.
+
+    :param first_gid:    the id of the first game
+    :type first_gid:     int
+    :param count:        the number of games to make
+    :type count:         int
+    :param price_offset: added to the sale price of every game, defaults
+                         to 0.0
+    :type price_offset:  float, optional
+    :return:             the games
+    :rtype:              list
+    """
+    return [create_game_dictionary(
+        f"Game number {gid}", 59.99, round(gid % 50 + price_offset, 2),
+        f"https://example.com/{gid}.jpg", str(gid),
+        f"https://example.com/game/{gid}") for gid in range(
+            first_gid, first_gid+count)]
+
+
+def timed_write(con, cur, games):
+    """Write the games as the top PC deals and commit.
+
+    :param con:   database connection
+    :type con:    Connection
+    :param cur:   database cursor
+    :type cur:    cursor
+    :param games: the games to write
+    :type games:  list
+    :return:      the number of seconds the write took
+    :rtype:       float
+    """
+    start = time.perf_counter()
+    DB_Calls.add_top_deals(cur, DB_Tables.TOP_PC.value, games)
+    con.commit()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[100, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'games':>8} {'fill rows/s':>14} {'refresh rows/s':>16}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            con = sqlite3.connect(os.path.join(directory, "games.db"))
+            cur = con.cursor()
+            DB_Migrations.migrate(cur)
+            fill = timed_write(con, cur, make_games(0, size))
+            # Drop the first tenth, add a new tenth and reprice a fifth
+            tenth = max(size // 10, 1)
+            refreshed = make_games(tenth, size - tenth)
+            for game in refreshed[::5]:
+                game["sale_price"] += 1
+            refreshed += make_games(size, tenth)
+            refresh = timed_write(con, cur, refreshed)
+            con.close()
+        print(f"{size:>8} {size/fill:>14.0f} "
+              f"{len(refreshed)/refresh:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
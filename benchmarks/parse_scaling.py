@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+'''
+    Parses the saved psdeals.net top deals pages on the parse pool, first on
+    threads and then in 1 to N processes, checking every run produces the
+    same games and reporting pages parsed per second and the speed-up over
+    one process. The pages are handed to the pool all at once, as a refresh
+    of many pages and regions would once they arrive.
+
+    Run it from the root of the repository:
+        python benchmarks/parse_scaling.py [--pages N] [--processes N]
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from src.platforms.ps import PS  # noqa
+from ps_parser import read_fixture, TOP_DEALS_PAGES  # noqa
+
+
+def parse_pages(pages):
+    """Parse every page on the parse pool as it's set up.
+
+    :param pages: the top deals pages
+    :type pages:  list
+    :return:      the games on every page and the seconds it took
+    :rtype:       list, float
+    """
+    start = time.perf_counter()
+    parsing = [PS._parse(PS._parse_top_deals, page) for page in pages]
+    games = [game for future in parsing for game in future.result()]
+    return games, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=48,
+                        help="the number of pages to parse in each run")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="the most processes to parse in")
+    args = parser.parse_args()
+
+    saved = [read_fixture(name) for name in TOP_DEALS_PAGES]
+    pages = [saved[page % len(saved)] for page in range(args.pages)]
+
+    expected = None
+    single = None
+    failed = False
+    print(f"{os.cpu_count()} cores, {len(pages)} pages")
+    for processes in range(args.processes + 1):
+        PS.set_parse_processes(processes)
+        # Start the pool's workers before timing
+        parse_pages(saved)
+        games, elapsed = parse_pages(pages)
+        if(expected is None):
+            expected = games
+        elif(not games == expected):
+            print(f"{processes} processes: output differs from threads")
+            failed = True
+            continue
+        if(processes == 0):
+            print(f"{'threads':12} {len(pages)/elapsed:10.1f} pages/s")
+            continue
+        single = single or elapsed
+        print(f"{f'{processes} processes':12} {len(pages)/elapsed:10.1f} "
+              f"pages/s {single/elapsed:6.2f}x")
+    PS.set_parse_processes(0)
+    return 1 if(failed) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+
+'''
+    Checks that every installed HTML parser backend produces exactly the same
+    games as the original full html.parser tree for the saved psdeals.net
+    pages, then reports how many cards each backend parses per second.
+
+    Run it from the root of the repository:
+        python benchmarks/ps_parser.py [--iterations N]
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from src.platforms.html_parser import HTML_Parser, Parser_Backends  # noqa
+from src.platforms.ps import PS  # noqa
+
+# The psdeals.net pages are synthetic, written to the markup the parsers
+# expect rather than recorded from the site, so they can't catch changes to
+# the real pages
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "fixtures")
+TOP_DEALS_PAGES = ["psdeals_top_rated_sale_1.html",
+                   "psdeals_top_rated_sale_2.html"]
+GAME_PAGE = "psdeals_game.html"
+GAME_URL = "https://psdeals.net/us-store/game/2345678/marvels-spider-man"
+
+
+def read_fixture(name):
+    """Read a saved page.
+
+    :param name: the file name of the page
+    :type name:  str
+    :return:     the page
+    :rtype:      str
+    """
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def parse_all(pages, game_page):
+    """Parse every saved page with the backend in use.
+
+    :param pages:     the top deals pages
+    :type pages:      list
+    :param game_page: the game page
+    :type game_page:  str
+    :return:          the games from the top deals pages and the game page
+    :rtype:           list, dict
+    """
+    games = []
+    for page in pages:
+        games += PS._parse_top_deals(page)
+    return games, PS._parse_your_deals(game_page, GAME_URL)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = [read_fixture(name) for name in TOP_DEALS_PAGES]
+    game_page = read_fixture(GAME_PAGE)
+
+    HTML_Parser.set_backend(Parser_Backends.FULL)
+    expected = parse_all(pages, game_page)
+
+    failed = False
+    for backend in HTML_Parser.available_backends():
+        HTML_Parser.set_backend(backend)
+        if(not parse_all(pages, game_page) == expected):
+            print(f"{backend.value:12} output differs from full parse")
+            failed = True
+            continue
+        cards = 0
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            for page in pages:
+                cards += len(PS._parse_top_deals(page))
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            PS._parse_your_deals(game_page, GAME_URL)
+        game_elapsed = time.perf_counter() - start
+        print(f"{backend.value:12} {cards/elapsed:10.0f} cards/s "
+              f"{args.iterations/game_elapsed:8.1f} game pages/s")
+    return 1 if(failed) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
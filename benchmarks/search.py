@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+'''
+    Fills the title index with the titles of the saved psdeals.net pages,
+    made up titles from their words and a few real ones, then checks that
+    misspelt searches still find the real titles and reports searches per
+    second.
+
+    Run it from the root of the repository:
+        python benchmarks/search.py [--titles N]
+'''
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from src.platforms.ps import PS  # noqa
+from src.platforms.shared import create_game_dictionary  # noqa
+from src.utils.db_calls import DB_Calls  # noqa
+from src.utils.db_enums import DB_Platforms, DB_Search_Indices  # noqa
+from src.utils.db_enums import DB_Tables  # noqa
+from src.utils.db_migrations import DB_Migrations  # noqa
+from ps_parser import read_fixture, TOP_DEALS_PAGES  # noqa
+
+# Searches as they're typed, with typos, and the title each should find
+MISSPELT = [
+    ("spidr man", "Marvel's Spider-Man"),
+    ("spider man miles moralez", "Marvel's Spider-Man: Miles Morales"),
+    ("hollw knigt", "Hollow Knight"),
+    ("shadw of the tomb raidr", "Shadow of the Tomb Raider"),
+    ("ghost of tsushma", "Ghost of Tsushima"),
+    ("horizn zero dawn", "Horizon Zero Dawn"),
+]
+# The most results before the title a search should find
+TOP = 3
+
+
+def make_titles(count):
+    """Make titles like the ones in the lists: the saved pages' titles, the
+       titles the misspelt searches are for, then made up ones from the
+       words of the saved titles.
+
+    :param count: the number of titles to make
+    :type count:  int
+    :return:      the titles
+    :rtype:       list
+    """
+    saved = [game["title"] for name in TOP_DEALS_PAGES
+             for game in PS._parse_top_deals(read_fixture(name))]
+    words = [word for title in saved for word in title.split()]
+    titles = list(dict.fromkeys(saved + [title for _, title in MISSPELT]))
+    rand = random.Random(0)
+    while(len(titles) < count):
+        titles.append(" ".join(rand.choice(words)
+                               for _ in range(rand.randint(2, 5))))
+    return titles
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--titles", type=int, default=10000,
+                        help="the number of titles to index")
+    args = parser.parse_args()
+
+    con = sqlite3.connect(":memory:")
+    cur = con.cursor()
+    DB_Migrations.migrate(cur)
+    DB_Calls.add_top_deals(cur, DB_Tables.TOP_PS.value, [
+        create_game_dictionary(
+            title, 59.99, 19.99, None, str(gid),
+            f"https://psdeals.net/us-store/game/{gid}/", "us")
+        for gid, title in enumerate(make_titles(args.titles))])
+    con.commit()
+
+    failed = False
+    start = time.perf_counter()
+    for query, expected in MISSPELT:
+        found = [game[DB_Search_Indices.TITLE.value] for game in
+                 DB_Calls.search_titles(cur, query, DB_Platforms.PS.value)]
+        if(expected not in found[:TOP]):
+            print(f"{query!r} did not find {expected!r}, found {found[:TOP]}")
+            failed = True
+    elapsed = time.perf_counter() - start
+    print(f"{args.titles} titles, {len(MISSPELT)/elapsed:.1f} searches/s")
+    return 1 if(failed) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
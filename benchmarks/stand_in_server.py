@@ -0,0 +1,352 @@
+#!/usr/bin/python3
+
+'''
+    A local stand-in for cheapshark.com and psdeals.net, for load testing a
+    refresh without touching the real sites. It answers the requests main.py
+    makes:
+        /api/1.0/deals               generated deals, paged with pageSize and
+                                     pageNumber like the api
+        /api/1.0/games?ids=          generated wishlist games, at most 25 ids
+        /xx-store/collection/top_rated_sale
+                                     the saved psdeals.net top deals pages,
+                                     repeated to the configured depth with
+                                     each page and region's games given
+                                     their own ids, and page links that
+                                     reach a couple of pages ahead like
+                                     psdeals.net's
+        /xx-store/game/<id>/<name>   the saved psdeals.net game page
+        /thumbs/<id>.png             a generated cover for every deal and
+        /images/<id>/<name>          game, with the covers of psdeals.net
+                                     pointed here. Only a few covers are
+                                     made, so many urls share a cover
+
+    Responses carry an ETag and are answered with 304 when it's sent back,
+    so the HTTP cache is exercised too. Latency, errors, rate limiting and
+    payload sizes are configurable, and the number of responses with each
+    status is printed when the server is stopped.
+
+    Run it from the root of the repository, then point a copy of the
+    repository at it so the real database and cache are left alone:
+        python benchmarks/stand_in_server.py [--port PORT] [--deals N]
+            [--latency SECONDS] [--jitter SECONDS] [--error-rate RATE]
+            [--throttle-rate RATE] [--pad-kib KIB] [--ps-pages N]
+        python main.py -s --pc-url http://127.0.0.1:PORT \\
+            --ps-url http://127.0.0.1:PORT
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import signal
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ps_parser import read_fixture, TOP_DEALS_PAGES, GAME_PAGE  # noqa
+
+MAX_IDS = 25  # the most game ids the games api accepts at once
+MAX_PAGE_SIZE = 60  # the most deals the deals api returns per page
+GAME_TITLE = "Marvel&#39;s Spider-Man: Game of the Year Edition"
+GAME_PATH = re.compile(r"^/..-store/game/(\d+)/")
+COLLECTION_PATH = re.compile(r"^/(..)-store/collection/top_rated_sale$")
+SAVED_GAME_URL = re.compile(r"/us-store/game/(\d+)/")
+PAGINATION = re.compile(r'<ul class="pagination">.*?</ul>', re.DOTALL)
+PAGE_LINKS_AHEAD = 2  # how many pages ahead the page links reach
+COVER_PATH = re.compile(r"^/(thumbs|images)/")
+PS_COVERS = "https://cdn.psdeals.net"
+COVERS = 16  # the number of different covers served
+COVER_SIZE = 240  # the width and height of the covers, in pixels
+
+
+def make_deal(gid, base):
+    """Generate the same deal for a game id every time.
+
+    :param gid:  the game id
+    :type gid:   int
+    :param base: the scheme and host of the server, for the cover's url
+    :type base:  str
+    :return:     the deal, as the deals api returns it
+    :rtype:      dict
+    """
+    rand = random.Random(gid)
+    normal_price = rand.choice([9.99, 19.99, 29.99, 39.99, 59.99])
+    sale_price = round(normal_price * rand.uniform(0.1, 0.9), 2)
+    return {"title": f"Stand-in Game {gid}",
+            "dealID": hashlib.sha1(str(gid).encode()).hexdigest(),
+            "gameID": str(gid),
+            "salePrice": f"{sale_price:.2f}",
+            "normalPrice": f"{normal_price:.2f}",
+            "thumb": f"{base}/thumbs/{gid}.png"}
+
+
+def make_cover(path):
+    """Generate the cover for a url, one of a few solid colour PNGs.
+
+    :param path: the path of the cover's url
+    :type path:  str
+    :return:     the cover
+    :rtype:      bytes
+    """
+    colour = zlib.crc32(path.encode()) % COVERS * 16
+    row = b"\0" + bytes((colour, 255 - colour, 128)) * COVER_SIZE
+
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data +
+                struct.pack(">I", zlib.crc32(kind + data)))
+    return (b"\x89PNG\r\n\x1a\n" +
+            chunk(b"IHDR", struct.pack(">IIBBBBB", COVER_SIZE, COVER_SIZE,
+                                       8, 2, 0, 0, 0)) +
+            chunk(b"IDAT", zlib.compress(row * COVER_SIZE)) +
+            chunk(b"IEND", b""))
+
+
+def collection_page(pages, region, number, depth):
+    """Make a page of a region's top deals from the saved pages. Each page
+       and region's games have their own ids, as they do on psdeals.net.
+
+    :param pages:  the saved pages, from the us store
+    :type pages:   list
+    :param region: the region of the store
+    :type region:  str
+    :param number: the page number, starting at 1
+    :type number:  int
+    :param depth:  the number of pages in the collection
+    :type depth:   int
+    :return:       the page
+    :rtype:        str
+    """
+    cycle, saved = divmod(number - 1, len(pages))
+    offset = cycle * 1000000
+    if(not region == "us"):
+        offset += int.from_bytes(region.encode(), "big") * 100000000
+    page = SAVED_GAME_URL.sub(
+        lambda match: f"/{region}-store/game/{int(match.group(1)) + offset}/",
+        pages[saved])
+    links = "".join(
+        f'<li><a href="/{region}-store/collection/top_rated_sale?'
+        f'platforms=ps4&amp;page={link}">{link}</a></li>'
+        for link in range(1, min(number + PAGE_LINKS_AHEAD, depth) + 1))
+    return PAGINATION.sub(f'<ul class="pagination">{links}</ul>', page)
+
+
+def make_game(gid, base):
+    """Generate the same wishlist game for a game id every time.
+
+    :param gid:  the game id
+    :type gid:   int
+    :param base: the scheme and host of the server, for the cover's url
+    :type base:  str
+    :return:     the game, as the games api returns it
+    :rtype:      dict
+    """
+    deal = make_deal(gid, base)
+    return {"info": {"title": deal["title"], "thumb": deal["thumb"]},
+            "deals": [{"dealID": deal["dealID"],
+                       "price": deal["salePrice"],
+                       "retailPrice": deal["normalPrice"]}]}
+
+
+class Stand_In_Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive like the sites
+
+    def do_GET(self):
+        """Answer a request, after the configured latency, with an error, a
+           429 or the stand-in response.
+        """
+        options = self.server.options
+        time.sleep(options.latency + random.uniform(0, options.jitter))
+        if(random.random() < options.error_rate):
+            return self._send(500, b"", "text/plain")
+        if(random.random() < options.throttle_rate):
+            return self._send(429, b"", "text/plain", {"Retry-After": "1"})
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        game = GAME_PATH.match(url.path)
+        collection = COLLECTION_PATH.match(url.path)
+        if(url.path == "/api/1.0/deals"):
+            self._send_deals(query)
+        elif(url.path == "/api/1.0/games"):
+            self._send_games(query)
+        elif(collection):
+            page = int(query.get("page", ["1"])[0])
+            if(not 1 <= page <= options.ps_pages):
+                return self._send(404, b"", "text/plain")
+            self._send_page(collection_page(
+                self.server.top_deals_pages, collection.group(1), page,
+                options.ps_pages))
+        elif(game):
+            self._send_page(self.server.game_page.replace(
+                GAME_TITLE, f"Stand-in Game {game.group(1)}"))
+        elif(COVER_PATH.match(url.path)):
+            self._send(200, make_cover(url.path), "image/png")
+        else:
+            self._send(404, b"", "text/plain")
+
+    def log_message(self, *_):
+        """Keep quiet, the counts are printed when the server stops."""
+
+    def _send_deals(self, query):
+        """Send a page of the generated deals.
+
+        :param query: the query of the request
+        :type query:  dict
+        """
+        options = self.server.options
+        page_size = min(int(query.get("pageSize", [MAX_PAGE_SIZE])[0]),
+                        MAX_PAGE_SIZE)
+        page = int(query.get("pageNumber", ["0"])[0])
+        page_count = -(-options.deals // page_size)
+        start = page * page_size
+        deals = [make_deal(gid, self.server.base) for gid in range(
+            start, min(start + page_size, options.deals))]
+        self._send_json(deals, {"X-Total-Page-Count": str(page_count)})
+
+    def _send_games(self, query):
+        """Send the generated wishlist games for the requested ids.
+
+        :param query: the query of the request
+        :type query:  dict
+        """
+        ids = [id_ for id_ in query.get("ids", [""])[0].split(",") if(id_)]
+        if(not ids or len(ids) > MAX_IDS):
+            return self._send(400, b"", "text/plain")
+        self._send_json({id_: make_game(int(id_), self.server.base)
+                         for id_ in ids})
+
+    def _send_json(self, data, headers=None):
+        """Send data as json, padded to the configured size.
+
+        :param data:    the data to send
+        :type data:     list or dict
+        :param headers: extra headers, defaults to None
+        :type headers:  dict, optional
+        """
+        body = json.dumps(data)
+        padding = self.server.padding
+        if(padding):
+            # Pad with whitespace, which every json parser skips
+            body += " " * padding
+        self._send(200, body.encode(), "application/json", headers)
+
+    def _send_page(self, page):
+        """Send a html page, with its covers pointed here, padded to the
+           configured size.
+
+        :param page: the page to send
+        :type page:  str
+        """
+        page = page.replace(PS_COVERS, self.server.base)
+        padding = self.server.padding
+        if(padding):
+            page += f"<!--{'x' * padding}-->"
+        self._send(200, page.encode(), "text/html; charset=utf-8")
+
+    def _send(self, status, body, content_type, headers=None):
+        """Send a response, or 304 if the client has the same body cached.
+
+        :param status:       the status of the response
+        :type status:        int
+        :param body:         the body of the response
+        :type body:          bytes
+        :param content_type: the content type of the body
+        :type content_type:  str
+        :param headers:      extra headers, defaults to None
+        :type headers:       dict, optional
+        """
+        headers = dict(headers or {})
+        if(status == 200):
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            headers["ETag"] = etag
+            if(self.headers.get("If-None-Match") == etag):
+                status = 304
+                body = b""
+        self.server.count(status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Stand_In_Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, options):
+        """Load the saved pages and start listening.
+
+        :param options: the command line options
+        :type options:  Namespace
+        """
+        super().__init__(("127.0.0.1", options.port), Stand_In_Handler)
+        self.options = options
+        self.base = f"http://127.0.0.1:{options.port}"
+        self.padding = options.pad_kib * 1024
+        self.top_deals_pages = [read_fixture(name)
+                                for name in TOP_DEALS_PAGES]
+        self.game_page = read_fixture(GAME_PAGE)
+        self.statuses = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, status):
+        """Count a response.
+
+        :param status: the status of the response
+        :type status:  int
+        """
+        with self._lock:
+            self.statuses[status] += 1
+
+
+def stop(*_):
+    """Stop serving, as Ctrl+C does."""
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8642)
+    parser.add_argument("--deals", type=int, default=600,
+                        help="the number of top PC deals")
+    parser.add_argument("--ps-pages", type=int, default=2,
+                        help="the number of pages of top Playstation deals")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds to wait before every response")
+    parser.add_argument("--jitter", type=float, default=0,
+                        help="up to this many more seconds of latency")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="the fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0,
+                        help="the fraction of requests answered with 429")
+    parser.add_argument("--pad-kib", type=int, default=0,
+                        help="pad every response with this many KiB")
+    args = parser.parse_args()
+
+    server = Stand_In_Server(args)
+    # Background jobs ignore Ctrl+C, so stop the same way when killed
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Serving on http://127.0.0.1:{args.port}, Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    for status, count in sorted(server.statuses.items()):
+        print(f"{status}: {count}")
+
+
+if __name__ == "__main__":
+    main()
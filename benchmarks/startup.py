@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+
+'''
+    Reports the start-up cost of each way main.py is run: the wall time to
+    start the interpreter and import everything the path needs, and the
+    import time reported by python -X importtime. The rofi only path must not
+    load the HTTP and scraping stacks, so the script exits with 1 if it does.
+
+    The -r, -s and default paths are measured by importing main.py, which
+    doesn't run it, along with the modules main.py imports lazily for that
+    path. --polybar is measured by running it, since it only reads the
+    database.
+
+    Run it from the root of the repository:
+        python benchmarks/startup.py [--runs N]
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules main.py imports for each path
+PATHS = {
+    "--polybar": None,
+    "-r": ["main", "src.utils.rofi"],
+    "-s": ["main", "rich.console", "src.utils.refresh"],
+    "default": ["main", "rich.console", "src.utils.refresh",
+                "src.utils.rofi"],
+}
+HEAVY_MODULES = ["requests", "bs4", "rich"]
+# The paths that must not load any of HEAVY_MODULES
+LIGHT_PATHS = ["--polybar", "-r"]
+
+
+def command(path):
+    """Build the command that starts the path.
+
+    :param path: the path to start
+    :type path:  str
+    :return:     the command to run
+    :rtype:      list
+    """
+    if(PATHS[path] is None):
+        return [sys.executable, "-X", "importtime",
+                os.path.join(ROOT, "main.py"), path]
+    code = "; ".join(f"import {module}" for module in PATHS[path])
+    return [sys.executable, "-X", "importtime", "-c", code]
+
+
+def measure(path):
+    """Start the path once.
+
+    :param path: the path to start
+    :type path:  str
+    :return:     the wall time and import time in seconds, and the heavy
+                 modules that were imported
+    :rtype:      float, float, list
+    """
+    start = time.perf_counter()
+    result = subprocess.run(command(path), cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    wall = time.perf_counter() - start
+    import_time = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        if(not line.startswith("import time:") or "self [us]" in line):
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        import_time += int(self_time)
+        imported.add(name.strip())
+    return (wall, import_time / 1e6,
+            [module for module in HEAVY_MODULES if(module in imported)])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'path':10} {'wall ms':>8} {'import ms':>10}  heavy modules")
+    for path in PATHS:
+        runs = [measure(path) for _ in range(args.runs)]
+        wall = statistics.median(run[0] for run in runs)
+        import_time = statistics.median(run[1] for run in runs)
+        heavy = runs[0][2]
+        print(f"{path:10} {wall*1000:8.1f} {import_time*1000:10.1f}  " +
+              (", ".join(heavy) or "none"))
+        if(path in LIGHT_PATHS and heavy):
+            failed = True
+    return 1 if(failed) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
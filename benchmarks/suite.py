@@ -0,0 +1,238 @@
+#!/usr/bin/python3
+
+'''
+    Runs every stage of a refresh against the saved pages and api responses
+    in benchmarks/fixtures, fully offline: parsing psdeals.net pages and
+    CheapShark responses, writing lists to the database and rendering the
+    rofi menus. For each stage it reports the throughput and the peak memory
+    allocated by one run, and compares them with the baseline in
+    benchmarks/baseline.json.
+
+    The baseline is only meaningful on the machine it was saved on, so save
+    one before making changes and compare against it afterwards.
+
+    Run it from the root of the repository:
+        python benchmarks/suite.py [--iterations N] [--save-baseline]
+                                   [--stages STAGE [STAGE ...]]
+'''
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from db_write import make_games  # noqa
+from ps_parser import (read_fixture, TOP_DEALS_PAGES, GAME_PAGE,  # noqa
+                       GAME_URL)
+from src.platforms.pc import PC  # noqa
+from src.platforms.ps import PS  # noqa
+from src.utils.db_calls import DB_Calls  # noqa
+from src.utils.db_enums import DB_Tables  # noqa
+from src.utils.db_migrations import DB_Migrations  # noqa
+from src.utils.menu import Menu  # noqa
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "baseline.json")
+DB_GAMES = 10000  # the number of games in the database stages
+
+
+def new_database(games=None, table=DB_Tables.TOP_PC.value):
+    """Create an in memory database at the current schema.
+
+    :param games: games to fill the list with, defaults to None
+    :type games:  list, optional
+    :param table: the list to fill, defaults to the top PC deals
+    :type table:  str, optional
+    :return:      the cursor of the database
+    :rtype:       cursor
+    """
+    cur = sqlite3.connect(":memory:").cursor()
+    DB_Migrations.migrate(cur)
+    if(games):
+        DB_Calls.add_top_deals(cur, table, games)
+    return cur
+
+
+def ps_top_deals(pages):
+    """Make DB_GAMES top Playstation deals from the games parsed from the
+       saved pages, each repeat of a game with its own id and url.
+
+    :param pages: the saved top deals pages
+    :type pages:  list
+    :return:      the games
+    :rtype:       list
+    """
+    parsed = [game for page in pages for game in PS._parse_top_deals(page)]
+    games = []
+    for gid in range(DB_GAMES):
+        game = dict(parsed[gid % len(parsed)])
+        game["gid"] = str(gid)
+        game["url"] = (f"https://psdeals.net/{game['region']}-store/game/"
+                       f"{gid}/")
+        games.append(game)
+    return games
+
+
+def refreshed_games():
+    """Make the next refresh of the DB_GAMES games: a tenth have dropped off
+       the list, a tenth are new and a fifth have a new price.
+
+    :return: the refreshed games
+    :rtype:  list
+    """
+    tenth = DB_GAMES // 10
+    games = make_games(tenth, DB_GAMES - tenth)
+    for game in games[::5]:
+        game["sale_price"] += 1
+    return games + make_games(DB_GAMES, tenth)
+
+
+def stages():
+    """Build the stages. Each stage is a unit name, a function preparing the
+       input of one run, which isn't timed, and a function doing one run
+       with that input and returning the number of units it processed.
+
+    :return: the stages, keyed by name
+    :rtype:  dict
+    """
+    pages = [read_fixture(name) for name in TOP_DEALS_PAGES]
+    game_page = read_fixture(GAME_PAGE)
+    deals = json.loads(read_fixture("cheapshark_deals.json"))
+    wishlist = json.loads(read_fixture("cheapshark_games.json"))
+    games = make_games(0, DB_GAMES)
+    refreshed = refreshed_games()
+    rows = DB_Calls.get_data(new_database(games), DB_Tables.TOP_PC.value)
+    ps_rows = DB_Calls.get_data(
+        new_database(ps_top_deals(pages), DB_Tables.TOP_PS.value),
+        DB_Tables.TOP_PS.value)
+
+    def parse_top_deals(pages):
+        return sum(len(PS._parse_top_deals(page)) for page in pages)
+
+    def parse_game_page(page):
+        PS._parse_your_deals(page, GAME_URL)
+        return 1
+
+    def parse_deals(deals):
+        PC._parse_data(deals)
+        return len(deals)
+
+    def parse_wishlist(wishlist):
+        return len(PC._parse_wishlist_deals(wishlist))
+
+    def write(games):
+        def run(cur):
+            DB_Calls.add_top_deals(cur, DB_Tables.TOP_PC.value, games)
+            return len(games)
+        return run
+
+    def render(table, rows):
+        longest_title = max(len(game[0]) for game in rows)
+
+        def run(rows):
+            Menu.render(table, rows, longest_title)
+            return len(rows)
+        return run
+
+    return {
+        "ps_top_deals": ("cards", lambda: pages, parse_top_deals),
+        "ps_game_page": ("pages", lambda: game_page, parse_game_page),
+        "pc_deals": ("deals", lambda: deals, parse_deals),
+        "pc_wishlist": ("games", lambda: wishlist, parse_wishlist),
+        "db_fill": ("rows", new_database, write(games)),
+        "db_refresh": ("rows", lambda: new_database(games),
+                       write(refreshed)),
+        "db_unchanged": ("rows", lambda: new_database(games), write(games)),
+        "menu_pc": ("rows", lambda: rows,
+                    render(DB_Tables.TOP_PC.value, rows)),
+        "menu_ps": ("rows", lambda: ps_rows,
+                    render(DB_Tables.TOP_PS.value, ps_rows)),
+    }
+
+
+def measure(prepare, run, iterations):
+    """Time a stage, then measure the memory one run of it allocates.
+
+    :param prepare:    prepares the input of one run
+    :type prepare:     function
+    :param run:        does one run, returning the units processed
+    :type run:         function
+    :param iterations: the number of timed runs
+    :type iterations:  int
+    :return:           the units processed per second and the peak KiB
+                       allocated by one run
+    :rtype:            float, float
+    """
+    units = 0
+    elapsed = 0
+    for _ in range(iterations):
+        data = prepare()
+        start = time.perf_counter()
+        units += run(data)
+        elapsed += time.perf_counter() - start
+    data = prepare()
+    tracemalloc.start()
+    run(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return units / elapsed, peak / 1024
+
+
+def change(current, baseline):
+    """Describe how a result compares with its baseline.
+
+    :param current:  the result of this run
+    :type current:   float
+    :param baseline: the saved result, or None
+    :type baseline:  float or None
+    :return:         the percentage change, or an empty string without a
+                     baseline
+    :rtype:          str
+    """
+    if(not baseline):
+        return ""
+    return f"{(current - baseline) / baseline * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--stages", nargs="+")
+    args = parser.parse_args()
+
+    baseline = {}
+    if(os.path.exists(BASELINE)):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    results = {}
+    print(f"{'stage':14} {'per second':>16} {'change':>8} "
+          f"{'peak KiB':>10} {'change':>8}")
+    for name, (unit, prepare, run) in stages().items():
+        if(args.stages and name not in args.stages):
+            continue
+        per_second, peak = measure(prepare, run, args.iterations)
+        results[name] = {"per_second": round(per_second, 1),
+                         "peak_kib": round(peak, 1)}
+        saved = baseline.get(name, {})
+        print(f"{name:14} {per_second:10.0f} {unit:5} "
+              f"{change(per_second, saved.get('per_second')):>8} "
+              f"{peak:10.0f} {change(peak, saved.get('peak_kib')):>8}")
+
+    if(args.save_baseline):
+        baseline.update(results)
+        with open(BASELINE, "w") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+            f.write("\n")
+        print(f"Saved the baseline to {BASELINE}")
+
+
+if __name__ == "__main__":
+    main()
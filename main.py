@@ -15,17 +15,84 @@
         psdeals.net website.
 '''
 
-import sqlite3
 import os
-import argparse
-from datetime import timedelta
-from rich.console import Console
+import sqlite3
+import sys
+
+
+def print_summary(database):
+    """Print the one line wishlist summary for polybar. Importing anything
+       more than sqlite3 would make the bar noticeably slower, so this runs
+       before the rest of the program is loaded.
+
+    :param database: the path to the database
+    :type database:  str
+    """
+    try:
+        con = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+        row = con.execute("""SELECT wishlist_games, on_sale, best_discount,
+                          new_lows FROM summary""").fetchone()
+        con.close()
+    except sqlite3.Error:
+        row = None
+    if(row):
+        print(f"{row[1]}/{row[0]} on sale, up to {row[2]}% off, " +
+              f"{row[3]} new lows")
+    else:
+        print()
+
+
+if(__name__ == "__main__" and "--polybar" in sys.argv[1:]):
+    print_summary(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "games.db"))
+    sys.exit()
+
+# Only what every run needs is imported here. rich and src.utils.refresh,
+# which loads requests and bs4, are imported when an update runs, and
+# src.utils.rofi when a rofi window opens
+import argparse  # noqa: E402
+from datetime import timedelta  # noqa: E402
+
+from src.utils.db_calls import DB_Calls  # noqa: E402
+from src.utils.db_migrations import DB_Migrations  # noqa: E402
+from src.utils.daemon import Daemon  # noqa: E402
+
+# The amount of time that must pass before updating the database
+CUSTOM_UPDATE_DELAY = timedelta(seconds=0, minutes=0, hours=12, days=0)
+
+
+def positive_float(value):
+    """Read an argument that must be a number above 0.
+
+    :param value: the argument as given
+    :type value:  str
+    :return:      the number
+    :rtype:       float
+    """
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a number")
+    if(not number > 0):
+        raise argparse.ArgumentTypeError(f"{value} is not above 0")
+    return number
 
-from src.platforms.pc import PC
-from src.platforms.ps import PS
-from src.utils.db_enums import DB_Tables
-from src.utils.db_calls import DB_Calls
-from src.utils.rofi import launch_rofi
+
+def at_least_one(value):
+    """Read an argument that must be a whole number of 1 or more.
+
+    :param value: the argument as given
+    :type value:  str
+    :return:      the number
+    :rtype:       int
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a whole number")
+    if(number < 1):
+        raise argparse.ArgumentTypeError(f"{value} is less than 1")
+    return number
 
 
 def check_args():
@@ -44,6 +111,20 @@ def check_args():
         "-s", "--silent", help="update games if necessary, use this argument\
             if you don't want a rofi window to open", action="store_true")
     # ----------------------------------------------------------------------- #
+    parser.add_argument(
+        "-l", "--lows", help="print the number of wishlist games at a new\
+            all-time low, for use in a polybar module", action="store_true")
+    # ----------------------------------------------------------------------- #
+    parser.add_argument(
+        "-d", "--daemon", help="keep running, refreshing the deals in the\
+            background and serving them to later runs over a local socket",
+                        action="store_true")
+    # ----------------------------------------------------------------------- #
+    parser.add_argument(
+        "--polybar", help="print a one line summary of the wishlists for a\
+            polybar module, without checking for updates",
+                        action="store_true")
+    # ----------------------------------------------------------------------- #
     # parser.add_argument(
     #     "-p", "--ps-plus", help="include this option to show prices and\
     #         deals available for Playstation Plus subscribers",
@@ -52,6 +133,69 @@ def check_args():
     parser.add_argument("--pc-max", help="the maximum price for PC deals\
         default=15", type=int, default=15)
     # ----------------------------------------------------------------------- #
+    parser.add_argument("--pc-pages", help="the most pages of top PC deals\
+        to fetch, each page holds up to 60 deals, default=1", type=int,
+                        default=1)
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--pc-sort", help="the order the top PC deals are\
+        fetched in, default=Deal Rating", choices=[
+            "Deal Rating", "Title", "Savings", "Price", "Metacritic",
+            "Reviews", "Release", "Store", "Recent"])
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--pc-stores", help="only fetch top PC deals from\
+        these store ids, see https://www.cheapshark.com/api/1.0/stores",
+                        type=int, action="extend", nargs="+")
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--ps-rate", help="the number of requests per second\
+        allowed to https://psdeals.net/, default=0.2",
+                        type=positive_float, default=0.2)
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--ps-burst", help="the number of requests that can\
+        be made to https://psdeals.net/ back to back, default=2",
+                        type=at_least_one, default=2)
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--ps-regions", help="the Playstation stores to\
+        fetch the top deals of, by their region in psdeals.net urls such as\
+            us or gb, default=us", action="extend", nargs="+")
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--ps-pages", help="the most pages of top\
+        Playstation deals to fetch from each region, fewer are fetched if\
+            the collection is shorter, default=2", type=int, default=2)
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--ps-platforms", help="only fetch top Playstation\
+        deals for these consoles, such as ps4 or ps5, default=ps4",
+                        action="extend", nargs="+")
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--ps-parse-processes", help="the number of\
+        processes to parse Playstation pages in, so parsing many pages can\
+            use more than one core, default=0 parses them in this process",
+                        type=int, default=0)
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--icons", help="download the cover of every game\
+        into a local cache after each update and show them as icons in\
+            rofi", action="store_true")
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--pc-url", help="fetch PC deals from this server\
+        instead of https://www.cheapshark.com, such as the stand-in server in\
+            benchmarks")
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--ps-url", help="fetch Playstation deals from this\
+        server instead of https://psdeals.net, such as the stand-in server in\
+            benchmarks")
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--metrics-json", help="where to write the metrics\
+        of each refresh as JSON, default=cache/metrics.json",
+                        default=os.path.join("cache", "metrics.json"))
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--metrics-textfile", help="where to write the\
+        metrics of each refresh for the Prometheus node exporter's textfile\
+            collector, default=cache/metrics.prom",
+                        default=os.path.join("cache", "metrics.prom"))
+    # ----------------------------------------------------------------------- #
+    parser.add_argument("--wishlist-budget", help="the most requests to\
+        spend refreshing each platform's wishlist in one run, on the games\
+            most likely to have changed price, default=no limit", type=int)
+    # ----------------------------------------------------------------------- #
     parser.add_argument("--ps", help="url of game from https://psdeals.net/.\
         Just search for the game you want to add, copy the url, and paste it,\
             along with all other urls", action="extend", nargs="+")
@@ -64,138 +208,91 @@ def check_args():
     return parser.parse_args()
 
 
-def update_wishlist_games(cur, table, wishlist_args, update_delay):
-    """A function to update wishlist games.
-
-    :param cur:           database cursor object
-    :type cur:            Cursor
-    :param table:         name of table to work on
-    :type table:          str
-    :param wishlist_args: list of wishlist games to add to database
-    :type wishlist_args:  list
-    :param update_delay:  the amount of time that must pass before updating
-    :type update_delay:   timedelta
-    """
-
-    # Figure out which games need updating
-    outdated_games = DB_Calls.wishlist_needs_updating(cur, table, update_delay)
-    # Fetch deals for new and existing wishlist games
-    if(wishlist_args or outdated_games):
-        if(table == DB_Tables.PC_WISHLIST.value):
-            _table = DB_Tables.PC_WISHLIST.value
-            games_to_update, new_games = (
-                PC.get_wishlist_deals(cur, outdated_games+wishlist_args))
-        elif(table == DB_Tables.PS_WISHLIST.value):
-            _table = DB_Tables.PS_WISHLIST.value
-            games_to_update, new_games = (
-                PS.get_wishlist_deals(cur, outdated_games+wishlist_args))
-        if(new_games):
-            DB_Calls.add_games(cur, _table, new_games, games_to_update)
-            return True
-    return False
-
-
-def update_top_games(cur, table, cls, update_delay, upper_price=None):
-    """A function to update the top game deals.
-
-    :param cur:          database cursor object
-    :type cur:           Cursor
-    :param table:        name of table to work on
-    :type table:         str
-    :param cls:          the class to get top games for
-    :type cls:           the platform class to get deals for
-    :param update_delay: the amount of time that needs to pass
-                         before fetching new data
-    :type update_delay:  timedelta
-    :param upper_price:  the upper price limit for pc deals, defaults to None
-    :type upper_price:   float, optional
-    """
-    if(DB_Calls.needs_updating(cur, table, update_delay)):
-        old_top = DB_Calls.get_data(cur, table)
-        new_top = cls.get_top_deals(upper_price)
-        if(new_top):
-            DB_Calls.add_top_deals(cur, table, old_top, new_top)
-            return True
-    return False
-
-
 if __name__ == "__main__":
-    # The amount of time that must pass before updating the database
-    CUSTOM_UPDATE_DELAY = timedelta(seconds=0, minutes=0, hours=12, days=0)
-
     # Move to the current directory
     os.chdir(os.path.dirname(__file__))
-
-    # Create a cursor and connection for the database interactions
-    con = sqlite3.connect(f'{os.getcwd()}/games.db')
-    cur = con.cursor()
+    database = f'{os.getcwd()}/games.db'
 
     # Check for any arguments
     args = check_args()
+    args.pc = args.pc or []
+    args.ps = args.ps or []
 
-    # Remove any arguments that are already in the database. If they need
-    # updating they will be found later
-    if(args.pc):
-        for index, id_ in enumerate(args.pc):
-            if(DB_Calls.game_exists(
-               cur, DB_Tables.PC_WISHLIST.value, id_=id_)):
-                del args.pc[index]
-    else:
-        args.pc = []
-    if(args.ps):
-        for index, url in enumerate(args.ps):
-            if(DB_Calls.game_exists(
-               cur, DB_Tables.PS_WISHLIST.value, url=url)):
-                del args.ps[index]
+    if(args.daemon):
+        from rich.console import Console
+        from src.utils.refresh import configure_platforms, refresh_games
+        # Bring an existing database up to the current schema, or create it
+        con = sqlite3.connect(database)
+        DB_Migrations.migrate(con.cursor())
+        con.commit()
+        con.close()
+        configure_platforms(args.ps_rate, args.ps_burst, args.pc_pages,
+                            args.pc_sort, args.pc_stores, args.pc_url,
+                            args.ps_url, args.metrics_json,
+                            args.metrics_textfile, args.ps_regions,
+                            args.ps_pages, args.ps_platforms,
+                            args.ps_parse_processes, args.icons)
+        console = Console()
+        # Games given with --pc or --ps are added in the first refresh
+        Daemon.serve(database,
+                     lambda cur, pc_ids, ps_urls: refresh_games(
+                         cur, pc_ids, ps_urls, CUSTOM_UPDATE_DELAY,
+                         args.pc_max, console.log, args.wishlist_budget),
+                     pc_ids=args.pc, ps_urls=args.ps)
+        raise SystemExit
+
+    # Let a running daemon do the work, it answers with the title lengths
+    # and new lows once it has refreshed the lists
+    if(args.rofi):
+        snapshot = Daemon.request({"command": "snapshot"})
     else:
-        args.ps = []
+        snapshot = Daemon.request(
+            {"command": "refresh", "pc": args.pc, "ps": args.ps})
+
+    con = None
+    if(snapshot is None):
+        # Without a daemon this run reads and updates the database itself,
+        # bringing it up to the current schema, or creating it, first
+        con = sqlite3.connect(database)
+        cur = con.cursor()
+        DB_Migrations.migrate(cur)
+        con.commit()
 
     # If we did not pass the -r option then check for updates
-    if(not args.rofi):
+    if(snapshot is None and not args.rofi):
+        from rich.console import Console
+        from src.utils.refresh import configure_platforms, refresh_games
+        configure_platforms(args.ps_rate, args.ps_burst, args.pc_pages,
+                            args.pc_sort, args.pc_stores, args.pc_url,
+                            args.ps_url, args.metrics_json,
+                            args.metrics_textfile, args.ps_regions,
+                            args.ps_pages, args.ps_platforms,
+                            args.ps_parse_processes, args.icons)
         console = Console()
         console.print()
         with console.status("[bold green]Fetching deals...") as status:
-            # update the top games
-            if(update_top_games(cur, DB_Tables.TOP_PC.value, PC,
-                                CUSTOM_UPDATE_DELAY, args.pc_max)):
-                console.log("Fetched top PC deals")
-            if(update_top_games(cur, DB_Tables.TOP_PS.value, PS,
-                                CUSTOM_UPDATE_DELAY)):
-                console.log("Fetched top Playstation deals")
-            # update wishlist games
-            if(update_wishlist_games(cur, DB_Tables.PC_WISHLIST.value, args.pc,
-                                     CUSTOM_UPDATE_DELAY)):
-                console.log("Fetched PC wishlist deals")
-            if(update_wishlist_games(cur, DB_Tables.PS_WISHLIST.value, args.ps,
-                                     CUSTOM_UPDATE_DELAY)):
-                console.log("Fetched Playstation wishlist deals")
-
-    # Gather all games into dictionary for convenience
-    games = {
-        DB_Tables.TOP_PC.value: DB_Calls.get_data(
-                                    cur, DB_Tables.TOP_PC.value),
-        DB_Tables.TOP_PS.value: DB_Calls.get_data(
-                                    cur, DB_Tables.TOP_PS.value),
-        DB_Tables.PC_WISHLIST.value: DB_Calls.get_data(
-                                        cur, DB_Tables.PC_WISHLIST.value),
-        DB_Tables.PS_WISHLIST.value: DB_Calls.get_data(
-                                        cur, DB_Tables.PS_WISHLIST.value)
-    }
-    # Gather all the longest titles
-    title_lengths = {
-        DB_Tables.TOP_PC.value: DB_Calls.get_longest_title(
-                                    cur, DB_Tables.TOP_PC.value),
-        DB_Tables.TOP_PS.value: DB_Calls.get_longest_title(
-                                    cur, DB_Tables.TOP_PS.value),
-        DB_Tables.PC_WISHLIST.value: DB_Calls.get_longest_title(
-                                        cur, DB_Tables.PC_WISHLIST.value),
-        DB_Tables.PS_WISHLIST.value: DB_Calls.get_longest_title(
-                                        cur, DB_Tables.PS_WISHLIST.value)
-    }
+            refresh_games(cur, args.pc, args.ps, CUSTOM_UPDATE_DELAY,
+                          args.pc_max, console.log, args.wishlist_budget)
+        con.commit()
+
+    if(snapshot is None):
+        snapshot = DB_Calls.get_snapshot(cur)
+
+    if(args.lows):
+        print(f"{snapshot['new_lows']} new lows")
 
     # Rofi window logic loop
     if(args.rofi or not args.silent):
-        launch_rofi(cur, games, title_lengths)
+        from src.utils.rofi import launch_rofi
+        if(con is None):
+            # The menus are read from the database, which the daemon has
+            # already migrated
+            con = sqlite3.connect(database)
+            cur = con.cursor()
+        launch_rofi(cur, snapshot["title_lengths"])
+        con.commit()
+        # The daemon's snapshot has the new lows of any games deleted
+        Daemon.request({"command": "reload"})
 
-    con.commit()
-    con.close()
+    if(con is not None):
+        con.close()
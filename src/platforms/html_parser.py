@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+
+'''
+  The pluggable HTML parsing backend for scraped pages. Rather than building
+  the whole document, only the subtrees holding the data we need are built,
+  using the C accelerated lxml parser when it's installed and Python's
+  html.parser otherwise. The FULL backend is the original behaviour of
+  parsing the entire page with html.parser.
+
+  bs4 is only imported once a page is parsed, so importing the platforms
+  doesn't load it.
+'''
+
+from enum import Enum
+
+
+class Parser_Backends(Enum):
+    LXML = "lxml"
+    HTML_PARSER = "html.parser"
+    FULL = "full"
+
+
+class HTML_Parser:
+    _backend = None  # chosen on first use if not set
+
+    @staticmethod
+    def available_backends():
+        """Get the backends that can be used with the installed packages,
+           fastest first.
+
+        :return: the usable backends
+        :rtype:  list
+        """
+        from bs4.builder import builder_registry
+        return [backend for backend in Parser_Backends
+                if(backend == Parser_Backends.FULL or
+                   builder_registry.lookup(backend.value))]
+
+    @staticmethod
+    def get_backend():
+        """Get the backend in use, defaulting to the fastest one available.
+
+        :return: the backend in use
+        :rtype:  Parser_Backends
+        """
+        if(HTML_Parser._backend is None):
+            HTML_Parser._backend = HTML_Parser.available_backends()[0]
+        return HTML_Parser._backend
+
+    @staticmethod
+    def set_backend(backend):
+        """Choose the backend to parse pages with.
+
+        :param backend: the backend to use
+        :type backend:  Parser_Backends
+        """
+        if(backend not in HTML_Parser.available_backends()):
+            raise ValueError(f"{backend.value} parser is not installed")
+        HTML_Parser._backend = backend
+
+    @staticmethod
+    def strainer(targets):
+        """Create a strainer that keeps the subtrees of matching tags.
+
+        :param targets: (tag name, class name) pairs to keep, a class name of
+                        None matches the tag regardless of class
+        :type targets:  list
+        :return:        the strainer to pass to parse, a function matching
+                        the tag name and attributes of the tags to keep
+        :rtype:         function
+        """
+        def matches(name, attrs):
+            # Attributes haven't been split into lists yet while parsing
+            classes = (attrs.get("class") or "").split()
+            return any(name == tag and (class_ is None or class_ in classes)
+                       for tag, class_ in targets)
+        return matches
+
+    @staticmethod
+    def parse(data, strainer):
+        """Parse the page with the backend in use.
+
+        :param data:     the page to parse
+        :type data:      str
+        :param strainer: the strainer choosing which subtrees are built,
+                         ignored by the FULL backend
+        :type strainer:  function
+        :return:         the parsed page
+        :rtype:          BeautifulSoup
+        """
+        from bs4 import BeautifulSoup, SoupStrainer
+        backend = HTML_Parser.get_backend()
+        if(backend == Parser_Backends.FULL):
+            return BeautifulSoup(data, "html.parser")
+        return BeautifulSoup(data, backend.value,
+                             parse_only=SoupStrainer(strainer))
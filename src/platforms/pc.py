@@ -6,11 +6,14 @@
 '''
 
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from enum import Enum
+from urllib.parse import urlencode
 
-from src.utils.db_calls import DB_Calls
-from src.utils.db_enums import DB_Columns, DB_Tables
-from src.platforms.shared import create_game_dictionary, make_request_
+from src.utils.db_enums import DB_Columns
+from src.utils.metrics import Metrics, Stages
+from src.platforms.shared import (create_game_dictionary, make_request_,
+                                  NOT_MODIFIED)
 
 
 class Top_Deals_Indices(Enum):
@@ -38,53 +41,170 @@ class PC:
     _TOP_DEALS_URL = f"{_BASE_URL}/api/1.0/deals?upperPrice="
     _DEAL_URL = f"{_BASE_URL}/redirect?dealID="
     _GAME_LOOKUP_URL = f"{_BASE_URL}/api/1.0/games?title="
+    _PAGE_COUNT_HEADER = "X-Total-Page-Count"
+    _PAGE_SIZE = 60  # the most deals the api returns per page
+    _MAX_PAGES = 1  # the most pages of top deals to fetch
+    _SORT_BY = None  # the api's sort order for deals, e.g. "Savings"
+    _STORE_IDS = None  # only fetch deals from these stores
+    _IDS_PER_REQUEST = 25  # the most game ids the api accepts at once
+    _WORKERS = 4  # the number of pages fetched concurrently
 
     @staticmethod
-    def get_top_deals(upper_price):
+    def get_top_deals(upper_price, revalidate=True, emit=None):
         """Makes a request to get the top deals, parses them, and returns that
            data. If an upper_price is provided no deals greater than that
            amount will be discovered.
 
         :param upper_price: the upper price limit for pc deals
         :type upper_price:  float or int
-        :return:            parsed data for adding to database, or None
-        :rtype:             list or None
+        :param revalidate:  whether an unchanged response can be reported as
+                            NOT_MODIFIED, defaults to True
+        :type revalidate:   bool, optional
+        :param emit:        called with the games once they're all parsed,
+                            as the same game can be on several pages at
+                            different prices, defaults to None meaning the
+                            games are returned
+        :type emit:         function, optional
+        :return:            parsed data for adding to database, or True once
+                            it has been emitted, NOT_MODIFIED if the deals
+                            haven't changed, or None
+        :rtype:             list or bool or str or None
         """
-        data = PC._make_request(f"{PC._TOP_DEALS_URL}{upper_price}")
-        if(data):
-            return PC._parse_data(data)
-        return None
+        first_page = make_request_(
+            PC._top_deals_url(upper_price, 0), revalidate)
+        if(not first_page):
+            return None
+        try:
+            page_count = min(int(first_page.headers.get(
+                PC._PAGE_COUNT_HEADER, 1)), PC._MAX_PAGES)
+        except ValueError:
+            page_count = 1
+
+        # Merge every page into one dictionary as it arrives, unchanged pages
+        # are set aside so they're only parsed if another page has changed
+        games = {}
+        unchanged = []
+        if(first_page.not_modified):
+            unchanged.append(first_page)
+        else:
+            PC._merge_deals(games, first_page.json())
+        with ThreadPoolExecutor(max_workers=PC._WORKERS) as executor:
+            futures = [executor.submit(
+                make_request_, PC._top_deals_url(upper_price, page),
+                revalidate) for page in range(1, page_count)]
+            for future in as_completed(futures):
+                page = future.result()
+                if(not page):
+                    return None
+                if(page.not_modified):
+                    unchanged.append(page)
+                else:
+                    PC._merge_deals(games, page.json())
+        if(len(unchanged) == page_count):
+            return NOT_MODIFIED
+        for page in unchanged:
+            PC._merge_deals(games, page.json())
+        if(emit):
+            emit(list(games.values()))
+            return True
+        return list(games.values())
 
     @staticmethod
-    def get_wishlist_deals(cur, ids):
-        """Make request for the given id string.
-
-        :param cur: the database cursor object
-        :type cur:  cursor
-        :param ids: a formatted string of ids for request
-        :type ids:  str
-        :return:    parsed data for adding to database if all goes well,
-                    or None
-        :rtype:     list or None
+    def top_deals_urls(upper_price):
+        """Get every url the top deals may be fetched from with the current
+           options, so a change of options can be noticed.
+
+        :param upper_price: the upper price limit of the deals
+        :type upper_price:  int
+        :return:            the urls of the pages
+        :rtype:             list
         """
-        id_string = ""
-        update_ids = []
-        for index, id_ in enumerate(ids):
-            if(PC.is_valid(id_)):
-                # Form the valid string of ids for fetching data from api
-                # with one request
-                if(not index == len(ids)-1):
-                    id_string += f"{id_},"
-                else:
-                    id_string += f"{id_}"
-                # If it is in the database then we will update
-                if(DB_Calls.game_exists(
-                   cur, DB_Tables.PC_WISHLIST.value, id_)):
-                    update_ids.append(id_)
-        data = PC._make_request(f"{PC._YOUR_DEALS_URL}{id_string}")
-        if(data):
-            return update_ids, PC._parse_wishlist_deals(data)
-        return None, None
+        return [PC._top_deals_url(upper_price, page)
+                for page in range(PC._MAX_PAGES)]
+
+    @staticmethod
+    def set_top_deals_options(max_pages, sort_by=None, store_ids=None):
+        """Set which top deals are fetched.
+
+        :param max_pages: the most pages of deals to fetch
+        :type max_pages:  int
+        :param sort_by:   the api's sort order, defaults to None
+        :type sort_by:    str, optional
+        :param store_ids: only fetch deals from these stores, defaults to None
+        :type store_ids:  list, optional
+        """
+        PC._MAX_PAGES = max_pages
+        PC._SORT_BY = sort_by
+        PC._STORE_IDS = store_ids
+
+    @staticmethod
+    def set_base_url(base_url):
+        """Point every request at another server with the same api, such as
+           the stand-in server in benchmarks.
+
+        :param base_url: the scheme and host of the server
+        :type base_url:  str
+        """
+        PC._BASE_URL = base_url.rstrip("/")
+        PC._YOUR_DEALS_URL = f"{PC._BASE_URL}/api/1.0/games?ids="
+        PC._TOP_DEALS_URL = f"{PC._BASE_URL}/api/1.0/deals?upperPrice="
+        PC._DEAL_URL = f"{PC._BASE_URL}/redirect?dealID="
+        PC._GAME_LOOKUP_URL = f"{PC._BASE_URL}/api/1.0/games?title="
+
+    @staticmethod
+    def get_wishlist_deals(ids, existing):
+        """Make requests for the given ids, in chunks the api accepts. This
+           doesn't touch the database, so it can run alongside the other
+           platforms.
+
+        :param ids:      a list of game ids
+        :type ids:       list
+        :param existing: the ids of the games already in the wishlist, which
+                         can come back unchanged
+        :type existing:  set
+        :return:         the games to add or update, and the ids of the
+                         games that haven't changed
+        :rtype:          list, list
+        """
+        valid_ids = list(dict.fromkeys(
+            PC.get_gid(id_) for id_ in ids if(PC.is_valid(id_))))
+        chunks = [valid_ids[i:i+PC._IDS_PER_REQUEST]
+                  for i in range(0, len(valid_ids), PC._IDS_PER_REQUEST)]
+        # Only chunks of games that are all in the database can go unchanged
+        with ThreadPoolExecutor(max_workers=PC._WORKERS) as executor:
+            results = list(executor.map(
+                lambda chunk: PC._make_request(
+                    f"{PC._YOUR_DEALS_URL}{','.join(chunk)}",
+                    existing.issuperset(chunk)), chunks))
+        games = []
+        unchanged = []
+        for chunk, data in zip(chunks, results):
+            if(data == NOT_MODIFIED):
+                unchanged += chunk
+            elif(data):
+                games += PC._parse_wishlist_deals(data)
+        return games, unchanged
+
+    @staticmethod
+    def wishlist_games_per_request():
+        """Get how many wishlist games one request fetches, the api accepts
+           several ids at once.
+
+        :return: the number of games per request
+        :rtype:  int
+        """
+        return PC._IDS_PER_REQUEST
+
+    @staticmethod
+    def get_gid(id_):
+        """Get the game id the database keeps for a wishlist id.
+
+        :param id_: the wishlist id
+        :type id_:  int or str
+        :return:    the game id
+        :rtype:     str
+        """
+        return str(id_)
 
     @staticmethod
     def is_valid(id_):
@@ -109,16 +229,41 @@ class PC:
         return f"{PC._GAME_LOOKUP_URL}{game_name}"
 
     @staticmethod
-    def _make_request(url):
+    def _top_deals_url(upper_price, page):
+        """Form the url for a page of top deals.
+
+        :param upper_price: the upper price limit for pc deals
+        :type upper_price:  float or int
+        :param page:        the page number, starting at 0
+        :type page:         int
+        :return:            the url of the page
+        :rtype:             str
+        """
+        parameters = {"pageSize": PC._PAGE_SIZE, "pageNumber": page}
+        if(PC._SORT_BY):
+            parameters["sortBy"] = PC._SORT_BY
+        if(PC._STORE_IDS):
+            parameters["storeID"] = ",".join(
+                str(id_) for id_ in PC._STORE_IDS)
+        return f"{PC._TOP_DEALS_URL}{upper_price}&{urlencode(parameters)}"
+
+    @staticmethod
+    def _make_request(url, revalidate=True):
         """Makes a request for the provided url.
 
-        :param url: url to make request for
-        :type url:  str
-        :return:    jsonified request data on successful request, or None
-        :rtype:     dict or None
+        :param url:        url to make request for
+        :type url:         str
+        :param revalidate: whether a cached response may be revalidated,
+                           defaults to True
+        :type revalidate:  bool, optional
+        :return:           jsonified request data on successful request,
+                           NOT_MODIFIED if it hasn't changed, or None
+        :rtype:            dict or str or None
         """
-        r = make_request_(url)
+        r = make_request_(url, revalidate)
         if(r):
+            if(r.not_modified):
+                return NOT_MODIFIED
             return r.json()
         return None
 
@@ -131,35 +276,39 @@ class PC:
         :return:     a list of dictionaries representing each game
         :rtype:      list
         """
-        parsed_data = []
-        titles = []
+        games = {}
+        PC._merge_deals(games, data)
+        return list(games.values())
+
+    @staticmethod
+    @Metrics.timed(Stages.PARSE, "pc")
+    def _merge_deals(games, data):
+        """Parse a page of deals into the games dictionary. Unfortunately, or
+           fortunately?, the api can have lots of duplicates, some with
+           different prices, so only the cheapest deal for each game is kept.
+
+        :param games: the games parsed so far, keyed by game id
+        :type games:  dict
+        :param data:  api data to parse
+        :type data:   list
+        """
         for game in data:
-            title = game[Top_Deals_Indices.TITLE.value]
-            full_price = float(game[Top_Deals_Indices.NORMAL_PRICE.value])
-            sale_price = float(game[Top_Deals_Indices.SALE_PRICE.value])
-            cover_image = game[Top_Deals_Indices.COVER_IMAGE.value]
-            url = f"{PC._DEAL_URL}{game[Top_Deals_Indices.DEAL_ID.value]}"
             gid = game[Top_Deals_Indices.GAME_ID.value]
-
-            # Unfortunately, or fortunately?, the api can have lots of
-            # duplicates, some with different prices, so I must do some
-            # checking to remove dupes.
-            if(title not in titles):  # Add title if it hasn't been added
-                titles.append(title)
-                parsed_data.append(create_game_dictionary(
-                    title, full_price, sale_price, cover_image, gid, url))
-            else:  # if title is already addded, check if it's cheaper
-                for existing_game in parsed_data:
-                    if((title ==
-                        existing_game[Top_Deals_Indices.TITLE.value]) and
-                        (sale_price <
-                            existing_game[DB_Columns.SALE_PRICE.value])):
-                        existing_game.update({
-                            DB_Columns.SALE_PRICE.value: sale_price,
-                            DB_Columns.URL.value: url})
-        return parsed_data
+            sale_price = float(game[Top_Deals_Indices.SALE_PRICE.value])
+            existing_game = games.get(gid)
+            if(existing_game and
+               existing_game[DB_Columns.SALE_PRICE.value] <= sale_price):
+                continue
+            games[gid] = create_game_dictionary(
+                game[Top_Deals_Indices.TITLE.value],
+                float(game[Top_Deals_Indices.NORMAL_PRICE.value]),
+                sale_price,
+                game[Top_Deals_Indices.COVER_IMAGE.value],
+                gid,
+                f"{PC._DEAL_URL}{game[Top_Deals_Indices.DEAL_ID.value]}")
 
     @staticmethod
+    @Metrics.timed(Stages.PARSE, "pc")
     def _parse_wishlist_deals(data):
         """Parse the provided data for the information we need.
 
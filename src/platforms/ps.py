@@ -5,111 +5,273 @@
   psdeals.net
 '''
 
-import time
+import multiprocessing
 import re
-from bs4 import BeautifulSoup
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlparse
 
-from src.utils.db_enums import DB_Tables
-from src.utils.db_calls import DB_Calls
-from src.platforms.shared import create_game_dictionary, make_request_
+from src.utils.http_cache import HTTP_Cache
+from src.utils.metrics import Metrics, Stages
+from src.utils.rate_limiter import Rate_Limiter
+from src.platforms.html_parser import HTML_Parser
+from src.platforms.shared import (create_game_dictionary, make_request_,
+                                  NOT_MODIFIED)
 
 
 class PS:
     _PS_DEALS_URL = "https://psdeals.net"
-    _TOP_DEALS_URL = (f"{_PS_DEALS_URL}/collection/" +
-                      "top_rated_sale?platforms=ps4&page=")
+    # The top deals of a region's store, format with the region
+    _TOP_DEALS_URL = f"{_PS_DEALS_URL}/{{}}-store/collection/top_rated_sale"
     _YOUR_DEALS_URL = f"{_PS_DEALS_URL}/game/"
     _GAME_LOOKUP_URL = f"{_PS_DEALS_URL}/search?search_query="
-    _TOP_DEALS_PAGES = 2  # this is the number of pages that contain deals
-    _SLEEP_DURATION = 5  # the number of seconds to sleep between page requests
+    _MAX_PAGES = 2  # the most pages of top deals to fetch from each region
+    _PLATFORMS = ["ps4"]  # only fetch top deals for these consoles
+    _RATE = 0.2  # the number of requests per second allowed to psdeals.net
+    _BURST = 2  # the number of requests that can be made back to back
+    _WORKERS = 4  # the number of wishlist pages fetched concurrently
+    _PARSE_WORKERS = 2  # the number of pages parsed concurrently
+    # The number of processes pages are parsed in, 0 parses them on the
+    # parse pool's threads instead
+    _PARSE_PROCESSES = 0
+    _REGIONS = ["us"]  # the stores to fetch the top deals of
+    # The symbol of the currency each region's store prices games in,
+    # regions without one here show their region code instead
+    _CURRENCIES = {
+        "us": "$", "ca": "CA$", "au": "A$", "nz": "NZ$", "gb": "£",
+        "jp": "¥", "br": "R$", "mx": "MX$", "at": "€", "be": "€",
+        "de": "€", "es": "€", "fi": "€", "fr": "€", "gr": "€", "ie": "€",
+        "it": "€", "lu": "€", "nl": "€", "pt": "€", "sk": "€", "si": "€"}
     _PS_PLUS_PRICE = "99.99"  # a default price for PS+ only deals
+    # Only these parts of the pages are parsed, the rest is skipped
+    _TOP_DEALS_STRAINER = HTML_Parser.strainer(
+        [("div", "game-collection-item-col")])
+    _YOUR_DEALS_STRAINER = HTML_Parser.strainer(
+        [("div", "game-title-info-name"),
+         ("span", "game-collection-item-regular-price"),
+         ("span", "game-collection-item-discount-price"),
+         ("source", None)])
+    _REGION = re.compile(r"/(..)-store/")
+    # The page links at the bottom of a page of top deals
+    _PAGINATION = re.compile(r'class="pagination"(.*?)</ul>', re.DOTALL)
+    _PAGE_LINK = re.compile(r"[?&;]page=(\d+)")
+    _parse_pool = None  # shared by every fetch, created on first use
+    _process_pool = None  # the parse pool's processes, if any
+    _parse_pool_lock = threading.Lock()
+
+    @staticmethod
+    def get_top_deals(_, revalidate=True, emit=None):
+        """Fetches and scrapes the top deals of every region. Each region's
+           pages are fetched in a lane of their own, all sharing the
+           psdeals.net rate limit, and handed to the shared parse pool as
+           they arrive. Each page's games are emitted as soon as they're
+           parsed, so they can be written while later pages are fetched.
+
+        :param _:          useless
+        :type _:           *
+        :param revalidate: whether unchanged pages can be reported as
+                           NOT_MODIFIED, defaults to True
+        :type revalidate:  bool, optional
+        :param emit:       called from any thread with the list of games on
+                           each page, defaults to None meaning the games are
+                           returned together
+        :type emit:        function, optional
+        :return:           the list of games, or True once every game has
+                           been emitted, NOT_MODIFIED if no page has changed,
+                           or None if a page couldn't be retrieved, though
+                           earlier pages may have been emitted
+        :rtype:            list or bool or str or None
+        """
+        games = []
+        streaming = emit is not None
+        emit = emit or games.extend
+        with ThreadPoolExecutor(max_workers=len(PS._REGIONS)) as lanes:
+            regions = list(lanes.map(
+                lambda region: PS._fetch_top_deals(region, revalidate, emit),
+                PS._REGIONS))
+        # if any page couldn't be retrieved then return none, the games on
+        # the missing pages are still deals as far as we know
+        if(None in regions):
+            return None
+
+        # Nothing more to parse if every page is the same as last time
+        if(not any(changed for changed, _ in regions)):
+            return NOT_MODIFIED
+        # Otherwise the unchanged pages that were set aside are still part
+        # of the list, they're read back from the cache one at a time
+        for url in [url for _, unchanged in regions for url in unchanged]:
+            page = HTTP_Cache.load(url)
+            if(page is None):
+                return None
+            emit(PS._parse(PS._parse_top_deals, page.text).result())
+        if(streaming):
+            return True
+        return games
+
+    @staticmethod
+    def get_wishlist_deals(urls, existing):
+        """Fetches and scrapes wishlist deals. This doesn't touch the
+           database, so it can run alongside the other platforms.
+
+        :param urls:     a list of wishlist games' urls
+        :type urls:      list
+        :param existing: the ids of the games already in the wishlist, which
+                         can come back unchanged
+        :type existing:  set
+        :return:         the games to add or update, and the ids of the
+                         games that haven't changed
+        :rtype:          list, list
+        """
+        valid_urls = [url for url in urls if(PS.is_valid(url))]
+        # We must fetch the data for every game, because every game provided
+        # needs updating. The shared rate limiter keeps the fetchers polite.
+        # Only games already in the database can go unchanged.
+        with ThreadPoolExecutor(max_workers=PS._WORKERS) as executor:
+            pages = list(executor.map(
+                lambda url: PS._fetch_your_deals(
+                    url, PS.get_gid(url) in existing), valid_urls))
+        # The pages were handed to the parse pool as they arrived
+        games = [page.result() if(page and not page == NOT_MODIFIED)
+                 else page for page in pages]
+        unchanged = [PS.get_gid(url) for url, game in zip(valid_urls, games)
+                     if(game == NOT_MODIFIED)]
+        new_games = [game for game in games if(game and
+                                               not game == NOT_MODIFIED)]
+        return new_games, unchanged
+
+    @staticmethod
+    def get_your_deals(url, revalidate=True):
+        """Fetch and parse game at the url.
+
+        :param url:        the url of the game to parse
+        :type url:         str
+        :param revalidate: whether an unchanged page can be reported as
+                           NOT_MODIFIED, defaults to True
+        :type revalidate:  bool, optional
+        :return:           dictionary representing game from the url, or
+                           NOT_MODIFIED if the page hasn't changed
+        :rtype:            dict or str
+        """
+        game = PS._fetch_your_deals(url, revalidate)
+        if(game and not game == NOT_MODIFIED):
+            return game.result()
+        return game
+
+    @staticmethod
+    def set_rate_limit(rate, burst):
+        """Set the rate limit shared by every request made to psdeals.net.
+
+        :param rate:  the number of requests allowed per second
+        :type rate:   float
+        :param burst: the number of requests that can be made back to back
+        :type burst:  int
+        """
+        PS._RATE = rate
+        PS._BURST = burst
+        Rate_Limiter.configure(urlparse(PS._PS_DEALS_URL).netloc, rate, burst)
+
+    @staticmethod
+    def set_base_url(base_url):
+        """Point every request at another server with the same pages, such as
+           the stand-in server in benchmarks. The rate limit moves with it.
+
+        :param base_url: the scheme and host of the server
+        :type base_url:  str
+        """
+        PS._PS_DEALS_URL = base_url.rstrip("/")
+        PS._TOP_DEALS_URL = (f"{PS._PS_DEALS_URL}/{{}}-store/collection/" +
+                             "top_rated_sale")
+        PS._YOUR_DEALS_URL = f"{PS._PS_DEALS_URL}/game/"
+        PS._GAME_LOOKUP_URL = f"{PS._PS_DEALS_URL}/search?search_query="
+        PS.set_rate_limit(PS._RATE, PS._BURST)
 
     @staticmethod
-    def get_top_deals(_):
-        """Fetches and scrapes the top deals.
+    def top_deals_urls(_):
+        """Get every url the top deals may be fetched from with the current
+           regions, consoles and number of pages, so a change of options can
+           be noticed.
 
         :param _: useless
         :type _:  *
-        :return:  a list of dictionaries representing games
+        :return:  the urls of the pages
         :rtype:   list
         """
-        parsed_data = []
-        for _page in range(1, PS._TOP_DEALS_PAGES+1):
-            if(_page == PS._TOP_DEALS_PAGES):
-                sleep = False
-            else:
-                sleep = True
-
-            # Make the request to download the pages
-            data = PS._make_request(f"{PS._TOP_DEALS_URL}{_page}", sleep)
+        return [PS._top_deals_url(region, page) for region in PS._REGIONS
+                for page in range(1, PS._MAX_PAGES + 1)]
 
-            # if data was retrieved then parse it, otherwise return none.
-            # This is questionable, but I think it best to update all the data
-            # at the same time...
-            if(data):
-                parsed_data.append(PS._parse_top_deals(data.text))
-            else:
-                return None
-
-        # Join the pages of games into one list
-        joined_list = []
-        for list_ in parsed_data:
-            joined_list += list_
-        return joined_list
+    @staticmethod
+    def set_top_deals_options(max_pages, platforms=None):
+        """Set which top deals are fetched.
+
+        :param max_pages: the most pages of deals to fetch from each region
+        :type max_pages:  int
+        :param platforms: only fetch deals for these consoles, such as ps4
+                          or ps5, defaults to None meaning ps4
+        :type platforms:  list, optional
+        """
+        PS._MAX_PAGES = max_pages
+        if(platforms):
+            PS._PLATFORMS = list(dict.fromkeys(platform.lower()
+                                               for platform in platforms))
 
     @staticmethod
-    def get_wishlist_deals(cur, urls):
-        """Fetches and scrapes wishlist deals.
-
-        :param cur:  database cursor
-        :type cur:   Cursor
-        :param urls: a list of wishlist games' urls
-        :type urls:  list
-        :return:     list of games to update and list of games to add
-        :rtype:      list, list or None, None
+    def set_parse_processes(processes):
+        """Set the number of processes pages are parsed in, so parsing many
+           pages isn't held to one core. The pages are still handed over as
+           they arrive, so parsing overlaps with fetching either way.
+
+        :param processes: the number of processes, 0 parses pages on threads
+                          in this process
+        :type processes:  int
         """
-        new_games = []
-        games_to_update = []
-        for index, url in enumerate(urls):
-            if(PS.is_valid(url)):
-                gid = PS.get_gid(url)
-                # If the game already exists in the database then we need
-                # only update
-                if(DB_Calls.game_exists(
-                   cur, DB_Tables.PS_WISHLIST.value, gid)):
-                    games_to_update.append(gid)
-                # We must fetch the data for every game, because every game
-                # provided needs updating
-                if(index == len(urls)-1):
-                    sleep = False
-                else:
-                    sleep = True
-                game = PS.get_your_deals(url, sleep)
-                if(game):
-                    new_games.append(game)
-        if(new_games):
-            return games_to_update, new_games
-        return None, None
+        with PS._parse_pool_lock:
+            PS._PARSE_PROCESSES = processes
+            # The pools are created again with the new size when next used
+            for pool in (PS._parse_pool, PS._process_pool):
+                if(pool is not None):
+                    pool.shutdown()
+            PS._parse_pool = None
+            PS._process_pool = None
 
     @staticmethod
-    def get_your_deals(url, sleep=True):
-        """Fetch and parse game at the url.
+    def set_regions(regions):
+        """Set the stores to fetch the top deals of.
 
-        :param url:   the url of the game to parse
-        :type url:    str
-        :param sleep: whether or not to sleep after request, defaults to True
-        :type sleep:  bool, optional
-        :return:      dictionary representing game from the url
-        :rtype:       dict
+        :param regions: the stores' region codes, as in their urls, e.g. us
+        :type regions:  list
         """
-        # Make the request to download the pages
-        game = PS._make_request(url, sleep)
+        PS._REGIONS = list(dict.fromkeys(region.lower()
+                                         for region in regions))
 
-        # if data was retrieved then parse it, otherwise return none
-        if(game):
-            return PS._parse_your_deals(game.text, url)
+    @staticmethod
+    def get_region(url):
+        """Get the region of the store a psdeals.net url is from.
+
+        :param url: the url of a game
+        :type url:  str
+        :return:    the region code, or None if the url has none
+        :rtype:     str or None
+        """
+        region = PS._REGION.search(url)
+        if(region):
+            return region.group(1)
         return None
 
+    @staticmethod
+    def currency(region):
+        """Get what a region's prices are shown with.
+
+        :param region: the region code of the store, as in its urls
+        :type region:  str or None
+        :return:       the currency symbol, or the region code and a space if
+                       the currency isn't known
+        :rtype:        str
+        """
+        if(not region):
+            return "$"
+        return PS._CURRENCIES.get(region.lower(), f"{region.upper()} ")
+
     @staticmethod
     def ps_plus_price():
         """Just a getter for the _PS_PLUS_PRICE variable
@@ -119,6 +281,16 @@ class PS:
         """
         return float(PS._PS_PLUS_PRICE)
 
+    @staticmethod
+    def wishlist_games_per_request():
+        """Get how many wishlist games one request fetches, one as every
+           game has its own page.
+
+        :return: the number of games per request
+        :rtype:  int
+        """
+        return 1
+
     @staticmethod
     def is_valid(url):
         """Check the url matches the proper url regex.
@@ -156,22 +328,214 @@ class PS:
         return f"{PS._GAME_LOOKUP_URL}{game_name}"
 
     @staticmethod
-    def _make_request(url, sleep=True):
-        """Makes a request for the provided url.
-
-        :param url:   the url to make a request for
-        :type url:    str
-        :param sleep: whether or not to sleep after request, defaults to True
-        :type sleep:  bool, optional
-        :return:      request result
-        :rtype:       request
+    def _make_request(url, revalidate=True):
+        """Makes a request for the provided url, each attempt waiting on
+           the psdeals.net rate limiter.
+
+        :param url:        the url to make a request for
+        :type url:         str
+        :param revalidate: whether a cached response may be revalidated,
+                           defaults to True
+        :type revalidate:  bool, optional
+        :return:           request result
+        :rtype:            request
+        """
+        return make_request_(url, revalidate)
+
+    @staticmethod
+    def _fetch_top_deals(region, revalidate, emit):
+        """Fetch the top deals pages of a region one after another, handing
+           each changed page to the parse pool as it arrives. The number of
+           pages is read from the page links of each page, up to _MAX_PAGES.
+
+        :param region:     the region code of the store
+        :type region:      str
+        :param revalidate: whether unchanged pages can be reported as
+                           NOT_MODIFIED
+        :type revalidate:  bool
+        :param emit:       called with the games on each changed page
+        :type emit:        function
+        :return:           the number of changed pages and the urls of the
+                           unchanged ones, or None if a page couldn't be
+                           retrieved
+        :rtype:            int, list or None
+        """
+        parsing = []
+        unchanged = []
+        last_page = 1
+        _page = 1
+        while(_page <= min(last_page, PS._MAX_PAGES)):
+            url = PS._top_deals_url(region, _page)
+            page = PS._make_request(url, revalidate)
+            if(not page):
+                break
+            text = page.text
+            # Unchanged pages are only parsed if another page has changed
+            if(page.not_modified):
+                unchanged.append(url)
+            else:
+                parsing.append(PS._parse(PS._parse_top_deals, text,
+                                         then=emit))
+            last_page = max(last_page, PS._last_page(text))
+            _page += 1
+        # Wait for the pages to be parsed and emitted
+        for future in parsing:
+            future.result()
+        if(_page <= min(last_page, PS._MAX_PAGES)):
+            return None
+        return len(parsing), unchanged
+
+    @staticmethod
+    def _fetch_your_deals(url, revalidate):
+        """Fetch a game's page, handing it to the parse pool.
+
+        :param url:        the url of the game
+        :type url:         str
+        :param revalidate: whether an unchanged page can be reported as
+                           NOT_MODIFIED
+        :type revalidate:  bool
+        :return:           the future of the game, NOT_MODIFIED if the page
+                           hasn't changed, or None
+        :rtype:            Future or str or None
+        """
+        page = PS._make_request(url, revalidate)
+        if(page and page.not_modified):
+            return NOT_MODIFIED
+        if(page):
+            return PS._parse(PS._parse_your_deals, page.text, url)
+        return None
+
+    @staticmethod
+    def _top_deals_url(region, page):
+        """Form the url for a page of a region's top deals.
+
+        :param region: the region code of the store
+        :type region:  str
+        :param page:   the page number, starting at 1
+        :type page:    int
+        :return:       the url of the page
+        :rtype:        str
         """
-        r = make_request_(url)
-        if(r and sleep):
-            time.sleep(PS._SLEEP_DURATION)
-        return r
+        return (f"{PS._TOP_DEALS_URL.format(region)}?platforms=" +
+                f"{','.join(PS._PLATFORMS)}&page={page}")
 
     @staticmethod
+    def _last_page(text):
+        """Find the last page of top deals a page links to. The links may
+           only reach a few pages ahead, in which case later pages will link
+           further.
+
+        :param text: the page of top deals
+        :type text:  str
+        :return:     the highest page number linked to, or _MAX_PAGES
+                     without links, as how many pages there are can't be
+                     told then
+        :rtype:      int
+        """
+        pagination = PS._PAGINATION.search(text)
+        if(not pagination):
+            return PS._MAX_PAGES
+        return max((int(page) for page in
+                    PS._PAGE_LINK.findall(pagination.group(1))), default=1)
+
+    @staticmethod
+    def _parse(parser, *args, then=None):
+        """Parse a page on the pool shared by every region and list, so the
+           number of pages parsed at once stays the same however many are
+           being fetched. With parse processes set, each of the pool's
+           threads hands its page to a process and waits for the games.
+
+        :param parser:  the parser to run
+        :type parser:   function
+        :param *args:   the arguments of the parser
+        :type *args:    *
+        :param then:    called with what the parser returns, on the pool's
+                        thread before the future is done, defaults to None
+        :type then:     function, optional
+        :return:        the future of the parsed page
+        :rtype:         Future
+        """
+        with PS._parse_pool_lock:
+            if(PS._parse_pool is None):
+                PS._parse_pool = ThreadPoolExecutor(
+                    max_workers=max(PS._PARSE_WORKERS, PS._PARSE_PROCESSES),
+                    thread_name_prefix="ps-parse")
+            if(PS._PARSE_PROCESSES and PS._process_pool is None):
+                # Forking now could copy a lock another thread holds, such
+                # as the metrics lock mid request, into a process that then
+                # waits on it forever, so the processes start fresh
+                PS._process_pool = ProcessPoolExecutor(
+                    max_workers=PS._PARSE_PROCESSES,
+                    mp_context=multiprocessing.get_context("forkserver"),
+                    initializer=PS._start_parse_process,
+                    initargs=(PS._PS_DEALS_URL, HTML_Parser.get_backend()))
+            processes = PS._process_pool
+
+        def run():
+            if(processes):
+                # The process runs the parser without its metrics, which
+                # are never exported from there, so it's timed here
+                start = time.perf_counter()
+                parsed = processes.submit(
+                    PS._run_parser, parser.__name__, *args).result()
+                Metrics.record(Stages.PARSE, "ps",
+                               time.perf_counter() - start)
+            else:
+                parsed = parser(*args)
+            if(then):
+                then(parsed)
+            return parsed
+        return PS._parse_pool.submit(run)
+
+    @staticmethod
+    def _start_parse_process(base_url, backend):
+        """Set up a parse process like this one, as it starts fresh rather
+           than as a copy of this one.
+
+        :param base_url: the server the games' urls point to
+        :type base_url:  str
+        :param backend:  the parser backend in use
+        :type backend:   Parser_Backends
+        """
+        PS.set_base_url(base_url)
+        HTML_Parser.set_backend(backend)
+
+    @staticmethod
+    def _run_parser(name, *args):
+        """Run a parser in a parse process, without the metrics it's wrapped
+           in, which would take the process's metrics lock for nothing.
+
+        :param name:  the name of the parser to run
+        :type name:   str
+        :param *args: the arguments of the parser
+        :type *args:  *
+        :return:      what the parser returned
+        :rtype:       *
+        """
+        return getattr(PS, name).__wrapped__(*args)
+
+    @staticmethod
+    def _price(text):
+        """Read a price in any store's format, such as $15.99, £15.99 or
+           15,99 €.
+
+        :param text: the price as shown on the page
+        :type text:  str
+        :return:     the price
+        :rtype:      float
+        """
+        price = re.sub(r"[^\d.,]", "", text)
+        # The last separator is the decimal point, any others group digits
+        decimal = max(price.rfind("."), price.rfind(","))
+        if(decimal >= 0 and len(price) - decimal - 1 == 2):
+            price = (re.sub(r"[.,]", "", price[:decimal]) + "." +
+                     price[decimal+1:])
+        else:
+            price = re.sub(r"[.,]", "", price)
+        return float(price)
+
+    @staticmethod
+    @Metrics.timed(Stages.PARSE, "ps")
     def _parse_top_deals(data):
         """The deal page scraper and data parser.
 
@@ -180,7 +544,7 @@ class PS:
         :return:     a list of dictionaries representing games
         :rtype:      list
         """
-        html = BeautifulSoup(data, "html.parser")
+        html = HTML_Parser.parse(data, PS._TOP_DEALS_STRAINER)
         games = html.find_all("div", "game-collection-item-col")
         parsed_data = []
         for game in games:
@@ -191,14 +555,14 @@ class PS:
             full_price = game.find(
                 "span", {"class": ["game-collection-item-regular-price"]})
             if(full_price):
-                full_price = float(full_price.text[1:])
+                full_price = PS._price(full_price.text)
 
             sale_price = game.find(
                 "span", {"class": ["game-collection-item-discount-price"]})
             if(sale_price):
                 # Try to convert to float, if it fails then the game is free
                 try:
-                    sale_price = float(sale_price.text[1:])
+                    sale_price = PS._price(sale_price.text)
                 except Exception:
                     sale_price = 0.00
             else:
@@ -238,10 +602,12 @@ class PS:
                                   sale_price,
                                   cover_image,
                                   psdeals_gid,
-                                  ps_deals_url))
+                                  ps_deals_url,
+                                  PS.get_region(ps_deals_url)))
         return parsed_data
 
     @staticmethod
+    @Metrics.timed(Stages.PARSE, "ps")
     def _parse_your_deals(data, url):
         """Scrape the wishlist game data from the page.
 
@@ -252,7 +618,7 @@ class PS:
         :return:     a dictionary representing the game
         :rtype:      dict
         """
-        html = BeautifulSoup(data, "html.parser")
+        html = HTML_Parser.parse(data, PS._YOUR_DEALS_STRAINER)
         title = html.find("div", {"class": ["game-title-info-name"]})
         if(title):
             title = title.text.rstrip()  # some titles have trailing space
@@ -260,12 +626,12 @@ class PS:
         full_price = html.find(
             "span", {"class": ["game-collection-item-regular-price"]})
         if(full_price):
-            full_price = float(full_price.text[1:])
+            full_price = PS._price(full_price.text)
 
         sale_price = html.find(
             "span", {"class": ["game-collection-item-discount-price"]})
         if(sale_price):
-            sale_price = float(sale_price.text[1:])
+            sale_price = PS._price(sale_price.text)
         else:
             sale_price = full_price
 
@@ -285,4 +651,8 @@ class PS:
             sale_price,
             cover_image,
             gid,
-            url)
+            url,
+            PS.get_region(url))
+
+
+PS.set_rate_limit(PS._RATE, PS._BURST)
@@ -4,13 +4,141 @@
   This is a collection of functions shared between the different platforms
 '''
 
-import requests
+import threading
+import time
+from urllib.parse import urlparse
 
 from src.utils.db_enums import DB_Columns
+from src.utils.http_cache import HTTP_Cache
+from src.utils.metrics import Metric, Metrics, Stages
+from src.utils.rate_limiter import Rate_Limiter
+
+# Returned in place of data when the server says nothing has changed since
+# the last request, meaning there is nothing to parse or write
+NOT_MODIFIED = "NOT_MODIFIED"
+
+
+class HTTP_Session:
+    _POOL_HOSTS = 4  # the number of hosts to keep connection pools for
+    _POOL_SIZE = 4  # the maximum number of open connections to each host
+    _TIMEOUT = (5, 30)  # the connect and read timeouts, in seconds
+    _RETRIES = 2  # the times a request is retried on a connection error
+    _RETRY_STATUSES = (429, 500, 502, 503, 504)  # and on these statuses
+    _BACKOFF = 0.5  # the seconds to wait before the first retry, doubling
+    _MAX_RETRY_AFTER = 60  # the most seconds a 429's Retry-After is obeyed
+    _HEADERS = {"Accept-Encoding": "gzip, deflate"}
+    _session = None
+    _latencies = {}  # the latency of every request, keyed by host name
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(url, headers=None):
+        """Make a GET request with the process wide session, keeping the
+           connection alive for the next request to the same host. Every
+           attempt waits on the host's rate limit, and failed requests are
+           retried after a backoff, or as long as a 429 says to.
+
+        :param url:     the url to make request for
+        :type url:      str
+        :param headers: extra headers to send, defaults to None
+        :type headers:  dict, optional
+        :return:        the response, the last one if every attempt failed
+        :rtype:         Response
+        """
+        session = HTTP_Session._get_session()
+        host = urlparse(url).netloc
+        for attempt in range(HTTP_Session._RETRIES + 1):
+            if(attempt):
+                Metrics.add(Metric.HTTP_RETRIES, host=host)
+            Rate_Limiter.wait_for(url)
+            start = time.perf_counter()
+            try:
+                with Metrics.stage(Stages.FETCH, host):
+                    r = session.get(url, headers=headers,
+                                    timeout=HTTP_Session._TIMEOUT)
+            except Exception:
+                if(attempt == HTTP_Session._RETRIES):
+                    raise
+                time.sleep(HTTP_Session._BACKOFF * 2**attempt)
+                continue
+            HTTP_Session._record(url, time.perf_counter() - start)
+            Metrics.add(Metric.HTTP_REQUESTS, host=host, status=r.status_code)
+            Metrics.add(Metric.HTTP_BYTES, len(r.content), host=host)
+            if(r.status_code not in HTTP_Session._RETRY_STATUSES or
+               attempt == HTTP_Session._RETRIES):
+                return r
+            time.sleep(HTTP_Session._retry_delay(r, attempt))
+
+    @staticmethod
+    def _retry_delay(r, attempt):
+        """Work out how long to wait before retrying a failed request.
+
+        :param r:       the failed response
+        :type r:        Response
+        :param attempt: the number of attempts before this one
+        :type attempt:  int
+        :return:        the number of seconds to wait
+        :rtype:         float
+        """
+        delay = HTTP_Session._BACKOFF * 2**attempt
+        try:
+            retry_after = float(r.headers.get("Retry-After", 0))
+        except ValueError:
+            retry_after = 0
+        return max(delay, min(retry_after, HTTP_Session._MAX_RETRY_AFTER))
+
+    @staticmethod
+    def latencies():
+        """Get the latency of every request made so far.
+
+        :return: lists of request latencies in seconds, keyed by host name
+        :rtype:  dict
+        """
+        with HTTP_Session._lock:
+            return {host: list(times) for host, times in
+                    HTTP_Session._latencies.items()}
+
+    @staticmethod
+    def _get_session():
+        """Create the shared session on first use.
+
+        :return: the process wide session
+        :rtype:  Session
+        """
+        # requests is slow to import, only load it once a request is made
+        import requests
+        from requests.adapters import HTTPAdapter
+        with HTTP_Session._lock:
+            if(HTTP_Session._session is None):
+                session = requests.Session()
+                # Block rather than open more connections than the pool
+                # allows, this caps the connections to each host. Retries
+                # are made in get, so each one waits on the rate limit
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_Session._POOL_HOSTS,
+                    pool_maxsize=HTTP_Session._POOL_SIZE, pool_block=True)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update(HTTP_Session._HEADERS)
+                HTTP_Session._session = session
+            return HTTP_Session._session
+
+    @staticmethod
+    def _record(url, latency):
+        """Record the latency of a request.
+
+        :param url:     the url that was requested
+        :type url:      str
+        :param latency: the number of seconds the request took
+        :type latency:  float
+        """
+        with HTTP_Session._lock:
+            HTTP_Session._latencies.setdefault(
+                urlparse(url).netloc, []).append(latency)
 
 
 def create_game_dictionary(title, full_price, sale_price, cover_image, gid,
-                           url):
+                           url, region=""):
     """Creates and returns a dictionary for the game.
 
     :param title:       the title of the game
@@ -25,6 +153,9 @@ def create_game_dictionary(title, full_price, sale_price, cover_image, gid,
     :type gid:          int
     :param url:         the url for the game
     :type url:          str
+    :param region:      the region of the store the deal is from, defaults
+                        to "" for deals that aren't tied to one
+    :type region:       str, optional
     :return:            a dictionary representation of the game
     :rtype:             dict
     """
@@ -35,22 +166,36 @@ def create_game_dictionary(title, full_price, sale_price, cover_image, gid,
         DB_Columns.COVER_IMAGE.value: cover_image,
         DB_Columns.GID.value: gid,
         DB_Columns.URL.value: url,
-        DB_Columns.TITLE_LENGTH.value: len(title)
+        DB_Columns.TITLE_LENGTH.value: len(title),
+        DB_Columns.REGION.value: region
     }
 
 
-def make_request_(url):
+def make_request_(url, revalidate=True):
     """A shared function that just makes and returns the request, any extra
-       behavior will be done by the class calling the function.
+       behavior will be done by the class calling the function. Requests go
+       through the pooled HTTP_Session so connections are reused, and cached
+       responses are revalidated rather than downloaded again.
 
-    :param url: the url to make request for
-    :type url:  str
-    :return:    the request if successful, otherwise None
-    :rtype:     request or None
+    :param url:        the url to make request for
+    :type url:         str
+    :param revalidate: whether a cached response may be revalidated, pass
+                       False when the data is needed even if it's unchanged,
+                       defaults to True
+    :type revalidate:  bool, optional
+    :return:           the request if successful, otherwise None. A response
+                       from the cache has not_modified set to True
+    :rtype:            request or Cached_Response or None
     """
     try:
-        r = requests.get(url)
+        headers = HTTP_Cache.validators(url) if(revalidate) else None
+        r = HTTP_Session.get(url, headers)
+        if(r.status_code == 304):
+            Metrics.add(Metric.CACHE_HITS, host=urlparse(url).netloc)
+            return HTTP_Cache.load(url)
         if(r.status_code == 200):
+            HTTP_Cache.store(url, r)
+            r.not_modified = False
             return r
         return None
     except Exception:
@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+
+'''
+  The long running refresh daemon. It keeps a snapshot of what the front
+  ends show besides the menus in memory, refreshes the database on its own
+  schedule, and answers the rofi front end and polybar over a Unix socket
+  so neither has to start the scraping stack or migrate the database.
+
+  Requests and responses are single lines of JSON:
+      {"command": "snapshot"}                  the longest title of every
+                                                list and the new lows
+      {"command": "refresh", "pc": [], "ps": []} update now and then reply
+                                                with the new snapshot
+      {"command": "reload"}                    re-read the database after
+                                                another process changed it
+'''
+
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import sys
+import tempfile
+import threading
+
+from src.utils.db_calls import DB_Calls
+
+
+class _Request_Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        """Answer a single request from a client."""
+        try:
+            request = json.loads(self.rfile.readline())
+            response = Daemon._answer(request)
+        except ValueError as e:
+            response = {"error": str(e)}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class Daemon:
+    _SOCKET = os.path.join(
+        os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir()),
+        "game-deals.sock")
+    _INTERVAL = 15*60  # seconds between checking if the lists need updating
+    # The most seconds a client waits on a refresh, psdeals.net's rate limit
+    # makes long ones slow
+    _REFRESH_TIMEOUT = 10*60
+    _database = None
+    _refresh = None
+    _snapshot = None
+    _pending = {"pc": [], "ps": []}  # wishlist games asked for by clients
+    _running = False
+    _generation = 0  # the number of finished refreshes
+    _updated = threading.Condition()
+    _wake = threading.Event()
+
+    @staticmethod
+    def serve(database, refresh, interval=_INTERVAL, pc_ids=None,
+              ps_urls=None):
+        """Refresh the database in the background and answer clients until
+           interrupted.
+
+        :param database: the path to the database
+        :type database:  str
+        :param refresh:  called with a cursor, the new PC wishlist ids and
+                         the new Playstation wishlist urls to update the
+                         database
+        :type refresh:   function
+        :param interval: the number of seconds between refreshes, defaults
+                         to _INTERVAL
+        :type interval:  int, optional
+        :param pc_ids:   ids of PC games to add in the first refresh,
+                         defaults to None
+        :type pc_ids:    list, optional
+        :param ps_urls:  urls of Playstation games to add in the first
+                         refresh, defaults to None
+        :type ps_urls:   list, optional
+        """
+        Daemon._remove_stale_socket()
+        Daemon._database = database
+        Daemon._refresh = refresh
+        Daemon._pending = {"pc": list(pc_ids or []),
+                           "ps": list(ps_urls or [])}
+        Daemon._reload()
+        threading.Thread(target=Daemon._update_loop, args=(interval,),
+                         daemon=True).start()
+        with socketserver.ThreadingUnixStreamServer(
+                Daemon._SOCKET, _Request_Handler) as server:
+            inode = os.stat(Daemon._SOCKET).st_ino
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                # Only remove the socket if it's still this daemon's
+                try:
+                    if(os.stat(Daemon._SOCKET).st_ino == inode):
+                        os.unlink(Daemon._SOCKET)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _remove_stale_socket():
+        """Remove the socket of a daemon that was killed, refusing to start
+           if a daemon is still listening on it.
+        """
+        if(Daemon.request({"command": "snapshot"}) is not None):
+            raise SystemExit(
+                f"A daemon is already running on {Daemon._SOCKET}")
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(Daemon._SOCKET)
+        except FileNotFoundError:
+            return
+        except ConnectionRefusedError:
+            # Nothing is listening, the daemon that made it is gone
+            os.unlink(Daemon._SOCKET)
+            return
+        raise SystemExit(
+            f"A daemon is already listening on {Daemon._SOCKET}")
+
+    @staticmethod
+    def request(message):
+        """Send a request to the running daemon.
+
+        :param message: the request
+        :type message:  dict
+        :return:        the daemon's response, or None if it isn't running or
+                        couldn't answer
+        :rtype:         dict or None
+        """
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                # A little longer than the daemon waits on a refresh
+                sock.settimeout(Daemon._REFRESH_TIMEOUT + 30)
+                sock.connect(Daemon._SOCKET)
+                sock.sendall(json.dumps(message).encode() + b"\n")
+                with sock.makefile("rb") as f:
+                    response = json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+        if(not isinstance(response, dict) or "error" in response):
+            return None
+        return response
+
+    @staticmethod
+    def _answer(request):
+        """Work out the response to a request.
+
+        :param request: the request
+        :type request:  dict
+        :return:        the response
+        :rtype:         dict
+        """
+        command = request.get("command")
+        if(command == "refresh"):
+            with Daemon._updated:
+                Daemon._pending["pc"] += request.get("pc") or []
+                Daemon._pending["ps"] += request.get("ps") or []
+                # A refresh that has already started won't see the new
+                # wishlist games, so wait for the one after it
+                target = Daemon._generation + (2 if(Daemon._running) else 1)
+                Daemon._wake.set()
+                if(not Daemon._updated.wait_for(
+                        lambda: Daemon._generation >= target,
+                        Daemon._REFRESH_TIMEOUT)):
+                    return {"error": "timed out waiting for the refresh"}
+        elif(command == "reload"):
+            Daemon._reload()
+        elif(not command == "snapshot"):
+            return {"error": f"unknown command {command}"}
+        return Daemon._snapshot
+
+    @staticmethod
+    def _update_loop(interval):
+        """Refresh the database every interval seconds, or sooner when a
+           client asks for it.
+
+        :param interval: the number of seconds between refreshes
+        :type interval:  int
+        """
+        con = sqlite3.connect(Daemon._database)
+        cur = con.cursor()
+        while(True):
+            with Daemon._updated:
+                pending = Daemon._pending
+                Daemon._pending = {"pc": [], "ps": []}
+                Daemon._running = True
+                Daemon._wake.clear()
+            try:
+                Daemon._refresh(cur, pending["pc"], pending["ps"])
+                con.commit()
+                Daemon._snapshot = DB_Calls.get_snapshot(cur)
+            except Exception as e:
+                con.rollback()
+                print(f"Refresh failed: {e}", file=sys.stderr)
+            finally:
+                # Clients waiting on this refresh are answered even if it
+                # failed, with the last good snapshot
+                with Daemon._updated:
+                    Daemon._running = False
+                    Daemon._generation += 1
+                    Daemon._updated.notify_all()
+            Daemon._wake.wait(interval)
+
+    @staticmethod
+    def _reload():
+        """Replace the snapshot with the current contents of the database."""
+        con = sqlite3.connect(Daemon._database)
+        Daemon._snapshot = DB_Calls.get_snapshot(con.cursor())
+        con.close()
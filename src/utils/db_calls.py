@@ -4,170 +4,266 @@
   This script contains all the methods pertaining to database interactions.
   ps.py and pc.py both fetch and return the data that this file processes and
   adds to the database.
+
+  Every list of games lives in the one deals table, told apart by the
+  platform and list_kind columns. The rest of the program still refers to
+  the lists by their DB_Tables value, which is translated here.
 '''
 
+import hashlib
+import json
+import math
+import sqlite3
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
-from src.utils.db_enums import DB_Indices, DB_Columns, DB_Tables
+from src.utils.db_enums import (DB_Columns, DB_Tables, DB_Platforms,
+                                DB_List_Kinds, DB_Changes, DB_Search_Indices)
 
 
 class DB_Calls:
+    _MAX_VARIABLES = 500  # the most parameters to bind in one query
+    _LISTS = {
+        DB_Tables.TOP_PC.value: (DB_Platforms.PC.value,
+                                 DB_List_Kinds.TOP.value),
+        DB_Tables.TOP_PS.value: (DB_Platforms.PS.value,
+                                 DB_List_Kinds.TOP.value),
+        DB_Tables.PC_WISHLIST.value: (DB_Platforms.PC.value,
+                                      DB_List_Kinds.WISHLIST.value),
+        DB_Tables.PS_WISHLIST.value: (DB_Platforms.PS.value,
+                                      DB_List_Kinds.WISHLIST.value)
+    }
+    # The stored columns of a game, in the order of DB_Indices
+    _GAME_COLUMNS = ", ".join(column.value for column in (
+        DB_Columns.TITLE, DB_Columns.FULL_PRICE, DB_Columns.SALE_PRICE,
+        DB_Columns.COVER_IMAGE, DB_Columns.URL, DB_Columns.GID,
+        DB_Columns.UPDATE_TIME, DB_Columns.TITLE_LENGTH))
+    # The columns of a game that make up its content hash
+    _HASHED_COLUMNS = (DB_Columns.TITLE, DB_Columns.FULL_PRICE,
+                       DB_Columns.SALE_PRICE, DB_Columns.COVER_IMAGE,
+                       DB_Columns.URL)
+    # Only points within this many days count towards the recent low
+    _RECENT_LOW_DAYS = 90
+    # The price Playstation deals only available with PS+ are stored at,
+    # see PS._PS_PLUS_PRICE, which the games were never sold for
+    _PS_PLUS_CENTS = 9999
+    # A wishlist game is expected to change price once in this many seconds
+    # until its own changes have been observed
+    _PRIOR_INTERVAL = 12*60*60
+    # The shortest and longest time between checks of a wishlist game
+    _MIN_INTERVAL = 60*60
+    _MAX_INTERVAL = 7*24*60*60
+    # The expected number of price changes of a scheduled game since it was
+    # last checked, from its observed rate of change
+    _EXPECTED_CHANGES = f"""(IFNULL(changes, 0) + 1.0) /
+        (IFNULL(observed, 0) + {_PRIOR_INTERVAL}) * (? - IFNULL(checked, 0))"""
+    # The latest point in a deals row's price history
+    _LATEST_POINT = """FROM price_history WHERE
+        price_history.platform=deals.platform AND
+        price_history.gid=deals.gid ORDER BY time DESC, rowid DESC LIMIT 1"""
+    # The lowest price of a deals row since the start of the window, bound
+    # twice, including the price it already had when the window started
+    _RECENT_LOW = """(SELECT MIN(sale_cents) / 100.0 FROM (
+        SELECT sale_cents FROM price_history WHERE
+        price_history.platform=deals.platform AND
+        price_history.gid=deals.gid AND time>=?
+        UNION ALL
+        SELECT * FROM (SELECT sale_cents FROM price_history WHERE
+        price_history.platform=deals.platform AND
+        price_history.gid=deals.gid AND time<? ORDER BY time DESC, rowid
+        DESC LIMIT 1)))"""
+    # True for a deals row whose latest price is below all its earlier ones
+    _NEW_LOW = f"""(SELECT sale_cents {_LATEST_POINT}) < (
+        SELECT MIN(sale_cents) FROM price_history AS earlier WHERE
+        earlier.platform=deals.platform AND earlier.gid=deals.gid AND
+        earlier.rowid!=(SELECT rowid {_LATEST_POINT}))"""
+    # The most matches from the title index ranked for a search
+    _SEARCH_CANDIDATES = 200
+    # The most typos per character of a search, against the closest part of
+    # a title, for the title to match it
+    _SEARCH_TYPOS = 0.25
+    # A titles row in the order of DB_Search_Indices, with the lowest price
+    # the game is in a list at or otherwise its latest known price
+    _SEARCH_COLUMNS = """titles.platform, titles.gid, titles.title,
+        titles.url, IFNULL((SELECT MIN(sale_price) FROM deals WHERE
+        deals.platform=titles.platform AND deals.gid=titles.gid), (SELECT
+        sale_cents / 100.0 FROM price_history WHERE
+        price_history.platform=titles.platform AND
+        price_history.gid=titles.gid ORDER BY time DESC, rowid DESC LIMIT
+        1))"""
+    # Narrows a query down to one list, bind the result of _list with it
+    _IN_LIST = (f"{DB_Columns.PLATFORM.value}=? AND " +
+                f"{DB_Columns.LIST_KIND.value}=?")
+
     @staticmethod
     def get_data(cur, table):
         """Get all the data from the specified table, ordering the results by
-           sale_price, cheapest to priciest.
+           sale_price, cheapest to priciest, within each region's store, as
+           each store has its own currency. Each game also has its all-time
+           low and its lowest price in the last _RECENT_LOW_DAYS from the
+           price history.
 
         :param cur:   database cursor
         :type cur:    cursor
         :param table: the table to get the data from
         :type table:  str
-        :return:      returns all of the table's data orders by sale_price
-                      ascending
+        :return:      returns all of the table's data orders by region then
+                      sale_price ascending, in the order of DB_Indices
         :rtype:       list
         """
-        top_pc_rq = """SELECT * FROM TOP_PC ORDER BY
-                                sale_price ASC"""
-        top_ps_rq = """SELECT * FROM TOP_PS ORDER BY
-                                sale_price ASC"""
-        pc_wishlist_rq = """SELECT * FROM PC_WISHLIST ORDER BY
-                                sale_price ASC"""
-        ps_wishlist_rq = """SELECT * FROM PS_WISHLIST ORDER BY
-                                sale_price ASC"""
+        start = int(time.time()) - DB_Calls._RECENT_LOW_DAYS * 24 * 60 * 60
+        return cur.execute(
+            f"""SELECT {DB_Calls._GAME_COLUMNS}, (SELECT MIN(sale_cents)
+                / 100.0 FROM price_history WHERE
+                price_history.platform=deals.platform AND
+                price_history.gid=deals.gid) AS
+                {DB_Columns.LOWEST_PRICE.value}, {DB_Columns.REGION.value},
+                {DB_Calls._RECENT_LOW} AS {DB_Columns.RECENT_LOW.value}
+                FROM deals WHERE
+                {DB_Calls._IN_LIST} ORDER BY {DB_Columns.REGION.value},
+                {DB_Columns.SALE_PRICE.value} ASC""",
+            (start, start, *DB_Calls._list(table))).fetchall()
+
+    @staticmethod
+    @contextmanager
+    def transaction(cur, name="refresh"):
+        """Run the enclosed statements as one transaction, rolling them all
+           back if any of them fails. Transactions can be nested, the
+           outermost commits when it ends so no write lock is held between
+           them. Every write is made in one.
+
+        :param cur:  database cursor
+        :type cur:   cursor
+        :param name: the name of the savepoint, defaults to "refresh"
+        :type name:  str, optional
+        """
+        cur.execute(f"SAVEPOINT {name}")
         try:
-            if(table == DB_Tables.TOP_PC.value):
-                return_query = top_pc_rq
-            elif(table == DB_Tables.TOP_PS.value):
-                return_query = top_ps_rq
-            elif(table == DB_Tables.PC_WISHLIST.value):
-                return_query = pc_wishlist_rq
-            elif(table == DB_Tables.PS_WISHLIST.value):
-                return_query = ps_wishlist_rq
-            return cur.execute(return_query).fetchall()
-        except Exception:
-            if(table == DB_Tables.TOP_PC.value):
-                query = """CREATE TABLE TOP_PC(
-                        title TEXT NOT NULL UNIQUE,
-                        full_price REAL,
-                        sale_price REAL,
-                        cover_image TEXT,
-                        url TEXT NOT NULL UNIQUE,
-                        gid INTEGER UNIQUE,
-                        update_time TEXT,
-                        title_length INTEGER)"""
-                return_query = top_pc_rq
-            elif(table == DB_Tables.TOP_PS.value):
-                query = """CREATE TABLE TOP_PS(
-                        title TEXT NOT NULL UNIQUE,
-                        full_price REAL,
-                        sale_price REAL,
-                        cover_image TEXT,
-                        url TEXT NOT NULL UNIQUE,
-                        gid INTEGER UNIQUE,
-                        update_time TEXT,
-                        title_length INTEGER)"""
-                return_query = top_ps_rq
-            elif(table == DB_Tables.PC_WISHLIST.value):
-                query = """CREATE TABLE PC_WISHLIST(
-                        title TEXT NOT NULL UNIQUE,
-                        full_price REAL,
-                        sale_price REAL,
-                        cover_image TEXT,
-                        url TEXT NOT NULL UNIQUE,
-                        gid INTEGER UNIQUE,
-                        update_time TEXT,
-                        title_length INTEGER)"""
-                return_query = pc_wishlist_rq
-            elif(table == DB_Tables.PS_WISHLIST.value):
-                query = """CREATE TABLE PS_WISHLIST(
-                        title TEXT NOT NULL UNIQUE,
-                        full_price REAL,
-                        sale_price REAL,
-                        cover_image TEXT,
-                        url TEXT NOT NULL UNIQUE,
-                        gid INTEGER UNIQUE,
-                        update_time TEXT,
-                        title_length INTEGER)"""
-                return_query = ps_wishlist_rq
-            cur.execute(query)
-            return cur.execute(return_query).fetchall()
-
-    @staticmethod
-    def add_top_deals(cur, table, existing_games, new_games):
-        """Add the top deals to the database.
+            yield
+        except BaseException:
+            cur.execute(f"ROLLBACK TO {name}")
+            cur.execute(f"RELEASE {name}")
+            raise
+        cur.execute(f"RELEASE {name}")
 
-        :param cur:            database cursor
-        :type cur:             cursor
-        :param table:          the table to update the deals of
-        :type table:           str
-        :param existing_games: a list of games that are already in the database
-                               and therefore will be updated
-        :type existing_games:  list
-        :param new_games:      a list of games that are not already in the
-                               database and therefore will be inserted
-        :type new_games:       list
-        """
-        unmatched_titles = []
-        matched_titles = []
-        # When adding top deals, we need to remove the games that are no
-        # longer a "top deal"
-        for existing_game in existing_games:
-            matched = False
-            for new_game in new_games:
-                if(existing_game[DB_Indices.GID.value] ==
-                   new_game[DB_Columns.GID.value]):
-                    matched = True
-                    matched_titles.append(existing_game[DB_Indices.GID.value])
-                    break
-            if(not matched):
-                # append it to the list of titles that we will delete
-                unmatched_titles.append(existing_game[DB_Indices.TITLE.value])
-
-        # Delete the games that aren't found in the api response anymore
-        for title in unmatched_titles:
-            DB_Calls.delete_game_with_title(cur, table, title)
-
-        # Update the remainder of the games that are already present, add the
-        # games that are new entries to the database.
-        DB_Calls.add_games(cur, table, new_games, matched_titles)
-
-    @staticmethod
-    def add_games(cur, table, games, games_to_update=None):
-        """Get all the data from the specified table, ordering the results by
-           sale_price, cheapest to priciest.
+    @staticmethod
+    def add_top_deals(cur, table, games):
+        """Replace the top deals in the table with the given games, in one
+           transaction. Only the changes are written: new games are
+           inserted, changed ones updated and the ones that are no longer a
+           "top deal" deleted.
 
         :param cur:   database cursor
         :type cur:    cursor
-        :param table: the table to get the data from
+        :param table: the table to update the deals of
         :type table:  str
-        :return:      returns all of the table's data orders by sale_price
-                      ascending
+        :param games: the current top deals
+        :type games:  list
+        :return:      the ids of the games in each kind of change, keyed by
+                      DB_Changes value
+        :rtype:       dict
+        """
+        with DB_Calls.transaction(cur):
+            return DB_Calls._write_changes(cur, table, games, True)
+
+    @staticmethod
+    def add_games(cur, table, games):
+        """Add the games to the table in one transaction, updating the ones
+           already in it that have changed.
+
+        :param cur:   database cursor
+        :type cur:    cursor
+        :param table: the table to add the games to
+        :type table:  str
+        :param games: the game dictionaries to add
+        :type games:  list
+        :return:      the ids of the games in each kind of change, keyed by
+                      DB_Changes value
+        :rtype:       dict
+        """
+        with DB_Calls.transaction(cur):
+            return DB_Calls._write_changes(cur, table, games, False)
+
+    @staticmethod
+    def add_top_deals_page(cur, table, games):
+        """Write one page of top deals as it arrives, in one transaction.
+           Nothing is removed until the whole list has arrived, see
+           sweep_top_deals.
+
+        :param cur:   database cursor
+        :type cur:    cursor
+        :param table: the table to update the deals of
+        :type table:  str
+        :param games: the deals on the page
+        :type games:  list
+        :return:      the ids of the games in each kind of change, keyed by
+                      DB_Changes value
+        :rtype:       dict
+        """
+        with DB_Calls.transaction(cur):
+            return DB_Calls._write_changes(cur, table, games, False, False)
+
+    @staticmethod
+    def sweep_top_deals(cur, table, gids):
+        """Finish a refresh written page by page, deleting the games that
+           weren't on any page and marking the table refreshed.
+
+        :param cur:   database cursor
+        :type cur:    cursor
+        :param table: the table that was refreshed
+        :type table:  str
+        :param gids:  the ids of every game on the pages
+        :type gids:   set
+        :return:      the ids of the games deleted
         :rtype:       list
         """
-        if(table == DB_Tables.TOP_PC.value):
-            query = """SELECT * FROM TOP_PC WHERE
-                                gid=?"""
-        elif(table == DB_Tables.TOP_PS.value):
-            query = """SELECT * FROM TOP_PS WHERE
-                                gid=?"""
-        elif(table == DB_Tables.PC_WISHLIST.value):
-            query = """SELECT * FROM PC_WISHLIST WHERE
-                                gid=?"""
-        elif(table == DB_Tables.PS_WISHLIST.value):
-            query = """SELECT * FROM PS_WISHLIST WHERE
-                                gid=?"""
-        if(games_to_update is None):
-            for game in games:
-                if(cur.execute(query, (game[DB_Columns.GID.value], )
-                               ).fetchone()):
-                    DB_Calls._update_game(cur, table, game)
-                else:
-                    DB_Calls._add_game(cur, table, game)
-        else:
-            for game in games:
-                if(game[DB_Columns.GID.value] in games_to_update):
-                    DB_Calls._update_game(cur, table, game)
-                else:
-                    DB_Calls._add_game(cur, table, game)
+        gids = set(str(gid) for gid in gids)
+        with DB_Calls.transaction(cur):
+            removed = [str(row[0]) for row in cur.execute(
+                f"""SELECT {DB_Columns.GID.value} FROM deals WHERE
+                    {DB_Calls._IN_LIST}""", DB_Calls._list(table))
+                if(str(row[0]) not in gids)]
+            DB_Calls._delete_gids(cur, table, removed)
+            if(removed):
+                DB_Calls.update_summary(cur)
+            DB_Calls._mark_refreshed(cur, table)
+        return removed
+
+    @staticmethod
+    def count_games(cur, table):
+        """Count the games in the table.
+
+        :param cur:   database cursor
+        :type cur:    cursor
+        :param table: the table to count
+        :type table:  str
+        :return:      the number of games in the table
+        :rtype:       int
+        """
+        return cur.execute(f"""SELECT COUNT(*) FROM deals WHERE
+                           {DB_Calls._IN_LIST}""",
+                           DB_Calls._list(table)).fetchone()[0]
+
+    @staticmethod
+    def touch_games(cur, table, gids=None):
+        """Mark games as up to date without changing them, used when the
+           server reports the data hasn't changed since the last request.
+
+        :param cur:   database cursor
+        :type cur:    cursor
+        :param table: the table the games are in
+        :type table:  str
+        :param gids:  the ids of the games to touch, defaults to None meaning
+                      every game in the table
+        :type gids:   list, optional
+        """
+        platform, list_kind = DB_Calls._list(table)
+        with DB_Calls.transaction(cur):
+            if(gids is None):
+                DB_Calls._mark_refreshed(cur, table)
+            elif(list_kind == DB_List_Kinds.WISHLIST.value):
+                DB_Calls._schedule(cur, platform, gids, set())
 
     @staticmethod
     def game_exists(cur, table, id_=None, url=None):
@@ -179,65 +275,45 @@ class DB_Calls:
         :type table:  str
         :param id_:   the id to search table for
         :type id_:    int
+        :param url:   the url to search table for
+        :type url:    str
         :return:      True if game with url or id exists
         :rtype:       bool
         """
         if(url):
-            parameter = url
-            if(table == DB_Tables.TOP_PC.value):
-                query = """SELECT * FROM TOP_PC WHERE
-                                url=?"""
-            elif(table == DB_Tables.TOP_PS.value):
-                query = """SELECT * FROM TOP_PS WHERE
-                                url=?"""
-            elif(table == DB_Tables.PC_WISHLIST.value):
-                query = """SELECT * FROM PC_WISHLIST WHERE
-                                url=?"""
-            elif(table == DB_Tables.PS_WISHLIST.value):
-                query = """SELECT * FROM PS_WISHLIST WHERE
-                                url=?"""
+            column, parameter = DB_Columns.URL.value, url
         elif(id_):
-            parameter = id_
-            if(table == DB_Tables.TOP_PC.value):
-                query = """SELECT * FROM TOP_PC WHERE
-                                gid=?"""
-            elif(table == DB_Tables.TOP_PS.value):
-                query = """SELECT * FROM TOP_PS WHERE
-                                gid=?"""
-            elif(table == DB_Tables.PC_WISHLIST.value):
-                query = """SELECT * FROM PC_WISHLIST WHERE
-                                gid=?"""
-            elif(table == DB_Tables.PS_WISHLIST.value):
-                query = """SELECT * FROM PS_WISHLIST WHERE
-                                gid=?"""
-        if(cur.execute(query, (parameter, )).fetchone()):
+            column, parameter = DB_Columns.GID.value, id_
+        if(cur.execute(f"""SELECT 1 FROM deals WHERE {DB_Calls._IN_LIST} AND
+                       {column}=?""",
+                       (*DB_Calls._list(table), parameter)).fetchone()):
             return True
         return False
 
     @staticmethod
-    def delete_game_with_title(cur, table, title):
-        """Delete game with given title from the database.
+    def existing_gids(cur, table, gids):
+        """Find which of the given game ids are in the table, with one query
+           per _MAX_VARIABLES ids rather than one per game.
 
         :param cur:   database cursor
         :type cur:    cursor
-        :param table: the table to delete the title from
+        :param table: the table to check game ids for
         :type table:  str
-        :param title: the title of the game to delete
-        :type title:  str
+        :param gids:  the ids to search table for
+        :type gids:   list
+        :return:      the ids that are in the table, as strings
+        :rtype:       set
         """
-        if(table == DB_Tables.TOP_PC.value):
-            query = """DELETE FROM TOP_PC WHERE
-                     title=?"""
-        elif(table == DB_Tables.TOP_PS.value):
-            query = """DELETE FROM TOP_PS WHERE
-                     title=?"""
-        elif(table == DB_Tables.PC_WISHLIST.value):
-            query = """DELETE FROM PC_WISHLIST WHERE
-                     title=?"""
-        elif(table == DB_Tables.PS_WISHLIST.value):
-            query = """DELETE FROM PS_WISHLIST WHERE
-                     title=?"""
-        cur.execute(query, (title, ))
+        gids = list(gids)
+        existing = set()
+        for i in range(0, len(gids), DB_Calls._MAX_VARIABLES):
+            chunk = gids[i:i+DB_Calls._MAX_VARIABLES]
+            existing.update(str(row[0]) for row in cur.execute(
+                f"""SELECT {DB_Columns.GID.value} FROM deals WHERE
+                    {DB_Calls._IN_LIST} AND {DB_Columns.GID.value} IN
+                    ({",".join("?" * len(chunk))})""",
+                (*DB_Calls._list(table), *chunk)))
+        return existing
 
     @staticmethod
     def delete_game_with_id(cur, table, id_):
@@ -250,79 +326,241 @@ class DB_Calls:
         :param id_:   the id to delete from the table
         :type id_:    int
         """
-        if(table == DB_Tables.TOP_PC.value):
-            query = """DELETE FROM TOP_PC WHERE
-                     gid=?"""
-        elif(table == DB_Tables.TOP_PS.value):
-            query = """DELETE FROM TOP_PS WHERE
-                     gid=?"""
-        elif(table == DB_Tables.PC_WISHLIST.value):
-            query = """DELETE FROM PC_WISHLIST WHERE
-                     gid=?"""
-        elif(table == DB_Tables.PS_WISHLIST.value):
-            query = """DELETE FROM PS_WISHLIST WHERE
-                     gid=?"""
-        cur.execute(query, (id_, ))
+        with DB_Calls.transaction(cur):
+            cur.execute(f"""DELETE FROM deals WHERE {DB_Calls._IN_LIST} AND
+                        {DB_Columns.GID.value}=?""",
+                        (*DB_Calls._list(table), id_))
+            DB_Calls._invalidate_menus(cur, DB_Calls._list(table)[0])
+            DB_Calls.update_summary(cur)
 
     @staticmethod
-    def delete_game_now(cur, table, title, games):
-        """Delete game with given title from database and games list.
+    def get_longest_title(cur, table):
+        """Get the longest title from the given table, used for formatting the
+           games for rendering in the rofi window.
 
         :param cur:   database cursor
         :type cur:    cursor
-        :param table: the table to delete game from
+        :param table: the table to get longest title from
         :type table:  str
-        :param title: the title of the game to delete
+        :return:      the longest title from the table
+        :rtype:       int
+        """
+        length = cur.execute(
+            f"""SELECT MAX({DB_Columns.TITLE_LENGTH.value}) FROM deals WHERE
+                {DB_Calls._IN_LIST}""", DB_Calls._list(table)).fetchone()
+        if(length[0]):
+            return length[0]
+        return 10
+
+    @staticmethod
+    def get_cover_images(cur):
+        """Get the cover image urls of every list, for the image cache.
+
+        :param cur: database cursor
+        :type cur:  cursor
+        :return:    the urls of each platform's covers, keyed by platform
+        :rtype:     dict
+        """
+        covers = {}
+        for platform, url in cur.execute(
+                f"""SELECT DISTINCT {DB_Columns.PLATFORM.value},
+                {DB_Columns.COVER_IMAGE.value} FROM deals WHERE
+                {DB_Columns.COVER_IMAGE.value} IS NOT NULL"""):
+            covers.setdefault(platform, []).append(url)
+        return covers
+
+    @staticmethod
+    def clear_menus(cur, platform):
+        """Drop the rendered menus of the platform's lists, so they're
+           rendered again, such as once new icons have been downloaded.
+
+        :param cur:      database cursor
+        :type cur:       cursor
+        :param platform: the platform whose menus to drop
+        :type platform:  str
+        """
+        with DB_Calls.transaction(cur):
+            DB_Calls._invalidate_menus(cur, platform)
+
+    @staticmethod
+    def search_titles(cur, query, platform=None, limit=50):
+        """Search every title seen, in the lists now or before, for the
+           query. Titles are matched on the trigrams of the query, so any
+           part of a title can be searched for, then each is compared with
+           the part of its title closest to the query, so a misspelt title
+           still matches. Titles holding the query come first, those
+           starting with it before the rest, then those needing the fewest
+           edits.
+
+        :param cur:      database cursor
+        :type cur:       cursor
+        :param query:    the text to search for
+        :type query:     str
+        :param platform: only search this platform's games, defaults to None
+                         meaning both
+        :type platform:  str, optional
+        :param limit:    the most games to return, defaults to 50
+        :type limit:     int, optional
+        :return:         the matching games, best first, in the order of
+                         DB_Search_Indices
+        :rtype:          list
+        """
+        text = query.strip().lower()
+        trigrams = list(dict.fromkeys(text[i:i+3]
+                                      for i in range(len(text) - 2)))
+        in_platform = "" if(platform is None) else "AND titles.platform=?"
+        platforms = () if(platform is None) else (platform, )
+        # Too short for trigrams, match the start of the titles instead
+        if(not trigrams):
+            return cur.execute(
+                f"""SELECT {DB_Calls._SEARCH_COLUMNS} FROM titles WHERE
+                    substr(lower(title), 1, ?)=? {in_platform} ORDER BY
+                    title LIMIT ?""",
+                (len(text), text, *platforms, limit)).fetchall()
+        if(DB_Calls._has_title_search(cur)):
+            match = " OR ".join('"' + trigram.replace('"', '""') + '"'
+                                for trigram in trigrams)
+            candidates = cur.execute(
+                f"""SELECT {DB_Calls._SEARCH_COLUMNS} FROM title_search
+                    JOIN titles ON titles.id=title_search.rowid WHERE
+                    title_search MATCH ? {in_platform} ORDER BY rank LIMIT
+                    ?""", (match, *platforms, DB_Calls._SEARCH_CANDIDATES))
+        else:
+            # Without the trigram index every title is scanned, those
+            # holding the most of the query's trigrams are compared
+            shared = " + ".join(
+                ["(instr(lower(titles.title), ?) > 0)"] * len(trigrams))
+            candidates = cur.execute(
+                f"""SELECT {DB_Calls._SEARCH_COLUMNS} FROM titles WHERE
+                    {shared} > 0 {in_platform} ORDER BY {shared} DESC
+                    LIMIT ?""", (*trigrams, *platforms, *trigrams,
+                                 DB_Calls._SEARCH_CANDIDATES))
+        typos = int(len(text) * DB_Calls._SEARCH_TYPOS)
+        scored = []
+        for game in candidates:
+            title = game[DB_Search_Indices.TITLE.value].lower()
+            edits = 0 if(text in title) else DB_Calls._edits(text, title)
+            if(edits <= typos):
+                scored.append(((edits > 0, not title.startswith(text),
+                                edits, len(title)), game))
+        scored.sort(key=lambda score: score[0])
+        return [game for _, game in scored[:limit]]
+
+    @staticmethod
+    def _edits(text, title):
+        """Count the fewest characters to insert, delete or replace to turn
+           the text into any part of the title.
+
+        :param text:  the text to look for
+        :type text:   str
+        :param title: the title to look in
         :type title:  str
-        :param games: the games list holding the title
-        :type games:  list
-        :return:      the list of games without the now removed game
-        :rtype:       list
+        :return:      the number of edits
+        :rtype:       int
         """
-        for index, game in enumerate(games[table]):
-            if(game[DB_Indices.TITLE.value] == title):
-                del games[table][index]
-                DB_Calls.delete_game_with_title(cur, table, title)
-                break
-        return games
+        # Each column is where in the title the part ends, any part of the
+        # title may be skipped before it starts
+        previous = [0] * (len(title) + 1)
+        for i, char in enumerate(text, 1):
+            current = [i]
+            for j, title_char in enumerate(title, 1):
+                current.append(min(previous[j] + 1, current[j-1] + 1,
+                                   previous[j-1] + (char != title_char)))
+            previous = current
+        return min(previous)
 
     @staticmethod
-    def get_game_url(cur, table, title):
-        """Fetch a game's url given the title and table of the game.
+    def get_new_lows(cur, table):
+        """Get the ids of the games in the table whose current price is lower
+           than every price they had before.
 
         :param cur:   database cursor
         :type cur:    cursor
-        :param table: the table to search
+        :param table: the table to check
         :type table:  str
-        :param title: the title of the game to get url from
-        :type title:  str
-        :return:      the url of the game if the title exists, otherwise None
-        :rtype:       str or None
+        :return:      the ids of the games at a new low
+        :rtype:       list
         """
-        url = cur.execute(f"""SELECT {DB_Columns.URL.value} FROM {table} WHERE
-                           {DB_Columns.TITLE.value}=?""", (title, )).fetchone()
-        if(url):
-            return url[0]
-        return None
+        return [row[0] for row in cur.execute(
+            f"""SELECT {DB_Columns.GID.value} FROM deals WHERE
+                {DB_Calls._IN_LIST} AND {DB_Calls._NEW_LOW}""",
+            DB_Calls._list(table))]
 
     @staticmethod
-    def get_longest_title(cur, table):
-        """Get the longest title from the given table, used for formatting the
-           games for rendering in the rofi window.
+    def get_snapshot(cur):
+        """Read what the front ends need besides the menus, which rofi reads
+           from the menu cache: the longest title of every list and the
+           number of wishlist games at a new low.
+
+        :param cur: database cursor
+        :type cur:  cursor
+        :return:    a dictionary with title_lengths and new_lows keys
+        :rtype:     dict
+        """
+        return {
+            "title_lengths": {
+                table.value: DB_Calls.get_longest_title(cur, table.value)
+                for table in DB_Tables},
+            "new_lows": sum(len(DB_Calls.get_new_lows(cur, table.value))
+                            for table in (DB_Tables.PC_WISHLIST,
+                                          DB_Tables.PS_WISHLIST))
+        }
+
+    @staticmethod
+    def update_summary(cur):
+        """Recompute the one row summary of the wishlists that polybar shows,
+           called after every write to the deals.
+
+        :param cur: database cursor
+        :type cur:  cursor
+        """
+        cur.execute(
+            f"""INSERT OR REPLACE INTO summary SELECT 1,
+                COUNT(*), IFNULL(SUM({DB_Columns.SALE_PRICE.value} <
+                {DB_Columns.FULL_PRICE.value}), 0),
+                IFNULL(MAX(CAST(ROUND(100 - {DB_Columns.SALE_PRICE.value} *
+                100 / {DB_Columns.FULL_PRICE.value}) AS INTEGER)), 0),
+                IFNULL(SUM({DB_Calls._NEW_LOW}), 0) FROM deals WHERE
+                {DB_Columns.LIST_KIND.value}=? AND
+                {DB_Columns.FULL_PRICE.value} > 0""",
+            (DB_List_Kinds.WISHLIST.value, ))
+
+    @staticmethod
+    def get_menu(cur, table):
+        """Get the rendered rofi menu of the list and the records of its rows.
 
         :param cur:   database cursor
         :type cur:    cursor
-        :param table: the table to get longest title from
+        :param table: the list to get the menu of
         :type table:  str
-        :return:      the longest title from the table
-        :rtype:       int
+        :return:      the menu and records, or None if the list has changed
+                      since it was last rendered
+        :rtype:       tuple or None
         """
-        length = cur.execute(
-            f"""SELECT {DB_Columns.TITLE_LENGTH.value} FROM {table} ORDER BY
-             {DB_Columns.TITLE_LENGTH.value} DESC""").fetchone()
-        if(length):
-            return length[0]
-        return 10
+        row = cur.execute(f"""SELECT menu, records FROM menu_cache WHERE
+                          {DB_Calls._IN_LIST}""",
+                          DB_Calls._list(table)).fetchone()
+        if(row):
+            return row[0], json.loads(row[1])
+        return None
+
+    @staticmethod
+    def set_menu(cur, table, menu, records):
+        """Store the rendered rofi menu of the list, until the list changes.
+
+        :param cur:     database cursor
+        :type cur:      cursor
+        :param table:   the list the menu is of
+        :type table:    str
+        :param menu:    the rendered menu
+        :type menu:     bytes
+        :param records: the record of each row in the menu, in order
+        :type records:  list
+        """
+        with DB_Calls.transaction(cur):
+            cur.execute(
+                "INSERT OR REPLACE INTO menu_cache VALUES(?, ?, ?, ?)",
+                (*DB_Calls._list(table), menu, json.dumps(records)))
 
     @staticmethod
     def needs_updating(cur, table, update_delay):
@@ -338,48 +576,103 @@ class DB_Calls:
         :return:             True if it needs updating, False otherwise
         :rtype:              bool
         """
-        try:
-            past_time = DB_Calls._str_to_dt(cur.execute(
-                f"""SELECT {DB_Columns.UPDATE_TIME.value} FROM
-                    {table}""").fetchone()[0])
-        except Exception:
+        past_time = cur.execute(
+            f"""SELECT refreshed FROM list_refresh WHERE
+                {DB_Calls._IN_LIST}""", DB_Calls._list(table)).fetchone()
+        if(past_time is None):
             return True
-        return ((datetime.now() - past_time) > update_delay)
+        return ((datetime.now() - DB_Calls._str_to_dt(past_time[0])) >
+                update_delay)
 
     @staticmethod
-    def wishlist_needs_updating(cur, table, update_delay):
+    def get_list_source(cur, table):
+        """Get the fingerprint of the pages the table was last fully
+           refreshed from.
+
+        :param cur:   database cursor
+        :type cur:    cursor
+        :param table: the table to check
+        :type table:  str
+        :return:      the fingerprint, or None if it isn't known
+        :rtype:       str or None
+        """
+        row = cur.execute(f"""SELECT source FROM list_refresh WHERE
+                          {DB_Calls._IN_LIST}""",
+                          DB_Calls._list(table)).fetchone()
+        return row[0] if(row) else None
+
+    @staticmethod
+    def set_list_source(cur, table, urls):
+        """Record the pages the table was just fully refreshed from.
+
+        :param cur:   database cursor
+        :type cur:    cursor
+        :param table: the table that was refreshed
+        :type table:  str
+        :param urls:  the urls of the pages
+        :type urls:   list
+        """
+        with DB_Calls.transaction(cur):
+            cur.execute(f"""UPDATE list_refresh SET source=? WHERE
+                        {DB_Calls._IN_LIST}""",
+                        (DB_Calls.source_of(urls), *DB_Calls._list(table)))
+
+    @staticmethod
+    def source_of(urls):
+        """Fingerprint the set of pages a list is fetched from.
+
+        :param urls: the urls of the pages
+        :type urls:  list
+        :return:     the fingerprint
+        :rtype:      str
+        """
+        return hashlib.sha256(
+            "\n".join(sorted(urls)).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def wishlist_needs_updating(cur, table, budget=None):
         """Determines which individual games from the table need updating.
+           Each game is due once its scheduled refresh time has passed, which
+           is set from how often its price has been seen to change. When
+           more games are due than the budget allows, the ones most likely to
+           have changed are chosen.
 
-        :param cur:          database cursor
-        :type cur:           cursor
-        :param table:        the table to check
-        :type table:         str
-        :param update_delay: the time that must pass before needing to update
-        :type date_str:      datetime
-        :return:             True if it needs updating, False otherwise
-        :rtype:              bool
+        :param cur:    database cursor
+        :type cur:     cursor
+        :param table:  the table to check
+        :type table:   str
+        :param budget: the most games to return, defaults to None meaning
+                       every game that's due
+        :type budget:  int, optional
+        :return:       ids of PC games or urls of Playstation games that need
+                       updating, most likely to have changed first
+        :rtype:        list
         """
+        # PC games are fetched by id, Playstation games by url
         if(table == DB_Tables.PC_WISHLIST.value):
-            try:
-                games = cur.execute(
-                    f"""SELECT {DB_Columns.GID.value},
-                        {DB_Columns.UPDATE_TIME.value} FROM
-                        {table}""").fetchall()
-            except Exception:
-                return []
-        elif(table == DB_Tables.PS_WISHLIST.value):
-            try:
-                games = cur.execute(
-                    f"""SELECT {DB_Columns.URL.value},
-                        {DB_Columns.UPDATE_TIME.value} FROM
-                        {table}""").fetchall()
-            except Exception:
-                return []
-        games_to_update = []
-        for game in games:
-            if((datetime.now() - DB_Calls._str_to_dt(game[1])) > update_delay):
-                games_to_update.append(game[0])
-        return games_to_update
+            column = DB_Columns.GID.value
+        else:
+            column = DB_Columns.URL.value
+        now = int(time.time())
+        return [row[0] for row in cur.execute(
+            f"""SELECT deals.{column} FROM deals LEFT JOIN refresh_schedule
+                AS schedule ON schedule.platform=deals.platform AND
+                schedule.gid=deals.gid WHERE deals.{DB_Calls._IN_LIST} AND
+                IFNULL(next_refresh, 0) <= ? ORDER BY
+                {DB_Calls._EXPECTED_CHANGES} DESC LIMIT ?""",
+            (*DB_Calls._list(table), now, now,
+             -1 if(budget is None) else budget))]
+
+    @staticmethod
+    def _list(table):
+        """Get the platform and list kind that make up the table.
+
+        :param table: the table name, a DB_Tables value
+        :type table:  str
+        :return:      the platform and list kind values
+        :rtype:       tuple
+        """
+        return DB_Calls._LISTS[table]
 
     @staticmethod
     def _str_to_dt(date_str):
@@ -393,46 +686,387 @@ class DB_Calls:
         return datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S.%f")
 
     @staticmethod
-    def _add_game(cur, table, game):
-        """Add the game to the given table.
+    def _delete_gids(cur, table, gids):
+        """Delete the games with the given ids, _MAX_VARIABLES at a time.
 
         :param cur:   database cursor
         :type cur:    cursor
-        :param table: the table to add the game to
+        :param table: the table to delete the games from
         :type table:  str
-        :param game:  the game dictionary to add to the table
-        :type game:   dict
+        :param gids:  the ids of the games to delete
+        :type gids:   list
         """
-        cur.execute(f"""INSERT INTO {table} VALUES(
-                    ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (game[DB_Columns.TITLE.value],
-                        game[DB_Columns.FULL_PRICE.value],
-                        game[DB_Columns.SALE_PRICE.value],
-                        game[DB_Columns.COVER_IMAGE.value],
-                        game[DB_Columns.URL.value],
-                        game[DB_Columns.GID.value],
-                        datetime.now(),
-                        len(game[DB_Columns.TITLE.value])))
+        for i in range(0, len(gids), DB_Calls._MAX_VARIABLES):
+            chunk = gids[i:i+DB_Calls._MAX_VARIABLES]
+            cur.execute(f"""DELETE FROM deals WHERE {DB_Calls._IN_LIST} AND
+                        {DB_Columns.GID.value} IN
+                        ({",".join("?" * len(chunk))})""",
+                        (*DB_Calls._list(table), *chunk))
+        if(gids):
+            DB_Calls._invalidate_menus(cur, DB_Calls._list(table)[0])
 
     @staticmethod
-    def _update_game(cur, table, game):
-        """Update the game in the given table.
+    def _write_changes(cur, table, games, remove_missing,
+                       mark_refreshed=True):
+        """Compare the games with the table and write only what differs.
+           Each game's content hash is compared with the stored one, games
+           with a matching hash are left untouched.
+
+        :param cur:            database cursor
+        :type cur:             cursor
+        :param table:          the table to write to
+        :type table:           str
+        :param games:          the game dictionaries to write, any without
+                               an id are skipped
+        :type games:           list
+        :param remove_missing: whether games in the table that aren't in
+                               games are deleted
+        :type remove_missing:  bool
+        :param mark_refreshed: whether the table is marked refreshed,
+                               defaults to True
+        :type mark_refreshed:  bool, optional
+        :return:               the ids of the games in each kind of change,
+                               keyed by DB_Changes value
+        :rtype:                dict
+        """
+        platform, list_kind = DB_Calls._list(table)
+        stored = {str(gid): (content_hash, sale_price, full_price)
+                  for gid, content_hash, sale_price, full_price in
+                  cur.execute(
+                      f"""SELECT {DB_Columns.GID.value},
+                          {DB_Columns.CONTENT_HASH.value},
+                          {DB_Columns.SALE_PRICE.value},
+                          {DB_Columns.FULL_PRICE.value} FROM deals WHERE
+                          {DB_Calls._IN_LIST} AND {DB_Columns.GID.value} IS
+                          NOT NULL""", (platform, list_kind))}
+        # The last of any repeated game wins, as it would when upserting.
+        # Games without an id can't be told apart, so they're skipped
+        games = list({str(game[DB_Columns.GID.value]): game
+                      for game in games
+                      if(game[DB_Columns.GID.value] is not None)}.values())
+        changes = {change.value: [] for change in DB_Changes}
+        writes = []
+        for game in games:
+            gid = str(game[DB_Columns.GID.value])
+            content_hash = DB_Calls._content_hash(game)
+            if(gid not in stored):
+                change = DB_Changes.ADDED
+            elif(stored[gid][0] == content_hash):
+                continue
+            elif(not (DB_Calls._cents(stored[gid][1]),
+                      DB_Calls._cents(stored[gid][2])) == (
+                    DB_Calls._cents(game[DB_Columns.SALE_PRICE.value]),
+                    DB_Calls._cents(game[DB_Columns.FULL_PRICE.value]))):
+                change = DB_Changes.PRICE_CHANGED
+            else:
+                change = DB_Changes.METADATA_CHANGED
+            changes[change.value].append(gid)
+            writes.append((game, content_hash))
+        if(remove_missing):
+            new_gids = set(str(game[DB_Columns.GID.value]) for game in games)
+            changes[DB_Changes.REMOVED.value] = [
+                gid for gid in stored if(gid not in new_gids)]
+            DB_Calls._delete_gids(cur, table,
+                                  changes[DB_Changes.REMOVED.value])
+        priced = set(changes[DB_Changes.ADDED.value] +
+                     changes[DB_Changes.PRICE_CHANGED.value])
+        DB_Calls._record_prices(cur, platform, [
+            game for game, _ in writes
+            if(str(game[DB_Columns.GID.value]) in priced)])
+        DB_Calls._upsert_games(cur, table, writes)
+        DB_Calls._index_titles(cur, platform, [game for game, _ in writes])
+        if(list_kind == DB_List_Kinds.WISHLIST.value):
+            DB_Calls._schedule(cur, platform, [
+                game[DB_Columns.GID.value] for game in games],
+                set(changes[DB_Changes.PRICE_CHANGED.value]))
+        if(any(changes.values())):
+            DB_Calls._invalidate_menus(cur, platform)
+            DB_Calls.update_summary(cur)
+        if(mark_refreshed):
+            DB_Calls._mark_refreshed(cur, table)
+        return changes
+
+    @staticmethod
+    def _content_hash(game):
+        """Hash the parts of a game that are shown or linked to.
+
+        :param game: the game dictionary to hash
+        :type game:  dict
+        :return:     the hex digest of the game's content
+        :rtype:      str
+        """
+        return hashlib.sha1("\x1f".join(
+            str(game[column.value]) for column in DB_Calls._HASHED_COLUMNS
+        ).encode("UTF-8")).hexdigest()
+
+    @staticmethod
+    def _mark_refreshed(cur, table):
+        """Record that the table was just refreshed from its source.
 
         :param cur:   database cursor
         :type cur:    cursor
-        :param table: the table to update the game in
+        :param table: the table that was refreshed
         :type table:  str
-        :param game:  the game dictionary to update in the table
-        :type game:   dict
-        """
-        cur.execute(f"""UPDATE {table} SET
-                    {DB_Columns.FULL_PRICE.value}=?,
-                    {DB_Columns.SALE_PRICE.value}=?,
-                    {DB_Columns.URL.value}=?,
-                    {DB_Columns.UPDATE_TIME.value}=?
-                    WHERE {DB_Columns.GID.value}=?""",
-                    (game[DB_Columns.FULL_PRICE.value],
-                        game[DB_Columns.SALE_PRICE.value],
-                        game[DB_Columns.URL.value],
-                        datetime.now(),
-                        game[DB_Columns.GID.value]))
+        """
+        cur.execute("""INSERT INTO list_refresh(platform, list_kind,
+                    refreshed) VALUES(?, ?, ?) ON CONFLICT(platform,
+                    list_kind) DO UPDATE SET refreshed=excluded.refreshed""",
+                    (*DB_Calls._list(table), datetime.now()))
+
+    @staticmethod
+    def _upsert_games(cur, table, writes):
+        """Insert the games into the table, or update them if a game with the
+           same id is already in it.
+
+        :param cur:    database cursor
+        :type cur:     cursor
+        :param table:  the table to add the games to
+        :type table:   str
+        :param writes: (game dictionary, content hash) pairs to write
+        :type writes:  list
+        """
+        now = datetime.now()
+        platform, list_kind = DB_Calls._list(table)
+        cur.executemany(
+            f"""INSERT INTO deals({DB_Columns.PLATFORM.value},
+                {DB_Columns.LIST_KIND.value}, {DB_Calls._GAME_COLUMNS},
+                {DB_Columns.CONTENT_HASH.value}, {DB_Columns.REGION.value})
+                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT({DB_Columns.PLATFORM.value},
+                {DB_Columns.LIST_KIND.value}, {DB_Columns.GID.value})
+                DO UPDATE SET
+                {DB_Columns.TITLE.value}=excluded.{DB_Columns.TITLE.value},
+                {DB_Columns.FULL_PRICE.value}=
+                    excluded.{DB_Columns.FULL_PRICE.value},
+                {DB_Columns.SALE_PRICE.value}=
+                    excluded.{DB_Columns.SALE_PRICE.value},
+                {DB_Columns.COVER_IMAGE.value}=
+                    excluded.{DB_Columns.COVER_IMAGE.value},
+                {DB_Columns.URL.value}=excluded.{DB_Columns.URL.value},
+                {DB_Columns.UPDATE_TIME.value}=
+                    excluded.{DB_Columns.UPDATE_TIME.value},
+                {DB_Columns.TITLE_LENGTH.value}=
+                    excluded.{DB_Columns.TITLE_LENGTH.value},
+                {DB_Columns.CONTENT_HASH.value}=
+                    excluded.{DB_Columns.CONTENT_HASH.value},
+                {DB_Columns.REGION.value}=
+                    excluded.{DB_Columns.REGION.value}""",
+            [(platform,
+              list_kind,
+              game[DB_Columns.TITLE.value],
+              game[DB_Columns.FULL_PRICE.value],
+              game[DB_Columns.SALE_PRICE.value],
+              game[DB_Columns.COVER_IMAGE.value],
+              game[DB_Columns.URL.value],
+              game[DB_Columns.GID.value],
+              now,
+              len(game[DB_Columns.TITLE.value]),
+              content_hash,
+              game[DB_Columns.REGION.value]) for game, content_hash in
+             writes])
+
+    @staticmethod
+    def _index_titles(cur, platform, games):
+        """Add new games to the title index and update the ones whose title
+           or url has changed. Games are never removed, so their titles can
+           still be searched for once they've left the lists.
+
+        :param cur:      database cursor
+        :type cur:       cursor
+        :param platform: the platform the games are from
+        :type platform:  str
+        :param games:    the game dictionaries being written
+        :type games:     list
+        """
+        games = {str(game[DB_Columns.GID.value]): game for game in games
+                 if(game[DB_Columns.GID.value] is not None)}
+        gids = list(games)
+        stored = {}
+        for i in range(0, len(gids), DB_Calls._MAX_VARIABLES):
+            chunk = gids[i:i+DB_Calls._MAX_VARIABLES]
+            for id_, gid, title, url in cur.execute(
+                    f"""SELECT id, gid, title, url FROM titles WHERE
+                        platform=? AND gid IN
+                        ({",".join("?" * len(chunk))})""",
+                    (platform, *chunk)):
+                stored[str(gid)] = (id_, title, url)
+        added = []
+        renamed = []
+        moved = []
+        for gid, game in games.items():
+            title = game[DB_Columns.TITLE.value]
+            url = game[DB_Columns.URL.value]
+            if(gid not in stored):
+                added.append((platform, gid, title, url))
+            elif(not stored[gid][1] == title):
+                renamed.append((stored[gid][0], stored[gid][1], title, url))
+            elif(not stored[gid][2] == url):
+                moved.append((url, stored[gid][0]))
+        cur.executemany("""INSERT INTO titles(platform, gid, title, url)
+                        VALUES(?, ?, ?, ?)""", added)
+        cur.executemany("UPDATE titles SET title=?, url=? WHERE id=?",
+                        [(title, url, id_) for id_, _, title, url in renamed])
+        cur.executemany("UPDATE titles SET url=? WHERE id=?", moved)
+        if(not DB_Calls._has_title_search(cur)):
+            return
+        added = [row[1] for row in added]
+        for i in range(0, len(added), DB_Calls._MAX_VARIABLES):
+            chunk = added[i:i+DB_Calls._MAX_VARIABLES]
+            cur.execute(f"""INSERT INTO title_search(rowid, title) SELECT id,
+                        title FROM titles WHERE platform=? AND gid IN
+                        ({",".join("?" * len(chunk))})""", (platform, *chunk))
+        # The index only forgets a title when given the one it has
+        cur.executemany("""INSERT INTO title_search(title_search, rowid,
+                        title) VALUES('delete', ?, ?)""",
+                        [(id_, old) for id_, old, _, _ in renamed])
+        cur.executemany("INSERT INTO title_search(rowid, title) VALUES(?, ?)",
+                        [(id_, title) for id_, _, title, _ in renamed])
+
+    @staticmethod
+    def trigram_index_supported(cur):
+        """Determines if SQLite can keep the trigram index of the titles,
+           which needs FTS5 and SQLite 3.34 or newer.
+
+        :param cur: database cursor
+        :type cur:  cursor
+        :return:    True if the index can be created
+        :rtype:     bool
+        """
+        if(sqlite3.sqlite_version_info < (3, 34, 0)):
+            return False
+        return bool(cur.execute(
+            "SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0])
+
+    @staticmethod
+    def _has_title_search(cur):
+        """Determines if the database has the trigram index of the titles.
+
+        :param cur: database cursor
+        :type cur:  cursor
+        :return:    True if the index exists
+        :rtype:     bool
+        """
+        return cur.execute("""SELECT 1 FROM sqlite_master WHERE
+                           name='title_search'""").fetchone() is not None
+
+    @staticmethod
+    def _invalidate_menus(cur, platform):
+        """Drop the rendered menus of the platform's lists. Both lists are
+           dropped, as they share the price history shown in the menus.
+
+        :param cur:      database cursor
+        :type cur:       cursor
+        :param platform: the platform whose lists have changed
+        :type platform:  str
+        """
+        cur.execute(f"""DELETE FROM menu_cache WHERE
+                    {DB_Columns.PLATFORM.value}=?""", (platform, ))
+
+    @staticmethod
+    def _record_prices(cur, platform, games):
+        """Append a point to the price history of every game whose price is
+           different from its latest point, or that has no history yet.
+           Placeholder prices are left out, they aren't prices the game was
+           seen at.
+
+        :param cur:      database cursor
+        :type cur:       cursor
+        :param platform: the platform the games are from
+        :type platform:  str
+        :param games:    the game dictionaries being written
+        :type games:     list
+        """
+        gids = list(dict.fromkeys(
+            str(game[DB_Columns.GID.value]) for game in games))
+        latest = {}
+        for i in range(0, len(gids), DB_Calls._MAX_VARIABLES):
+            chunk = gids[i:i+DB_Calls._MAX_VARIABLES]
+            # Ordered oldest first so each game is left with its latest point
+            for gid, sale_cents, full_cents in cur.execute(
+                    f"""SELECT gid, sale_cents, full_cents FROM price_history
+                        WHERE platform=? AND gid IN
+                        ({",".join("?" * len(chunk))}) ORDER BY time, rowid""",
+                    (platform, *chunk)):
+                latest[str(gid)] = (sale_cents, full_cents)
+        now = int(time.time())
+        points = {}
+        for game in games:
+            gid = str(game[DB_Columns.GID.value])
+            prices = (DB_Calls._cents(game[DB_Columns.SALE_PRICE.value]),
+                      DB_Calls._cents(game[DB_Columns.FULL_PRICE.value]))
+            if(platform == DB_Platforms.PS.value and
+               prices[0] == DB_Calls._PS_PLUS_CENTS):
+                continue
+            if(not latest.get(gid) == prices):
+                latest[gid] = prices
+                points[gid] = (platform, gid, now, *prices)
+        cur.executemany("INSERT INTO price_history VALUES(?, ?, ?, ?, ?)",
+                        points.values())
+
+    @staticmethod
+    def _schedule(cur, platform, gids, changed):
+        """Record a check of each wishlist game and schedule its next one.
+           A game's rate of change is its observed changes over the time it
+           has been watched, starting from one change per _PRIOR_INTERVAL,
+           and it's next checked after the time it takes to change once at
+           that rate.
+
+        :param cur:      database cursor
+        :type cur:       cursor
+        :param platform: the platform the games are from
+        :type platform:  str
+        :param gids:     the ids of the games that were checked
+        :type gids:      list
+        :param changed:  the ids of the checked games whose price changed
+        :type changed:   set
+        """
+        gids = list(dict.fromkeys(str(gid) for gid in gids
+                                  if(gid is not None)))
+        now = int(time.time())
+        history = {}
+        for i in range(0, len(gids), DB_Calls._MAX_VARIABLES):
+            chunk = gids[i:i+DB_Calls._MAX_VARIABLES]
+            for gid, checked, observed, changes in cur.execute(
+                    f"""SELECT gid, checked, observed, changes FROM
+                        refresh_schedule WHERE platform=? AND gid IN
+                        ({",".join("?" * len(chunk))})""",
+                    (platform, *chunk)):
+                history[str(gid)] = (checked, observed, changes)
+        rows = []
+        for gid in gids:
+            checked, observed, changes = history.get(gid, (now, 0, 0))
+            observed += now - checked
+            changes += gid in changed
+            interval = (observed + DB_Calls._PRIOR_INTERVAL) / (changes + 1)
+            interval = min(max(interval, DB_Calls._MIN_INTERVAL),
+                           DB_Calls._MAX_INTERVAL)
+            rows.append((platform, gid, now, observed, changes,
+                         now + math.ceil(interval)))
+        cur.executemany("""INSERT OR REPLACE INTO refresh_schedule
+                        VALUES(?, ?, ?, ?, ?, ?)""", rows)
+
+    @staticmethod
+    def _cents(price):
+        """Convert a price in dollars to integer cents.
+
+        :param price: the price in dollars
+        :type price:  float or str or None
+        :return:      the price in cents, or None if there is no price
+        :rtype:       int or None
+        """
+        if(price is None):
+            return None
+        return round(float(price) * 100)
+
+    @staticmethod
+    def _dollars(cents):
+        """Convert a price in integer cents to dollars.
+
+        :param cents: the price in cents
+        :type cents:  int or None
+        :return:      the price in dollars, or None if there is no price
+        :rtype:       float or None
+        """
+        if(cents is None):
+            return None
+        return cents / 100
@@ -15,6 +15,16 @@ class DB_Tables(Enum):
     PS_WISHLIST = "PS_WISHLIST"
 
 
+class DB_Platforms(Enum):
+    PC = "PC"
+    PS = "PS"
+
+
+class DB_List_Kinds(Enum):
+    TOP = "TOP"
+    WISHLIST = "WISHLIST"
+
+
 class DB_Indices(Enum):
     TITLE = 0
     FULL_PRICE = 1
@@ -24,6 +34,17 @@ class DB_Indices(Enum):
     GID = 5
     UPDATE_TIME = 6
     TITLE_LENGTH = 7
+    LOWEST_PRICE = 8
+    REGION = 9
+    RECENT_LOW = 10
+
+
+class DB_Search_Indices(Enum):
+    PLATFORM = 0
+    GID = 1
+    TITLE = 2
+    URL = 3
+    SALE_PRICE = 4
 
 
 class DB_Columns(Enum):
@@ -35,3 +56,16 @@ class DB_Columns(Enum):
     GID = "gid"
     URL = "url"
     TITLE_LENGTH = "title_length"
+    LOWEST_PRICE = "lowest_price"
+    RECENT_LOW = "recent_low"
+    PLATFORM = "platform"
+    LIST_KIND = "list_kind"
+    CONTENT_HASH = "content_hash"
+    REGION = "region"
+
+
+class DB_Changes(Enum):
+    ADDED = "added"
+    REMOVED = "removed"
+    PRICE_CHANGED = "price_changed"
+    METADATA_CHANGED = "metadata_changed"
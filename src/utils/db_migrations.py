@@ -0,0 +1,307 @@
+#!/usr/bin/python3
+
+'''
+  The forward migrations of the database schema. Each migration is applied
+  once, in order, and the number applied is kept in the schema_version table,
+  so an existing games.db is converted in place the next time it's opened.
+'''
+
+from src.utils.db_enums import DB_Tables, DB_Platforms, DB_List_Kinds
+from src.utils.db_calls import DB_Calls
+
+
+def _unified_deals(cur):
+    """Move the four per-list tables into one deals table, with the platform
+       and list kind as columns and indexes for the lookups that are made.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("""CREATE TABLE deals(
+                platform TEXT NOT NULL,
+                list_kind TEXT NOT NULL,
+                title TEXT NOT NULL,
+                full_price REAL,
+                sale_price REAL,
+                cover_image TEXT,
+                url TEXT NOT NULL,
+                gid INTEGER,
+                update_time TEXT,
+                title_length INTEGER)""")
+    cur.execute("""CREATE UNIQUE INDEX deals_gid ON
+                deals(platform, list_kind, gid)""")
+    cur.execute("""CREATE UNIQUE INDEX deals_url ON
+                deals(platform, list_kind, url)""")
+    cur.execute("""CREATE INDEX deals_title ON
+                deals(platform, list_kind, title)""")
+    cur.execute("""CREATE INDEX deals_sale_price ON
+                deals(platform, list_kind, sale_price)""")
+    old_tables = {
+        DB_Tables.TOP_PC.value: (DB_Platforms.PC, DB_List_Kinds.TOP),
+        DB_Tables.TOP_PS.value: (DB_Platforms.PS, DB_List_Kinds.TOP),
+        DB_Tables.PC_WISHLIST.value: (DB_Platforms.PC,
+                                      DB_List_Kinds.WISHLIST),
+        DB_Tables.PS_WISHLIST.value: (DB_Platforms.PS,
+                                      DB_List_Kinds.WISHLIST)
+    }
+    for table, (platform, list_kind) in old_tables.items():
+        if(cur.execute("""SELECT name FROM sqlite_master WHERE type='table'
+                       AND name=?""", (table, )).fetchone()):
+            cur.execute(f"""INSERT INTO deals SELECT ?, ?, title, full_price,
+                        sale_price, cover_image, url, gid, update_time,
+                        title_length FROM {table}""",
+                        (platform.value, list_kind.value))
+            cur.execute(f"DROP TABLE {table}")
+
+
+def _price_history(cur):
+    """Add the append-only price history, seeded with the current prices.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("""CREATE TABLE price_history(
+                platform TEXT NOT NULL,
+                gid INTEGER NOT NULL,
+                time INTEGER NOT NULL,
+                sale_cents INTEGER,
+                full_cents INTEGER)""")
+    cur.execute("""CREATE INDEX price_history_gid_time ON
+                price_history(platform, gid, time)""")
+    cur.execute("""INSERT INTO price_history SELECT platform, gid,
+                CAST(strftime('%s', 'now') AS INTEGER),
+                CAST(ROUND(MIN(sale_price) * 100) AS INTEGER),
+                CAST(ROUND(MAX(full_price) * 100) AS INTEGER)
+                FROM deals WHERE gid IS NOT NULL GROUP BY platform, gid""")
+
+
+def _summary(cur):
+    """Add the summary row that polybar reads without loading the deals.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("""CREATE TABLE summary(
+                id INTEGER PRIMARY KEY CHECK(id = 1),
+                wishlist_games INTEGER NOT NULL,
+                on_sale INTEGER NOT NULL,
+                best_discount INTEGER NOT NULL,
+                new_lows INTEGER NOT NULL)""")
+    # The summary as computed at this version, later changes to how it's
+    # computed must not change what this migration does
+    cur.execute("""INSERT OR REPLACE INTO summary SELECT 1, COUNT(*),
+                IFNULL(SUM(sale_price < full_price), 0),
+                IFNULL(MAX(CAST(ROUND(100 - sale_price * 100 / full_price)
+                AS INTEGER)), 0),
+                IFNULL(SUM((SELECT sale_cents FROM price_history AS latest
+                WHERE latest.platform=deals.platform AND
+                latest.gid=deals.gid ORDER BY time DESC, rowid DESC LIMIT 1)
+                < (SELECT MIN(sale_cents) FROM price_history AS earlier
+                WHERE earlier.platform=deals.platform AND
+                earlier.gid=deals.gid AND earlier.rowid!=(SELECT rowid FROM
+                price_history AS latest WHERE latest.platform=deals.platform
+                AND latest.gid=deals.gid ORDER BY time DESC, rowid DESC
+                LIMIT 1))), 0) FROM deals WHERE list_kind=? AND
+                full_price > 0""", (DB_List_Kinds.WISHLIST.value, ))
+
+
+def _menu_cache(cur):
+    """Add the cache of rendered rofi menus, one row per list.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("""CREATE TABLE menu_cache(
+                platform TEXT NOT NULL,
+                list_kind TEXT NOT NULL,
+                menu BLOB NOT NULL,
+                PRIMARY KEY(platform, list_kind))""")
+
+
+def _menu_records(cur):
+    """Keep the record of every row alongside each rendered menu, so rofi can
+       return the index of the chosen row. Menus rendered before now have no
+       records and are dropped.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("DELETE FROM menu_cache")
+    cur.execute("""ALTER TABLE menu_cache ADD COLUMN records TEXT NOT NULL
+                DEFAULT '[]'""")
+
+
+def _refresh_schedule(cur):
+    """Add the refresh schedule of the wishlist games, starting each game off
+       with the fixed 12 hour delay that was used before.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("""CREATE TABLE refresh_schedule(
+                platform TEXT NOT NULL,
+                gid INTEGER NOT NULL,
+                checked INTEGER NOT NULL,
+                observed INTEGER NOT NULL,
+                changes INTEGER NOT NULL,
+                next_refresh INTEGER NOT NULL,
+                PRIMARY KEY(platform, gid))""")
+    cur.execute("""INSERT OR IGNORE INTO refresh_schedule SELECT platform,
+                gid, checked, 0, 0, checked + 12*60*60 FROM (SELECT platform,
+                gid, CAST(strftime('%s', update_time, 'utc') AS INTEGER) AS
+                checked FROM deals WHERE list_kind=? AND gid IS NOT NULL AND
+                update_time IS NOT NULL)""",
+                (DB_List_Kinds.WISHLIST.value, ))
+
+
+def _change_sets(cur):
+    """Add the content hash of each game, so unchanged games can be skipped
+       when writing, and the time each list was last refreshed, which used
+       to be read from the games' update times.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("ALTER TABLE deals ADD COLUMN content_hash TEXT")
+    cur.execute("""CREATE TABLE list_refresh(
+                platform TEXT NOT NULL,
+                list_kind TEXT NOT NULL,
+                refreshed TEXT NOT NULL,
+                PRIMARY KEY(platform, list_kind))""")
+    cur.execute("""INSERT INTO list_refresh SELECT platform, list_kind,
+                MAX(update_time) FROM deals WHERE update_time IS NOT NULL
+                GROUP BY platform, list_kind""")
+
+
+def _regions(cur):
+    """Add the region of the store each deal is from, read out of the urls
+       of the Playstation deals. PC deals aren't tied to a region.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("""ALTER TABLE deals ADD COLUMN region TEXT NOT NULL
+                DEFAULT ''""")
+    cur.execute("""UPDATE deals SET region=substr(url, instr(url, '-store/')
+                - 2, 2) WHERE platform=? AND instr(url, '-store/') > 2""",
+                (DB_Platforms.PS.value, ))
+
+
+def _title_index(cur):
+    """Add the index of every title seen, which keeps a game's title after
+       it has left the lists so it can still be searched for. It's seeded
+       with the games in the lists now, the price history has no titles.
+       The trigram index of the titles is only added when SQLite supports
+       it, otherwise searches scan the titles.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("""CREATE TABLE titles(
+                id INTEGER PRIMARY KEY,
+                platform TEXT NOT NULL,
+                gid INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                UNIQUE(platform, gid))""")
+    cur.execute("""INSERT OR IGNORE INTO titles(platform, gid, title, url)
+                SELECT platform, gid, title, url FROM deals WHERE gid IS NOT
+                NULL""")
+    if(not DB_Calls.trigram_index_supported(cur)):
+        return
+    # Trigrams match any part of a title, and misspelt titles still share
+    # most of their trigrams with the real one
+    cur.execute("""CREATE VIRTUAL TABLE title_search USING fts5(title,
+                content='titles', content_rowid='id', tokenize='trigram')""")
+    cur.execute("INSERT INTO title_search(title_search) VALUES('rebuild')")
+
+
+def _deals_url_not_unique(cur):
+    """Let a game's url be shared with another row while the game's id
+       changes, so the upsert keyed on the id doesn't fail on the url. The
+       url is still indexed for looking games up by it.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("DROP INDEX deals_url")
+    cur.execute("""CREATE INDEX deals_url ON
+                deals(platform, list_kind, url)""")
+
+
+def _deals_platform_gid(cur):
+    """Index the deals by platform and id across both lists, for looking up
+       the prices of the titles a search finds.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("""CREATE INDEX deals_platform_gid ON
+                deals(platform, gid)""")
+
+
+def _list_sources(cur):
+    """Add the fingerprint of the pages each top deals list was last fully
+       fetched from, so a list is fetched in full and swept when the pages
+       asked for change. Lists refreshed before now have none, so they're
+       fetched in full once.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    cur.execute("ALTER TABLE list_refresh ADD COLUMN source TEXT")
+
+
+def _no_placeholder_prices(cur):
+    """Drop the points of the price PS+ only deals are stored at from the
+       price history, which were recorded as if the games sold for it.
+
+    :param cur: database cursor
+    :type cur:  cursor
+    """
+    # The placeholder as stored at this version
+    cur.execute("""DELETE FROM price_history WHERE platform=? AND
+                sale_cents=9999""", (DB_Platforms.PS.value, ))
+
+
+# Never reorder or remove a migration, only append new ones
+MIGRATIONS = [
+    _unified_deals,
+    _price_history,
+    _summary,
+    _menu_cache,
+    _menu_records,
+    _refresh_schedule,
+    _change_sets,
+    _regions,
+    _title_index,
+    _deals_url_not_unique,
+    _deals_platform_gid,
+    _list_sources,
+    _no_placeholder_prices,
+]
+
+
+class DB_Migrations:
+    @staticmethod
+    def migrate(cur):
+        """Apply every migration the database hasn't had yet, each in its own
+           transaction.
+
+        :param cur: database cursor
+        :type cur:  cursor
+        :return:    the schema version of the database
+        :rtype:     int
+        """
+        cur.execute("""CREATE TABLE IF NOT EXISTS schema_version(
+                    version INTEGER NOT NULL)""")
+        row = cur.execute("SELECT version FROM schema_version").fetchone()
+        version = row[0] if(row) else 0
+        for number, migration in enumerate(MIGRATIONS[version:], version+1):
+            with DB_Calls.transaction(cur, "migration"):
+                migration(cur)
+                cur.execute("DELETE FROM schema_version")
+                cur.execute("INSERT INTO schema_version VALUES(?)",
+                            (number, ))
+            version = number
+        return version
@@ -0,0 +1,23 @@
+#!/usr/bin/python3
+
+'''
+  Helpers for the caches kept on disk, which may be written by several
+  threads and read by other runs at any time.
+'''
+
+import os
+import threading
+
+
+def write_atomically(path, data):
+    """Atomically write data to the path, so it's never read half written.
+
+    :param path: the file to write
+    :type path:  str
+    :param data: the data to write
+    :type data:  bytes
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+
+'''
+  A persistent cache of response bodies and their validators (ETag and
+  Last-Modified), keyed by url. The validators are sent with the next request
+  for the same url so an unchanged page comes back as a body-less 304.
+'''
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from src.utils.files import write_atomically
+
+
+class Cached_Response:
+    def __init__(self, content, encoding, headers):
+        """A stand-in for a response whose body came from the cache.
+
+        :param content:  the cached body
+        :type content:   bytes
+        :param encoding: the encoding of the cached body
+        :type encoding:  str or None
+        :param headers:  the headers of the cached response
+        :type headers:   dict
+        """
+        self.content = content
+        self.encoding = encoding
+        self.headers = headers
+        self.status_code = 304
+        self.not_modified = True
+
+    def __bool__(self):
+        return True
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class HTTP_Cache:
+    _DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__)))), "cache", "http")
+    _MAX_SIZE = 50 * 1024 * 1024  # the most bytes of bodies to keep
+    _MAX_AGE = 7 * 24 * 60 * 60  # seconds before an unused entry is dropped
+    _lock = threading.Lock()
+    # The entries waiting on the writes they were fetched for, None when
+    # entries are stored straight away
+    _pending = None
+
+    @staticmethod
+    def validators(url):
+        """Get the conditional request headers for the url.
+
+        :param url: the url about to be requested
+        :type url:  str
+        :return:    If-None-Match and If-Modified-Since headers, empty if the
+                    url is not cached
+        :rtype:     dict
+        """
+        meta = HTTP_Cache._read_meta(url)
+        headers = {}
+        if(meta and os.path.exists(HTTP_Cache._path(url, "body"))):
+            if(meta["etag"]):
+                headers["If-None-Match"] = meta["etag"]
+            if(meta["last_modified"]):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    @staticmethod
+    def load(url):
+        """Load the cached response for the url, marking it as recently used.
+
+        :param url: the url to load
+        :type url:  str
+        :return:    the cached response, or None if it isn't cached
+        :rtype:     Cached_Response or None
+        """
+        meta = HTTP_Cache._read_meta(url)
+        try:
+            with open(HTTP_Cache._path(url, "body"), "rb") as f:
+                content = f.read()
+            os.utime(HTTP_Cache._path(url, "json"))
+        except OSError:
+            return None
+        return Cached_Response(content, meta["encoding"], meta["headers"])
+
+    @staticmethod
+    def store(url, r):
+        """Store the response if it has validators, then evict old entries.
+
+        :param url: the url that was requested
+        :type url:  str
+        :param r:   the successful response
+        :type r:    Response
+        """
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+        # Without validators the response can never be revalidated
+        if(not etag and not last_modified):
+            return
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "encoding": r.encoding,
+            "headers": dict(r.headers),
+        }
+        with HTTP_Cache._lock:
+            if(HTTP_Cache._pending is not None):
+                HTTP_Cache._pending[url] = (r.content, meta)
+                return
+            HTTP_Cache._save({url: (r.content, meta)})
+
+    @staticmethod
+    @contextmanager
+    def deferred():
+        """Hold back the responses stored within, saving them only once the
+           enclosed statements have finished. A response is only cached
+           once what was read from it has been written, otherwise a write
+           that failed or was killed would be followed by a 304 and the
+           data would never be written.
+        """
+        with HTTP_Cache._lock:
+            HTTP_Cache._pending = {}
+        try:
+            yield
+        except BaseException:
+            with HTTP_Cache._lock:
+                HTTP_Cache._pending = None
+            raise
+        with HTTP_Cache._lock:
+            pending, HTTP_Cache._pending = HTTP_Cache._pending, None
+            if(pending):
+                HTTP_Cache._save(pending)
+
+    @staticmethod
+    def _save(entries):
+        """Write entries to the cache, then evict old entries. The lock must
+           be held.
+
+        :param entries: the body and metadata of each entry, keyed by url
+        :type entries:  dict
+        """
+        os.makedirs(HTTP_Cache._DIRECTORY, exist_ok=True)
+        for url, (content, meta) in entries.items():
+            write_atomically(HTTP_Cache._path(url, "body"), content)
+            write_atomically(HTTP_Cache._path(url, "json"),
+                              json.dumps(meta).encode("utf-8"))
+        HTTP_Cache._evict()
+
+    @staticmethod
+    def _evict():
+        """Drop entries that haven't been used within _MAX_AGE, then the least
+           recently used entries until the bodies fit within _MAX_SIZE."""
+        entries = []
+        for name in os.listdir(HTTP_Cache._DIRECTORY):
+            if(not name.endswith(".json")):
+                continue
+            key = name[:-len(".json")]
+            meta_path = os.path.join(HTTP_Cache._DIRECTORY, name)
+            body_path = os.path.join(HTTP_Cache._DIRECTORY, f"{key}.body")
+            try:
+                used = os.path.getmtime(meta_path)
+                size = os.path.getsize(body_path)
+            except OSError:
+                continue
+            entries.append((used, size, meta_path, body_path))
+        entries.sort()
+        total = sum(entry[1] for entry in entries)
+        now = time.time()
+        for used, size, meta_path, body_path in entries:
+            if(now - used < HTTP_Cache._MAX_AGE and
+               total <= HTTP_Cache._MAX_SIZE):
+                break
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    @staticmethod
+    def _read_meta(url):
+        """Read the metadata stored for the url.
+
+        :param url: the url to read metadata for
+        :type url:  str
+        :return:    the metadata, or None if the url is not cached
+        :rtype:     dict or None
+        """
+        try:
+            with open(HTTP_Cache._path(url, "json"), "rb") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _path(url, extension):
+        """Get the path of a cache file for the url.
+
+        :param url:       the url of the cache entry
+        :type url:        str
+        :param extension: json for the metadata, body for the body
+        :type extension:  str
+        :return:          the path to the file
+        :rtype:           str
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(HTTP_Cache._DIRECTORY, f"{key}.{extension}")
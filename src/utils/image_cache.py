@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+
+'''
+  A cache of the games' cover images on disk, so rofi can show them as icons
+  without waiting on the network. Covers are downloaded a few at a time
+  after a refresh and stored by the hash of their contents, so identical
+  covers at different urls are only kept once. Each url points to its cover
+  through a small file named after the url's hash.
+
+  Covers are shrunk to icon size with Pillow and stored as PNG, which rofi
+  can always read. Once the covers take up more than _MAX_SIZE the least
+  recently shown are dropped. A url whose cover can't be downloaded is
+  marked with when to try it again, waiting longer after each failure.
+'''
+
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.files import write_atomically
+
+
+class Image_Cache:
+    _DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__)))), "cache", "images")
+    _MAX_SIZE = 20 * 1024 * 1024  # the most bytes of covers to keep
+    _ICON_SIZE = 96  # the longest side of a shrunk cover, in pixels
+    _WORKERS = 8  # the number of covers downloaded at once
+    # Seconds before a failed cover is tried again, doubling with each
+    # failure up to the longest wait
+    _RETRY_AFTER = 60 * 60
+    _MAX_RETRY_AFTER = 7 * 24 * 60 * 60
+    _enabled = False
+
+    @staticmethod
+    def configure(enabled):
+        """Set whether covers are downloaded after each refresh.
+
+        :param enabled: whether to download covers
+        :type enabled:  bool
+        """
+        Image_Cache._enabled = enabled
+
+    @staticmethod
+    def enabled():
+        """Check whether covers are downloaded after each refresh.
+
+        :return: whether covers are downloaded
+        :rtype:  bool
+        """
+        return Image_Cache._enabled
+
+    @staticmethod
+    def paths(urls):
+        """Get the cached cover of each url, marking them as recently shown.
+
+        :param urls: the urls of the covers, any may be None
+        :type urls:  list
+        :return:     the path of each cover, or None where it isn't cached
+        :rtype:      list
+        """
+        # Nothing is cached until covers have been downloaded once
+        if(not os.path.isdir(Image_Cache._DIRECTORY)):
+            return [None] * len(urls)
+        paths = []
+        for url in urls:
+            path = Image_Cache._cover_path(url) if(url) else None
+            if(path):
+                try:
+                    os.utime(path)
+                except OSError:
+                    path = None
+            paths.append(path)
+        return paths
+
+    @staticmethod
+    def touch(paths):
+        """Mark covers as recently shown, for menus shown from the menu cache
+           rather than rendered with paths.
+
+        :param paths: the paths of the covers
+        :type paths:  list
+        """
+        for path in paths:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def fetch(urls):
+        """Download every cover that isn't cached and isn't waiting to be
+           tried again, then drop the least recently shown covers until the
+           cache fits within _MAX_SIZE.
+
+        :param urls: the urls of the covers, any may be None or repeated
+        :type urls:  list
+        :return:     the urls whose covers were downloaded and the urls
+                     whose covers were dropped
+        :rtype:      list, list
+        """
+        cached = {url: Image_Cache._cover_path(url)
+                  for url in dict.fromkeys(urls) if(url)}
+        now = time.time()
+        missing = [url for url, path in cached.items()
+                   if(not path and Image_Cache._failure(url)[1] <= now)]
+        if(not missing):
+            return [], []
+        os.makedirs(Image_Cache._DIRECTORY, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=Image_Cache._WORKERS) as executor:
+            stored = list(executor.map(Image_Cache._download, missing))
+        for url, ok in zip(missing, stored):
+            if(ok):
+                Image_Cache._forget_failure(url)
+            else:
+                Image_Cache._record_failure(url, now)
+        removed = Image_Cache._evict(now)
+        return ([url for url, ok in zip(missing, stored) if(ok)],
+                [url for url, path in cached.items()
+                 if(path and os.path.basename(path) in removed)])
+
+    @staticmethod
+    def _download(url):
+        """Download a cover and store it, unless the same cover is already
+           stored for another url.
+
+        :param url: the url of the cover
+        :type url:  str
+        :return:    whether the cover was stored
+        :rtype:     bool
+        """
+        # requests is slow to import, the menus only need the paths
+        from src.platforms.shared import HTTP_Session
+        try:
+            r = HTTP_Session.get(url)
+        except Exception:
+            return False
+        if(not r.status_code == 200 or not r.content):
+            return False
+        # Identical covers have the same name, so each is only kept once
+        name = f"{hashlib.sha256(r.content).hexdigest()}.png"
+        path = os.path.join(Image_Cache._DIRECTORY, name)
+        if(not os.path.exists(path)):
+            data = Image_Cache._shrink(r.content)
+            if(data is None):
+                return False
+            write_atomically(path, data)
+        else:
+            os.utime(path)
+        write_atomically(Image_Cache._link_path(url), name.encode())
+        return True
+
+    @staticmethod
+    def _shrink(data):
+        """Shrink a cover to icon size as a PNG.
+
+        :param data: the downloaded cover
+        :type data:  bytes
+        :return:     the cover to store, or None if Pillow can't read it
+        :rtype:      bytes or None
+        """
+        # Pillow is slow to import, the menus only need the paths
+        from PIL import Image
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.thumbnail((Image_Cache._ICON_SIZE,
+                                 Image_Cache._ICON_SIZE))
+                shrunk = io.BytesIO()
+                image.save(shrunk, "PNG")
+        except Exception:
+            return None
+        return shrunk.getvalue()
+
+    @staticmethod
+    def _failure(url):
+        """Read how often the url's cover has failed to download and when it
+           can be tried again.
+
+        :param url: the url of the cover
+        :type url:  str
+        :return:    the number of failures in a row and the time to try
+                    again after, 0 and 0 if it hasn't failed
+        :rtype:     int, float
+        """
+        try:
+            with open(Image_Cache._failure_path(url), "rb") as f:
+                failures, retry_at = f.read().decode().split()
+            return int(failures), float(retry_at)
+        except (OSError, ValueError):
+            return 0, 0
+
+    @staticmethod
+    def _record_failure(url, now):
+        """Mark the url's cover as failed, to be tried again after a wait
+           twice as long as after its last failure.
+
+        :param url: the url of the cover
+        :type url:  str
+        :param now: the time the download was started
+        :type now:  float
+        """
+        failures = Image_Cache._failure(url)[0] + 1
+        wait = min(Image_Cache._RETRY_AFTER * 2 ** (failures - 1),
+                   Image_Cache._MAX_RETRY_AFTER)
+        write_atomically(Image_Cache._failure_path(url),
+                         f"{failures} {now + wait}".encode())
+
+    @staticmethod
+    def _forget_failure(url):
+        """Clear the failures of a url whose cover has been downloaded.
+
+        :param url: the url of the cover
+        :type url:  str
+        """
+        try:
+            os.remove(Image_Cache._failure_path(url))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _cover_path(url):
+        """Get the stored cover the url points to.
+
+        :param url: the url of the cover
+        :type url:  str
+        :return:    the path of the cover, or None if it isn't stored
+        :rtype:     str or None
+        """
+        try:
+            with open(Image_Cache._link_path(url), "rb") as f:
+                name = f.read().decode()
+        except OSError:
+            return None
+        path = os.path.join(Image_Cache._DIRECTORY, name)
+        return path if(os.path.exists(path)) else None
+
+    @staticmethod
+    def _evict(now):
+        """Drop the least recently shown covers until the rest fit within
+           _MAX_SIZE, then the urls pointing to covers that are gone and
+           the failures that have waited longer than the longest wait.
+
+        :param now: the time the covers were fetched
+        :type now:  float
+        :return:    the names of the covers dropped
+        :rtype:     set
+        """
+        covers = []
+        links = []
+        for name in os.listdir(Image_Cache._DIRECTORY):
+            path = os.path.join(Image_Cache._DIRECTORY, name)
+            if(name.endswith(".url")):
+                links.append(path)
+                continue
+            if(name.endswith(".failed")):
+                # A url left failing this long is no longer being fetched
+                try:
+                    if(now - os.path.getmtime(path) >
+                       Image_Cache._MAX_RETRY_AFTER * 2):
+                        os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                covers.append((os.path.getmtime(path), os.path.getsize(path),
+                               name))
+            except OSError:
+                continue
+        covers.sort()
+        total = sum(cover[1] for cover in covers)
+        kept = set(cover[2] for cover in covers)
+        removed = set()
+        for _, size, name in covers:
+            if(total <= Image_Cache._MAX_SIZE):
+                break
+            try:
+                os.remove(os.path.join(Image_Cache._DIRECTORY, name))
+            except OSError:
+                pass
+            kept.discard(name)
+            removed.add(name)
+            total -= size
+        for path in links:
+            try:
+                with open(path, "rb") as f:
+                    if(f.read().decode() in kept):
+                        continue
+                os.remove(path)
+            except OSError:
+                pass
+        return removed
+
+    @staticmethod
+    def _link_path(url):
+        """Get the path of the file pointing the url to its cover.
+
+        :param url: the url of the cover
+        :type url:  str
+        :return:    the path to the file
+        :rtype:     str
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(Image_Cache._DIRECTORY, f"{key}.url")
+
+    @staticmethod
+    def _failure_path(url):
+        """Get the path of the file recording the url's failed downloads.
+
+        :param url: the url of the cover
+        :type url:  str
+        :return:    the path to the file
+        :rtype:     str
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(Image_Cache._DIRECTORY, f"{key}.failed")
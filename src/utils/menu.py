@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+
+'''
+  Renders the lists of games into the menus rofi shows. A list's menu is
+  rendered once after it changes and kept in the menu_cache table, which
+  DB_Calls clears whenever it writes to the list, so opening a list in rofi
+  is a single read.
+
+  Along with each menu is the record of every row, in the same order, so
+  the index rofi returns for the chosen row leads straight to the game.
+'''
+
+import re
+from enum import Enum
+
+from src.utils.db_calls import DB_Calls
+from src.utils.db_enums import (DB_Tables, DB_Indices, DB_Platforms,
+                                DB_Search_Indices)
+from src.utils.image_cache import Image_Cache
+from src.utils.metrics import Metrics, Stages
+from src.platforms.ps import PS
+
+
+class Menu_Records(Enum):
+    GID = 0
+    URL = 1
+    TITLE = 2
+
+
+class Menu:
+    _PS_TABLES = (DB_Tables.TOP_PS.value, DB_Tables.PS_WISHLIST.value)
+    # rofi reads a row's icon from the options after a null character
+    _ICON = "\0icon\x1f"
+    _ICON_PATH = re.compile(f"{_ICON}(.*)\n".encode("UTF-8"))
+
+    @staticmethod
+    def get(cur, table):
+        """Get the rendered menu of the list, rendering and caching it if the
+           list has changed since it was last rendered.
+
+        :param cur:   database cursor
+        :type cur:    cursor
+        :param table: the list to get the menu of
+        :type table:  str
+        :return:      the menu, encoded for rofi, and the record of each row
+                      in it, see Menu_Records
+        :rtype:       bytes, list
+        """
+        cached = DB_Calls.get_menu(cur, table)
+        if(cached):
+            # The covers it shows are still in use, so keep them cached
+            if(Menu.has_icons(cached[0])):
+                Image_Cache.touch([path.decode("UTF-8") for path in
+                                   Menu._ICON_PATH.findall(cached[0])])
+            return cached
+        with Metrics.stage(Stages.RENDER, table):
+            games = DB_Calls.get_data(cur, table)
+            menu = Menu.render(table, games,
+                               DB_Calls.get_longest_title(cur, table))
+            records = [(game[DB_Indices.GID.value],
+                        game[DB_Indices.URL.value],
+                        game[DB_Indices.TITLE.value]) for game in games]
+            DB_Calls.set_menu(cur, table, menu, records)
+        return menu, records
+
+    @staticmethod
+    def warm(cur):
+        """Render the menu of every list that has changed, so the next rofi
+           window opens without rendering anything.
+
+        :param cur: database cursor
+        :type cur:  cursor
+        """
+        for table in DB_Tables:
+            Menu.get(cur, table.value)
+
+    @staticmethod
+    def render(table, games, longest_title):
+        """Format the games into nice format for rendering with rofi, one
+           game per line. Games whose cover is in the image cache are given
+           it as their icon.
+
+        :param table:         the list the games are from
+        :type table:          str
+        :param games:         the games to render
+        :type games:          list
+        :param longest_title: the longest title in this collection of games
+        :type longest_title:  int
+        :return:              the menu, encoded for rofi
+        :rtype:               bytes
+        """
+        if(table in Menu._PS_TABLES):
+            lines = Menu._ps_lines(games, longest_title)
+        else:
+            lines = Menu._pc_lines(games, longest_title)
+        icons = Image_Cache.paths([game[DB_Indices.COVER_IMAGE.value]
+                                   for game in games])
+        lines = [f"{line[:-1]}{Menu._ICON}{icon}\n" if(icon) else line
+                 for line, icon in zip(lines, icons)]
+        return "".join(lines).encode("UTF-8")
+
+    @staticmethod
+    def render_results(games):
+        """Format the games found by a title search, one game per line, each
+           with its price in the lists or the last price seen if it has left
+           them.
+
+        :param games: the games found, see DB_Calls.search_titles
+        :type games:  list
+        :return:      the menu, encoded for rofi
+        :rtype:       bytes
+        """
+        ps_plus_price = PS.ps_plus_price()
+        longest_title = max((len(game[DB_Search_Indices.TITLE.value])
+                             for game in games), default=0)
+        lines = []
+        for game in games:
+            title = game[DB_Search_Indices.TITLE.value].ljust(longest_title)
+            price = game[DB_Search_Indices.SALE_PRICE.value]
+            currency = "$"
+            if(game[DB_Search_Indices.PLATFORM.value] ==
+               DB_Platforms.PS.value):
+                currency = PS.currency(
+                    PS.get_region(game[DB_Search_Indices.URL.value]))
+            if(price is None):
+                lines.append(f"{title}\n")
+            elif(game[DB_Search_Indices.PLATFORM.value] ==
+                 DB_Platforms.PS.value and price == ps_plus_price):
+                lines.append(f"{title} $PS+\n")
+            else:
+                lines.append(f"{title} {currency}{price:.2f}\n")
+        return "".join(lines).encode("UTF-8")
+
+    @staticmethod
+    def has_icons(menu):
+        """Check whether any row of a rendered menu has an icon.
+
+        :param menu: the menu, encoded for rofi
+        :type menu:  bytes
+        :return:     whether rofi should show icons
+        :rtype:      bool
+        """
+        return Menu._ICON.encode("UTF-8") in menu
+
+    @staticmethod
+    def _pc_lines(games, longest_title):
+        """Format the PC games.
+
+        :param games:         the games to format
+        :type games:          list
+        :param longest_title: the longest title in this collection of games
+        :type longest_title:  int
+        :return:              a line for each game
+        :rtype:               list
+        """
+        return [f"{game[DB_Indices.TITLE.value].ljust(longest_title)} " +
+                f"${game[DB_Indices.SALE_PRICE.value]:.2f}" +
+                f"{Menu._low_string(game)}\n" for game in games]
+
+    @staticmethod
+    def _ps_lines(games, longest_title):
+        """Format the Playstation games, showing deals only available with
+           PS+ as such and every price in its store's currency. When the
+           games are from more than one region's store, each shows its
+           region.
+
+        :param games:         the games to format
+        :type games:          list
+        :param longest_title: the longest title in this collection of games
+        :type longest_title:  int
+        :return:              a line for each game
+        :rtype:               list
+        """
+        ps_plus_price = PS.ps_plus_price()
+        currencies = {region: PS.currency(region) for region in set(
+            game[DB_Indices.REGION.value] for game in games)}
+        lines = []
+        for game in games:
+            title = game[DB_Indices.TITLE.value].ljust(longest_title)
+            if(len(currencies) > 1):
+                title += f" {game[DB_Indices.REGION.value].upper():2}"
+            currency = currencies[game[DB_Indices.REGION.value]]
+            if(game[DB_Indices.SALE_PRICE.value] == ps_plus_price):
+                lines.append(f"{title} $PS+\n")
+            else:
+                lines.append(
+                    f"{title} " +
+                    f"{currency}{game[DB_Indices.SALE_PRICE.value]:.2f}" +
+                    f"{Menu._low_string(game, currency)}\n")
+        return lines
+
+    @staticmethod
+    def _low_string(game, currency="$"):
+        """Describe how the game's price compares to its all-time low and its
+           low of the last 90 days.
+
+        :param game:     the game to describe
+        :type game:      tuple
+        :param currency: what the game's prices are shown with, defaults
+                         to "$"
+        :type currency:  str, optional
+        :return:         "(lowest)" if the game is at its all-time low,
+                         otherwise the all-time low and the 90 day low when
+                         it's higher, or nothing without a price history
+        :rtype:          str
+        """
+        sale_price = game[DB_Indices.SALE_PRICE.value]
+        lowest = game[DB_Indices.LOWEST_PRICE.value]
+        recent = game[DB_Indices.RECENT_LOW.value]
+        if(lowest is None):
+            return ""
+        if(sale_price <= lowest):
+            return "  (lowest)"
+        if(recent is None or recent <= lowest):
+            return f"  (low {currency}{lowest:.2f})"
+        if(sale_price <= recent):
+            return f"  (90 day low, low {currency}{lowest:.2f})"
+        return (f"  (low {currency}{lowest:.2f}, " +
+                f"90 days {currency}{recent:.2f})")
@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+
+'''
+  Measures each stage of a refresh: fetching, parsing, writing to the
+  database and rendering the menus. Every stage records how long it took,
+  the HTTP requests record their status, size, retries and cache hits, and
+  the writes record the rows changed in each list.
+
+  The measurements of a refresh are written to a JSON file and to a file for
+  the Prometheus node exporter's textfile collector, so the cost of
+  refreshing can be tracked over time.
+'''
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+
+
+class Stages(Enum):
+    FETCH = "fetch"
+    PARSE = "parse"
+    DB_WRITE = "db_write"
+    RENDER = "render"
+
+
+class Metric(Enum):
+    STAGE_SECONDS = "game_deals_stage_seconds"
+    STAGE_CALLS = "game_deals_stage_calls"
+    HTTP_REQUESTS = "game_deals_http_requests"
+    HTTP_BYTES = "game_deals_http_response_bytes"
+    HTTP_RETRIES = "game_deals_http_retries"
+    CACHE_HITS = "game_deals_http_cache_hits"
+    ROWS_CHANGED = "game_deals_rows_changed"
+    REFRESH_SECONDS = "game_deals_refresh_seconds"
+    REFRESH_TIMESTAMP = "game_deals_refresh_timestamp_seconds"
+
+
+class Metrics:
+    _HELP = {
+        Metric.STAGE_SECONDS: "Seconds spent in each stage of the last "
+                              "refresh, summed over threads",
+        Metric.STAGE_CALLS: "Times each stage ran in the last refresh",
+        Metric.HTTP_REQUESTS: "HTTP responses in the last refresh, by status",
+        Metric.HTTP_BYTES: "Bytes of HTTP responses in the last refresh",
+        Metric.HTTP_RETRIES: "HTTP requests retried in the last refresh",
+        Metric.CACHE_HITS: "HTTP responses in the last refresh answered "
+                           "from the cache",
+        Metric.ROWS_CHANGED: "Rows changed in each list by the last refresh",
+        Metric.REFRESH_SECONDS: "Seconds the last refresh took",
+        Metric.REFRESH_TIMESTAMP: "Unix time the last refresh finished",
+    }
+    _json_path = None  # where the measurements are written as JSON
+    _textfile_path = None  # where they're written for the textfile collector
+    _values = {}  # the value of each metric, keyed by metric then labels
+    _started = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def configure(json_path=None, textfile_path=None):
+        """Set where the measurements of each refresh are written.
+
+        :param json_path:     the JSON file, defaults to None meaning not
+                              written
+        :type json_path:      str, optional
+        :param textfile_path: the Prometheus textfile, which should end in
+                              .prom, defaults to None meaning not written
+        :type textfile_path:  str, optional
+        """
+        Metrics._json_path = json_path
+        Metrics._textfile_path = textfile_path
+
+    @staticmethod
+    def reset():
+        """Forget the measurements of the last refresh and start timing the
+           next one.
+        """
+        with Metrics._lock:
+            Metrics._values = {}
+            Metrics._started = time.time()
+
+    @staticmethod
+    def add(metric, amount=1, **labels):
+        """Add to a metric.
+
+        :param metric:   the metric to add to
+        :type metric:    Metric
+        :param amount:   the amount to add, defaults to 1
+        :type amount:    int or float, optional
+        :param **labels: the labels of the series to add to
+        :type **labels:  str
+        """
+        key = tuple(sorted((name, str(value))
+                           for name, value in labels.items()))
+        with Metrics._lock:
+            series = Metrics._values.setdefault(metric, {})
+            series[key] = series.get(key, 0) + amount
+
+    @staticmethod
+    @contextmanager
+    def stage(stage, target):
+        """Time a block of code as part of a stage.
+
+        :param stage:  the stage the block belongs to
+        :type stage:   Stages
+        :param target: what the stage is working on, a host, platform or
+                       list
+        :type target:  str
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            Metrics.record(stage, target, time.perf_counter() - start)
+
+    @staticmethod
+    def record(stage, target, seconds):
+        """Record a run of a stage that was timed elsewhere, such as in
+           another process.
+
+        :param stage:   the stage that ran
+        :type stage:    Stages
+        :param target:  what the stage worked on
+        :type target:   str
+        :param seconds: how long it took
+        :type seconds:  float
+        """
+        Metrics.add(Metric.STAGE_SECONDS, seconds, stage=stage.value,
+                    target=target)
+        Metrics.add(Metric.STAGE_CALLS, stage=stage.value, target=target)
+
+    @staticmethod
+    def timed(stage, target):
+        """Decorate a function so every call is timed as part of a stage.
+
+        :param stage:  the stage the function belongs to
+        :type stage:   Stages
+        :param target: what the stage is working on
+        :type target:  str
+        :return:       the decorator
+        :rtype:        function
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with Metrics.stage(stage, target):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def export():
+        """Finish timing the refresh and write its measurements to the
+           configured files.
+        """
+        finished = time.time()
+        Metrics.add(Metric.REFRESH_SECONDS, finished - Metrics._started)
+        Metrics.add(Metric.REFRESH_TIMESTAMP, finished)
+        with Metrics._lock:
+            values = {metric: dict(series)
+                      for metric, series in Metrics._values.items()}
+        if(Metrics._json_path):
+            Metrics._write(Metrics._json_path, json.dumps(
+                {metric.value: [{"labels": dict(labels), "value": value}
+                                for labels, value in series.items()]
+                 for metric, series in values.items()}, indent=4) + "\n")
+        if(Metrics._textfile_path):
+            Metrics._write(Metrics._textfile_path,
+                           Metrics._textfile(values))
+
+    @staticmethod
+    def _textfile(values):
+        """Format the measurements in the Prometheus text format. Each is a
+           gauge, since they describe only the last refresh.
+
+        :param values: the value of each metric, keyed by metric then labels
+        :type values:  dict
+        :return:       the text
+        :rtype:        str
+        """
+        lines = []
+        for metric in Metric:
+            if(metric not in values):
+                continue
+            lines.append(f"# HELP {metric.value} {Metrics._HELP[metric]}")
+            lines.append(f"# TYPE {metric.value} gauge")
+            for labels, value in sorted(values[metric].items()):
+                label_text = ",".join(
+                    f'{name}="{Metrics._escape(label)}"'
+                    for name, label in labels)
+                if(label_text):
+                    label_text = f"{{{label_text}}}"
+                lines.append(f"{metric.value}{label_text} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _escape(label):
+        """Escape a label value for the Prometheus text format.
+
+        :param label: the label value
+        :type label:  str
+        :return:      the escaped value
+        :rtype:       str
+        """
+        return label.replace("\\", "\\\\").replace('"', '\\"').replace(
+            "\n", "\\n")
+
+    @staticmethod
+    def _write(path, text):
+        """Replace a file in one step, so a collector never reads half of it.
+
+        :param path: the file to write
+        :type path:  str
+        :param text: the contents
+        :type text:  str
+        """
+        if(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(text)
+        os.replace(temporary, path)
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+
+'''
+  A token bucket rate limiter shared by every request made to the same host.
+  Threads that would exceed the configured rate reserve a token and sleep
+  until it becomes available, so concurrent fetchers never go over the limit.
+'''
+
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class Rate_Limiter:
+    _LIMITERS = {}  # the limiter for each host, keyed by host name
+    _LIMITERS_LOCK = threading.Lock()
+
+    def __init__(self, rate, burst):
+        """Create a token bucket.
+
+        :param rate:  the number of requests allowed per second
+        :type rate:   float
+        :param burst: the number of requests that may be made back to back
+        :type burst:  int
+        """
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Take a token from the bucket, sleeping until one is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            # Reserve the token now, a negative balance is the queue of
+            # threads waiting on the bucket to refill
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if(self._tokens < 0) else 0
+        if(wait):
+            time.sleep(wait)
+
+    @staticmethod
+    def configure(host, rate, burst):
+        """Set the rate limit for every request made to the given host.
+
+        :param host:  the host name to limit, e.g. psdeals.net
+        :type host:   str
+        :param rate:  the number of requests allowed per second
+        :type rate:   float
+        :param burst: the number of requests that may be made back to back
+        :type burst:  int
+        """
+        with Rate_Limiter._LIMITERS_LOCK:
+            Rate_Limiter._LIMITERS[host] = Rate_Limiter(rate, burst)
+
+    @staticmethod
+    def wait_for(url):
+        """Block until a request to the url's host is allowed, hosts without
+           a configured limit are never delayed.
+
+        :param url: the url that is about to be requested
+        :type url:  str
+        """
+        limiter = Rate_Limiter._LIMITERS.get(urlparse(url).netloc)
+        if(limiter):
+            limiter.take()
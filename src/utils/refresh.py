@@ -0,0 +1,389 @@
+#!/usr/bin/python3
+
+'''
+  Everything needed to bring the database up to date. main.py only imports
+  this when an update is going to run, since it loads the platforms and,
+  through them, the HTTP and scraping stacks.
+'''
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+from src.platforms.pc import PC
+from src.platforms.ps import PS
+from src.platforms.shared import HTTP_Session, NOT_MODIFIED
+from src.utils.db_enums import DB_Columns, DB_Tables, DB_Changes
+from src.utils.db_calls import DB_Calls
+from src.utils.http_cache import HTTP_Cache
+from src.utils.image_cache import Image_Cache
+from src.utils.menu import Menu
+from src.utils.metrics import Metric, Metrics, Stages
+
+# The most parts of lists waiting to be written, fetching waits on the
+# writer beyond this so memory stays flat
+_QUEUE_SIZE = 8
+# How each list is named in the log
+_LIST_NAMES = {
+    DB_Tables.TOP_PC.value: "top PC deals",
+    DB_Tables.TOP_PS.value: "top Playstation deals",
+    DB_Tables.PC_WISHLIST.value: "PC wishlist deals",
+    DB_Tables.PS_WISHLIST.value: "Playstation wishlist deals",
+}
+
+
+class Refresh_Cancelled(Exception):
+    """Raised in a fetch that emits after the writer has failed."""
+
+
+def configure_platforms(ps_rate, ps_burst, pc_pages, pc_sort, pc_stores,
+                        pc_url=None, ps_url=None, metrics_json=None,
+                        metrics_textfile=None, ps_regions=None,
+                        ps_pages=2, ps_platforms=None, ps_parse_processes=0,
+                        icons=False):
+    """Apply the fetching and metrics options from the command line.
+
+    :param ps_rate:            the number of requests per second allowed to
+                               psdeals.net
+    :type ps_rate:             float
+    :param ps_burst:           the number of psdeals.net requests that can be
+                               made back to back
+    :type ps_burst:            int
+    :param pc_pages:           the most pages of top PC deals to fetch
+    :type pc_pages:            int
+    :param pc_sort:            the order the top PC deals are fetched in
+    :type pc_sort:             str or None
+    :param pc_stores:          only fetch top PC deals from these store ids
+    :type pc_stores:           list or None
+    :param pc_url:             a server to use in place of cheapshark.com,
+                               defaults to None
+    :type pc_url:              str, optional
+    :param ps_url:             a server to use in place of psdeals.net,
+                               defaults to None
+    :type ps_url:              str, optional
+    :param metrics_json:       where to write the metrics of each refresh as
+                               JSON, defaults to None
+    :type metrics_json:        str, optional
+    :param metrics_textfile:   where to write the metrics of each refresh for
+                               the Prometheus textfile collector, defaults to
+                               None
+    :type metrics_textfile:    str, optional
+    :param ps_regions:         the Playstation stores to fetch the top deals
+                               of, defaults to None meaning the US store
+    :type ps_regions:          list, optional
+    :param ps_pages:           the most pages of top Playstation deals to fetch
+                               from each region, defaults to 2
+    :type ps_pages:            int, optional
+    :param ps_platforms:       only fetch top Playstation deals for these
+                               consoles, defaults to None meaning ps4
+    :type ps_platforms:        list, optional
+    :param ps_parse_processes: the number of processes Playstation pages are
+                               parsed in, defaults to 0 meaning they're parsed
+                               on threads
+    :type ps_parse_processes:  int, optional
+    :param icons:              whether to download the games' covers after
+                               each refresh to show as icons, defaults to
+                               False
+    :type icons:               bool, optional
+    """
+    if(pc_url):
+        PC.set_base_url(pc_url)
+    if(ps_url):
+        PS.set_base_url(ps_url)
+    PS.set_rate_limit(ps_rate, ps_burst)
+    if(ps_regions):
+        PS.set_regions(ps_regions)
+    PS.set_top_deals_options(ps_pages, ps_platforms)
+    PS.set_parse_processes(ps_parse_processes)
+    PC.set_top_deals_options(pc_pages, pc_sort, pc_stores)
+    Metrics.configure(metrics_json, metrics_textfile)
+    Image_Cache.configure(icons)
+
+
+def plan_wishlist_update(cur, table, wishlist_args, budget=None):
+    """Plan the update of a wishlist, reading what it needs from the
+       database now so fetching can run on another thread.
+
+    :param cur:           database cursor object
+    :type cur:            Cursor
+    :param table:         name of table to work on
+    :type table:          str
+    :param wishlist_args: list of wishlist games to add to database
+    :type wishlist_args:  list
+    :param budget:        the most requests to spend on games already in the
+                          wishlist, defaults to None meaning no limit
+    :type budget:         int, optional
+    :return:              the update, see run_updates, or None if nothing
+                          needs updating
+    :rtype:               (function, function, function) or None
+    """
+    if(table == DB_Tables.PC_WISHLIST.value):
+        cls = PC
+    elif(table == DB_Tables.PS_WISHLIST.value):
+        cls = PS
+    # Figure out which games need updating, within the budget
+    if(budget is not None):
+        budget *= cls.wishlist_games_per_request()
+    games = DB_Calls.wishlist_needs_updating(cur, table, budget) + \
+        wishlist_args
+    if(not games):
+        return None
+    # Games that are in the database can come back unchanged
+    existing = DB_Calls.existing_gids(
+        cur, table, [cls.get_gid(game) for game in games
+                     if(cls.is_valid(game))])
+
+    def fetch(_):
+        return cls.get_wishlist_deals(games, existing)
+
+    def finish(fetched):
+        if(fetched is None):
+            return None
+        new_games, unchanged = fetched
+        if(unchanged):
+            DB_Calls.touch_games(cur, table, unchanged)
+        if(new_games):
+            with Metrics.stage(Stages.DB_WRITE, table):
+                changes = DB_Calls.add_games(cur, table, new_games)
+            count_changes(table, changes)
+            return changes
+        return None
+    return fetch, None, finish
+
+
+def plan_top_update(cur, table, cls, update_delay, upper_price=None):
+    """Plan the update of the top game deals, reading what it needs from the
+       database now so fetching can run on another thread.
+
+    :param cur:          database cursor object
+    :type cur:           Cursor
+    :param table:        name of table to work on
+    :type table:         str
+    :param cls:          the class to get top games for
+    :type cls:           the platform class to get deals for
+    :param update_delay: the amount of time that needs to pass
+                         before fetching new data
+    :type update_delay:  timedelta
+    :param upper_price:  the upper price limit for pc deals, defaults to None
+    :type upper_price:   float, optional
+    :return:             the update, see run_updates, or None if the deals
+                         are up to date
+    :rtype:              (function, function, function) or None
+    """
+    # When other pages are asked for than last time, such as after fewer
+    # regions or pages are chosen, the list is fetched in full and swept so
+    # the games from pages no longer fetched are removed
+    urls = cls.top_deals_urls(upper_price)
+    same_source = (DB_Calls.get_list_source(cur, table) ==
+                   DB_Calls.source_of(urls))
+    if(same_source and not DB_Calls.needs_updating(cur, table, update_delay)):
+        return None
+    # An empty table must be filled even if the deals haven't changed
+    revalidate = same_source and DB_Calls.count_games(cur, table) > 0
+    # The games on every page written so far, the rest are swept at the end
+    seen = set()
+    changes = {change.value: [] for change in DB_Changes}
+
+    def fetch(emit):
+        return cls.get_top_deals(upper_price, revalidate, emit)
+
+    def write(games):
+        seen.update(str(game[DB_Columns.GID.value]) for game in games)
+        with Metrics.stage(Stages.DB_WRITE, table):
+            page_changes = DB_Calls.add_top_deals_page(cur, table, games)
+        for change, gids in page_changes.items():
+            changes[change] += gids
+
+    def finish(result):
+        if(result == NOT_MODIFIED):
+            DB_Calls.touch_games(cur, table)
+            return None
+        # Only sweep once every page has arrived, a missing page's games
+        # are still deals as far as we know
+        if(result):
+            with Metrics.stage(Stages.DB_WRITE, table):
+                changes[DB_Changes.REMOVED.value] += DB_Calls.sweep_top_deals(
+                    cur, table, seen)
+            DB_Calls.set_list_source(cur, table, urls)
+        count_changes(table, changes)
+        if(any(changes.values())):
+            return changes
+        return None
+    return fetch, write, finish
+
+
+def count_changes(table, changes):
+    """Record the rows a change set changed in the metrics.
+
+    :param table:   the list that was changed
+    :type table:    str
+    :param changes: the change set, see DB_Calls.add_games
+    :type changes:  dict
+    """
+    for change in DB_Changes:
+        Metrics.add(Metric.ROWS_CHANGED, len(changes[change.value]),
+                    list=table, change=change.value)
+
+
+def run_updates(updates, log):
+    """Fetch every list at once, so a slow platform doesn't hold up the
+       others. Each host keeps its own rate limit and connection pool, and
+       what's fetched is written here, on the thread that owns the cursor,
+       one message at a time as it arrives.
+
+       Each update is three functions: fetch, run on its own thread, is
+       given a function to emit parts of the list with as they arrive, such
+       as the games on each page, and returns the rest. write is called
+       with every part emitted and finish with what fetch returned,
+       returning the change set to log.
+
+    :param updates: the updates, keyed by the table they update
+    :type updates:  dict
+    :param log:     called with a message for each list fetched
+    :type log:      function
+    """
+    if(not updates):
+        return
+    messages = Queue(maxsize=_QUEUE_SIZE)
+    cancelled = threading.Event()
+
+    def emit(table, part):
+        # Stop fetching once the writer has failed, nothing more is written
+        if(cancelled.is_set()):
+            raise Refresh_Cancelled()
+        messages.put((table, False, part))
+
+    def run(table, fetch):
+        result = None
+        try:
+            result = fetch(lambda part: emit(table, part))
+        finally:
+            messages.put((table, True, result))
+
+    error = None
+    with ThreadPoolExecutor(max_workers=len(updates)) as executor:
+        futures = [executor.submit(run, table, fetch)
+                   for table, (fetch, _, _) in updates.items()]
+        running = len(updates)
+        while(running):
+            table, finished, message = messages.get()
+            running -= finished
+            # After a failed write keep draining, so no fetch is left
+            # waiting on the full queue, until every fetch has finished
+            if(error is not None):
+                continue
+            _, write, finish = updates[table]
+            try:
+                if(not finished):
+                    write(message)
+                    continue
+                changes = finish(message)
+            except BaseException as e:
+                error = e
+                cancelled.set()
+                continue
+            if(changes):
+                log(f"Fetched {_LIST_NAMES[table]}: " +
+                    describe_changes(changes))
+    if(error is not None):
+        raise error
+    # Raise any error a fetch ran into
+    for future in futures:
+        future.result()
+
+
+def fetch_covers(cur, log):
+    """Download the covers of every list that aren't cached yet, dropping
+       the menus of the platforms with new covers so they're rendered again
+       with their icons, and of those whose covers were dropped from the
+       cache to make room so they don't point rofi at missing files.
+
+    :param cur: database cursor object
+    :type cur:  Cursor
+    :param log: called with the number of covers downloaded
+    :type log:  function
+    """
+    covers = DB_Calls.get_cover_images(cur)
+    fetched, dropped = Image_Cache.fetch(
+        [url for urls in covers.values() for url in urls])
+    changed = set(fetched + dropped)
+    if(not changed):
+        return
+    for platform, urls in covers.items():
+        if(changed.intersection(urls)):
+            DB_Calls.clear_menus(cur, platform)
+    log(f"Fetched {len(fetched)} covers, dropped {len(dropped)}")
+
+
+def describe_changes(changes):
+    """Describe a change set for the log.
+
+    :param changes: the change set, see DB_Calls.add_games
+    :type changes:  dict
+    :return:        the number of games in each kind of change
+    :rtype:         str
+    """
+    return ", ".join(f"{len(changes[change.value])} " +
+                     change.value.replace("_", " ") for change in DB_Changes)
+
+
+def refresh_games(cur, pc_ids, ps_urls, update_delay, upper_price, log,
+                  wishlist_budget=None):
+    """Update every list that is out of date and add new wishlist games.
+
+    :param cur:             database cursor object
+    :type cur:              Cursor
+    :param pc_ids:          ids of PC games to add to the wishlist
+    :type pc_ids:           list
+    :param ps_urls:         urls of Playstation games to add to the wishlist
+    :type ps_urls:          list
+    :param update_delay:    the amount of time that must pass before
+                            updating the top deals
+    :type update_delay:     timedelta
+    :param upper_price:     the upper price limit for pc deals
+    :type upper_price:      float
+    :param log:             called with a message for each list fetched
+    :type log:              function
+    :param wishlist_budget: the most requests to spend refreshing each
+                            platform's wishlist, defaults to None meaning no
+                            limit
+    :type wishlist_budget:  int, optional
+    """
+    Metrics.reset()
+    # The measurements are written even if the refresh fails part way
+    try:
+        # Remove any games that are already in the database. If they need
+        # updating they will be found later
+        existing_pc = DB_Calls.existing_gids(
+            cur, DB_Tables.PC_WISHLIST.value, pc_ids)
+        pc_ids = [id_ for id_ in pc_ids if(id_ not in existing_pc)]
+        ps_urls = [url for url in ps_urls if(not DB_Calls.game_exists(
+            cur, DB_Tables.PS_WISHLIST.value, url=url))]
+
+        updates = {
+            DB_Tables.TOP_PC.value: plan_top_update(
+                cur, DB_Tables.TOP_PC.value, PC, update_delay, upper_price),
+            DB_Tables.TOP_PS.value: plan_top_update(
+                cur, DB_Tables.TOP_PS.value, PS, update_delay),
+            DB_Tables.PC_WISHLIST.value: plan_wishlist_update(
+                cur, DB_Tables.PC_WISHLIST.value, pc_ids, wishlist_budget),
+            DB_Tables.PS_WISHLIST.value: plan_wishlist_update(
+                cur, DB_Tables.PS_WISHLIST.value, ps_urls, wishlist_budget),
+        }
+        updates = {table: update for table, update in updates.items()
+                   if(update)}
+        # Responses are only cached once the lists are written, if writing
+        # fails they're fetched in full next time
+        with HTTP_Cache.deferred():
+            run_updates(updates, log)
+        if(Image_Cache.enabled()):
+            fetch_covers(cur, log)
+        # Render the menus of the lists that changed now rather than when rofi
+        # opens them
+        Menu.warm(cur)
+        # Show how long the requests took for each host
+        for host, latencies in HTTP_Session.latencies().items():
+            log(f"{host}: {len(latencies)} requests, " +
+                f"{sum(latencies)/len(latencies)*1000:.0f}ms average")
+    finally:
+        Metrics.export()
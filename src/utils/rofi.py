@@ -9,7 +9,8 @@ import subprocess
 import webbrowser
 
 from src.utils.db_calls import DB_Calls
-from src.utils.db_enums import DB_Tables, DB_Indices
+from src.utils.db_enums import DB_Tables, DB_Platforms, DB_Search_Indices
+from src.utils.menu import Menu, Menu_Records
 from src.platforms.ps import PS
 from src.platforms.pc import PC
 
@@ -33,14 +34,11 @@ class WishlistGameOptions(Enum):
     DELETE_GAME = "Delete Game\n"
 
 
-def launch_rofi(cur, games, title_lengths):
+def launch_rofi(cur, title_lengths):
     """The main rofi logic loop wrapped in a function.
 
     :param cur:           database cursor
     :type cur:            Cursor
-    :param games:         a dictionary with a list for each game platform,
-                          each list containing tuples representing each game
-    :type games: dict
     :param title_lengths: a dictionary with a value for each game platform
                           representing the longest game title
     :type title_lengths:  dict
@@ -51,12 +49,11 @@ def launch_rofi(cur, games, title_lengths):
             if(not category == Categories.MANAGE_WISHLIST.value):
                 while(True):
                     chosen_game, table = _choose_game(
-                        category, games, title_lengths)
+                        cur, category, title_lengths)
                     if(chosen_game):
-                        url = DB_Calls.get_game_url(cur, table, chosen_game)
-                        if(url):
-                            if(_confirmed(f"Open {url}")):
-                                _open_url(url)
+                        url = chosen_game[Menu_Records.URL.value]
+                        if(_confirmed(f"Open {url}")):
+                            _open_url(url)
                     else:
                         break
             elif(category == Categories.MANAGE_WISHLIST.value):
@@ -71,16 +68,16 @@ def launch_rofi(cur, games, title_lengths):
                                    WishlistGameOptions.DELETE_GAME.value):
                                     while(True):
                                         chosen_game, table = _choose_game(
-                                            chosen_wishlist,
-                                            games,
+                                            cur, chosen_wishlist,
                                             title_lengths)
                                         if(chosen_game):
-                                            if(_confirmed(
-                                                    f"Delete {chosen_game}")):
-                                                games = (
-                                                    DB_Calls.delete_game_now(
-                                                        cur, table,
-                                                        chosen_game, games))
+                                            title = chosen_game[
+                                                Menu_Records.TITLE.value]
+                                            if(_confirmed(f"Delete {title}")):
+                                                DB_Calls.delete_game_with_id(
+                                                    cur, table, chosen_game[
+                                                        Menu_Records.GID.value
+                                                    ])
                                         else:
                                             break
                                 elif(wishlist_option ==
@@ -89,15 +86,9 @@ def launch_rofi(cur, games, title_lengths):
                                         game_name = _get_input(
                                             "Enter name of game")
                                         if(game_name):
-                                            if(chosen_wishlist ==
-                                               WishlistOptions.PC.value):
-                                                url = PC.search_url(game_name)
-                                                if(_confirmed(f"Open {url}")):
-                                                    _open_url(url)
-                                            else:
-                                                url = PS.search_url(game_name)
-                                                if(_confirmed(f"Open {url}")):
-                                                    _open_url(url)
+                                            _search_game(
+                                                cur, chosen_wishlist,
+                                                game_name.strip())
                                         else:
                                             break
                                 else:
@@ -134,59 +125,90 @@ def _choose_option(_options):
     return category.stdout.decode("UTF-8")
 
 
-def _choose_game(category, games, title_lengths):
+def _choose_game(cur, category, title_lengths):
     """Rofi window to select the game you want to see more about.
 
+    :param cur:           database cursor
+    :type cur:            Cursor
     :param category:      the category you have chosen
     :type category:       str
-    :param games:         dictionary with list of each category's games
-    :type games:          dict
     :param title_lengths: dictionary with each category's longest title
     :type title_lengths:  dict
-    :return:              the chosen game
-    :rtype:               str
+    :return:              the record of the chosen game, see Menu_Records,
+                          and the table it's from
+    :rtype:               list, str
     """
-    _GO_UP = ""
-    _ADDON = 18
+    _ADDON = 34
 
-    rofi_string = _GO_UP
-    longest_title = 0
     if(category == Categories.TOP_PC.value):
         _table = DB_Tables.TOP_PC.value
-        longest_title = title_lengths[_table]
-        rofi_string = _form_pc_string(
-            rofi_string, games[_table], longest_title)
     elif(category == Categories.TOP_PS.value):
         _table = DB_Tables.TOP_PS.value
-        longest_title = title_lengths[_table]
-        rofi_string = _form_ps_string(
-            rofi_string, games[_table], longest_title)
     elif(category == Categories.PC_WISHLIST.value or category ==
          WishlistOptions.PC.value):
         _table = DB_Tables.PC_WISHLIST.value
-        longest_title = title_lengths[_table]
-        rofi_string = _form_pc_string(
-            rofi_string, games[_table], longest_title)
     elif(category == Categories.PS_WISHLIST.value or category ==
          WishlistOptions.PS.value):
         _table = DB_Tables.PS_WISHLIST.value
-        longest_title = title_lengths[_table]
-        rofi_string = _form_ps_string(
-            rofi_string, games[_table], longest_title)
     else:
         return None, None
-    chosen_game = subprocess.run(["/usr/bin/rofi", "-dmenu", "-p", "",
-                                  "-lines", "12", "-columns", "2", "-width",
-                                 f"-{longest_title*2+_ADDON}"],
+    longest_title = title_lengths[_table]
+    menu, records = Menu.get(cur, _table)
+    # Have rofi print the index of the chosen row rather than its text
+    command = ["/usr/bin/rofi", "-dmenu", "-p", "", "-lines", "12",
+               "-columns", "2", "-width", f"-{longest_title*2+_ADDON}",
+               "-format", "i"]
+    # Show the covers when any have been downloaded, they're read from disk
+    if(Menu.has_icons(menu)):
+        command.append("-show-icons")
+    chosen_game = subprocess.run(command,
                                  stdout=subprocess.PIPE,
-                                 input=str.encode(
-                                     rofi_string, encoding="UTF-8"),
+                                 input=menu,
                                  shell=False)
     if(chosen_game.returncode == 0):
-        chosen_game = chosen_game.stdout.decode("UTF-8").split("$")[0].rstrip()
+        # -1 when the entered text doesn't match a row
+        index = int(chosen_game.stdout.decode("UTF-8") or -1)
+        if(0 <= index < len(records)):
+            return records[index], _table
+    return None, _table
+
+
+def _search_game(cur, wishlist, game_name):
+    """Rofi window showing the games of the wishlist's platform matching the
+       name, searched for in every title seen rather than online. The last
+       row searches the site instead, for games that haven't been seen.
+
+    :param cur:       database cursor
+    :type cur:        Cursor
+    :param wishlist:  the wishlist being managed
+    :type wishlist:   str
+    :param game_name: the name to search for
+    :type game_name:  str
+    """
+    if(wishlist == WishlistOptions.PC.value):
+        platform, site = DB_Platforms.PC.value, PC
     else:
-        chosen_game = None
-    return chosen_game, _table
+        platform, site = DB_Platforms.PS.value, PS
+    games = DB_Calls.search_titles(cur, game_name, platform)
+    menu = Menu.render_results(games) + \
+        f"Search online for {game_name}\n".encode("UTF-8")
+    # Have rofi print the index of the chosen row rather than its text
+    chosen = subprocess.run(["/usr/bin/rofi", "-dmenu", "-p", f"{game_name}",
+                             "-lines", f"{min(len(games) + 1, 12)}",
+                             "-columns", "1", "-format", "i"],
+                            stdout=subprocess.PIPE, input=menu, shell=False)
+    if(not chosen.returncode == 0):
+        return
+    # -1 when the entered text doesn't match a row
+    index = int(chosen.stdout.decode("UTF-8") or -1)
+    if(0 <= index < len(games)):
+        url = games[index][DB_Search_Indices.URL.value]
+    elif(index == len(games)):
+        url = site.search_url(game_name)
+    else:
+        return
+    if(_confirmed(f"Open {url}")):
+        _open_url(url)
 
 
 def _get_input(prompt):
@@ -230,64 +252,3 @@ def _open_url(url):
     :type url: str
     """
     webbrowser.open_new_tab(url)
-
-
-def _form_pc_string(rofi_string, games, longest_title):
-    """Format the PC game deals into nice format for rendering with rofi.
-
-    :param rofi_string:   the string to become the list of games
-    :type rofi_string:    str
-    :param games:         the games to add to the string
-    :type games:          list
-    :param longest_title: the longest title in this collection of games
-    :type longest_title:  int
-    :return:              the string of games to render in the rofi window
-    :rtype:               str
-    """
-    for game in games:
-        rofi_string += (
-            f"{_stretch_string(game[DB_Indices.TITLE.value], longest_title)}"
-            + f" ${game[DB_Indices.SALE_PRICE.value]:.2f}\n")
-    return rofi_string
-
-
-def _form_ps_string(rofi_string, games, longest_title):
-    """Format the PC game deals into nice format for rendering with rofi.
-
-    :param rofi_string:   the string to become the list of games
-    :type rofi_string:    str
-    :param games:         the games to add to the string
-    :type games:          list
-    :param longest_title: the longest title in this collection of games
-    :type longest_title:  int
-    :return:              the string of games to render in the rofi window
-    :rtype:               str
-    """
-    for game in games:
-        if(game[DB_Indices.SALE_PRICE.value] == PS.ps_plus_price()):
-            rofi_string += (
-                f"""{_stretch_string(
-                    game[DB_Indices.TITLE.value], longest_title)}"""
-                + " $PS+")
-        else:
-            rofi_string += (
-                f"""{_stretch_string(
-                    game[DB_Indices.TITLE.value], longest_title)}"""
-                + f" ${game[DB_Indices.SALE_PRICE.value]:.2f}")
-        rofi_string += "\n"
-    return rofi_string
-
-
-def _stretch_string(string, length):
-    """Stretch the game title so that each game takes equal space.
-
-    :param string: the string to stretch
-    :type string:  str
-    :param length: the length that the string needs to be stretched to
-    :type length:  int
-    :return:       the stretched string
-    :rtype:        str
-    """
-    for _ in range(length-len(string)):
-        string += " "
-    return string
@@ -1,5 +1,5 @@
 #!/usr/bin/sh
 
 _dir="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
-_=$($_dir/main.py -s)
-echo ""
+$_dir/main.py -s > /dev/null
+echo " $($_dir/main.py --polybar)"